@@ -41,6 +41,13 @@
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 import logging
 import argparse
+import asyncio
+import copy
+import itertools
+import os
+import signal
+import types
+from concurrent import futures
 from time import sleep
 
 try:
@@ -48,11 +55,26 @@ try:
 except ImportError:
     from xml.etree import ElementTree as etree
 
-from netconf import server
-
-from yang2rest.yang2restconverter import Yang2RestConverter
-from yang2rest.restcaller import RestCaller
-from yang2rest.json2yang import Json2Yang
+from netconf import server, aioserver, util
+import netconf.error as ncerror
+from sshutil.prefork import PreforkSupervisor, session_id_base
+
+from yang2rest.yang2restconverter import Yang2RestConverter, YangUtil
+from yang2rest.json2yang import Json2Yang, IterativeJson2Yang
+from yang2rest.fospool import FortiOSAPIPool
+from yang2rest.restcache import RestResponseCache
+from yang2rest.plancache import TranslationPlanCache
+from yang2rest.pushdown import FilterPushDown
+from yang2rest.fanout import split_filter, fan_out
+from yang2rest.bulkedit import BulkEdit, plan_waves, split_config, ERROR_OPTIONS, STOP_ON_ERROR, \
+    ROLLBACK_ON_ERROR, APPLIED, FAILED, SKIPPED, ROLLBACK_FAILED
+from yang2rest.candidate import Candidate, CandidateError
+from yang2rest.tablediff import TableDiff, TableDiffError, TableDiffStats
+from yang2rest.mirror import ConfigMirror, pop_live
+from yang2rest.snapshot import MirrorSnapshot
+from yang2rest.revision import RevisionProbe, DEFAULT_REVISION_URL
+from yang2rest.fleet import DeviceInventory, DeviceAccessError, DeviceBusyError, \
+    UnknownDeviceError, load_inventory_file, pop_target
 
 from fortiosapi import FortiOSAPI
 
@@ -72,16 +94,66 @@ __status__ = "Development"
 # **********************************
 
 netconf_server = None  # pylint: disable=C0103
+fortigates = None  # pylint: disable=C0103
+fanout_executor = None  # pylint: disable=C0103
+translation_plans = TranslationPlanCache()  # pylint: disable=C0103
+table_diffs = TableDiffStats()  # pylint: disable=C0103
 
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
 NC_PORT = 830
 NC_USER = ''
 NC_PASSWORD = ''
+NC_RPC_WORKERS = 16
+NC_MAX_INFLIGHT_RPCS = 8
+NC_HANDSHAKE_WORKERS = 8
+NC_ASYNCIO = False
+# Processes serving NC_PORT (SO_REUSEPORT), each with its own FortiGate sessions
+NC_WORKERS = 1
 
 FGT_HOST='192.168.122.40'
 FGT_USER=''
 FGT_PASSWORD=''
+FGT_POOL_SIZE = 4
+FGT_KEEPALIVE = 60
+# Json inventory of the FortiGates served (see yang2rest/fleet.py),
+# if None only FGT_HOST is served. Reloaded on SIGHUP.
+FGT_INVENTORY = None
+# Seconds a Netconf RPC waits when max_rpcs are running against its FortiGate
+FGT_BUSY_TIMEOUT = 10
+# Tables are read and answered in pages of this many entries, 0 reads them at once
+FGT_PAGE_SIZE = 1000
+# Threads reading concurrently the tables of filters that select several ones,
+# or modifying the objects of an edit-config
+FGT_FANOUT_WORKERS = 16
+# Objects of an edit-config modified at the same time
+FGT_EDIT_WINDOW = 8
+# error-option of the commit of the candidate datastore
+FGT_COMMIT_ERROR_OPTION = ROLLBACK_ON_ERROR
+
+# Seconds a REST answer is reused, per url prefix (longest prefix wins).
+# Urls not listed are never cached.
+CACHE_TTLS = {'cmdb/': 5,
+              'monitor/': 1}
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Seconds a get-config may be answered from the local mirror of the cmdb
+# tables, 0 disables the mirror. Tables read recently are refreshed every
+# MIRROR_REFRESH_INTERVAL seconds and forgotten when not read for
+# MIRROR_IDLE_TIMEOUT seconds.
+MIRROR_MAX_STALENESS = 30
+MIRROR_REFRESH_INTERVAL = 10
+MIRROR_IDLE_TIMEOUT = 600
+# Directory of the mirror snapshots (one file per FortiGate), loaded at startup
+# and written every MIRROR_SNAPSHOT_INTERVAL seconds and on exit. None disables
+# them, snapshots older than MIRROR_SNAPSHOT_MAX_AGE seconds are ignored.
+MIRROR_SNAPSHOT_DIR = None
+MIRROR_SNAPSHOT_INTERVAL = 300
+MIRROR_SNAPSHOT_MAX_AGE = 3600
+# Monitor call answering the configuration revision, mirrored tables are only
+# read again when it changes (overridden by revision_url in the inventory, ""
+# always reads them again).
+MIRROR_REVISION_URL = DEFAULT_REVISION_URL
 
 SERVER_DEBUG = False
 
@@ -95,9 +167,13 @@ class NetconfMethods(server.NetconfMethods):
 
     def nc_append_capabilities(self, capabilities_answered):
         capability_list = ["urn:ietf:params:netconf:capability:writable - running:1.0",
+                           "urn:ietf:params:netconf:capability:candidate:1.0",
                            "urn:ietf:params:netconf:capability:interleave:1.0",
                            "urn:ietf:params:netconf:capability:notification:1.0",
-                           "urn:ietf:params:netconf:capability:validate:1.0"]
+                           "urn:ietf:params:netconf:capability:validate:1.0",
+                           "urn:ietf:params:netconf:capability:rollback-on-error:1.0"]
+        if NC_WORKERS > 1:
+            capability_list.remove("urn:ietf:params:netconf:capability:candidate:1.0")
 
         for cap in capability_list:
             elem = etree.Element("capability")
@@ -105,7 +181,180 @@ class NetconfMethods(server.NetconfMethods):
             capabilities_answered.append(elem)
         return
 
-    def rpc_get(self, unused_session, rpc, *unused_params):
+    @staticmethod
+    def _device(session, rpc, target):
+        # FortiGate the request is for: <target> in the filter/config,
+        # netconf@<device> SSH subsystem or Netconf username
+        try:
+            return fortigates.route(username=getattr(session, 'username', None),
+                                    target=target,
+                                    subsystem=getattr(session, 'subsystem', None))
+        except UnknownDeviceError as error:
+            raise ncerror.RPCSvrInvalidValue(rpc, message=str(error))
+        except DeviceAccessError as error:
+            raise ncerror.RPCServerError(rpc, ncerror.RPCERR_TYPE_APPLICATION,
+                                         ncerror.RPCERR_TAG_ACCESS_DENIED, message=str(error))
+
+    @staticmethod
+    def _check_candidate(rpc):
+        # The candidate is kept in memory by each worker process, sessions
+        # of different workers would not see the same one
+        if NC_WORKERS > 1:
+            raise ncerror.RPCServerError(rpc, ncerror.RPCERR_TYPE_PROTOCOL,
+                                         ncerror.RPCERR_TAG_OPERATION_NOT_SUPPORTED,
+                                         message="No candidate datastore with several workers")
+
+    @staticmethod
+    def _acquire(device, rpc):
+        # The slot is released once the REST calls are done, tables streamed
+        # page by page are then only bound by the FortiGate session pool.
+        try:
+            device.acquire(FGT_BUSY_TIMEOUT)
+        except DeviceBusyError as error:
+            raise ncerror.RPCServerError(rpc, ncerror.RPCERR_TYPE_APPLICATION,
+                                         ncerror.RPCERR_TAG_RESOURCE_DENIED, message=str(error))
+
+    @staticmethod
+    def _statistics():
+        # Internal counters, answered for a <get> with a <statistics/> filter
+        return {'fortigates': fortigates.stats(),
+                'translation-plans': translation_plans.stats(),
+                'table-replaces': table_diffs.stats()}
+
+    def _read(self, device, operation, url, content, pushdown):
+        """Executes a get/get-config REST call
+
+        Tables larger than a page are answered with a generator of converted
+        entries, fetched page by page while the reply is being sent.
+        """
+        rc = device.rest_caller()
+        if not FGT_PAGE_SIZE or operation is not None or not url.startswith('cmdb/'):
+            return rc.execute_rest_call(operation, url, content, pushdown)
+
+        pages = rc.iter_rest_pages(url, FGT_PAGE_SIZE, pushdown)
+        http_result, http_content = next(pages)
+        if http_result != 200 or not isinstance(http_content, list) or len(http_content) < FGT_PAGE_SIZE:
+            return http_result, http_content
+
+        return http_result, self._holding(device, self._stream_pages(
+            itertools.chain([(http_result, http_content)], pages), pushdown))
+
+    @staticmethod
+    def _holding(device, elements):
+        # The device is kept open while the pages are read, even if it is
+        # replaced by a reload (see fleet.Device.hold)
+        def held():
+            device.hold()
+            try:
+                yield None
+                for elem in elements:
+                    yield elem
+            finally:
+                device.unhold()
+        generator = held()
+        # Held now, released once the reply is sent or the generator dropped
+        next(generator)
+        return generator
+
+    def _read_entries(self, device, url, live=False):
+        # Whole answer of a cmdb url, from the config mirror if possible
+        if device.mirror is not None and device.mirror.is_mirrored(url):
+            return device.mirror.get(url, 0 if live else None)
+        entries = []
+        for http_result, http_content in device.rest_caller().iter_rest_pages(url, FGT_PAGE_SIZE or 1000):
+            if http_result == 404:
+                # Objects only in the candidate
+                break
+            if http_result != 200:
+                raise Exception('http-result:' + str(http_result) + ', ' + str(http_content))
+            if not isinstance(http_content, list):
+                return http_content
+            entries.extend(http_content)
+        return entries
+
+    def _read_config(self, device, operation, url, content, pushdown, selection, live=False,
+                     candidate=None):
+        """Same as _read for a get-config, answered from the config mirror if possible
+
+        Tables from the mirror, filtered locally, are answered with a generator
+        of converted entries. With a candidate (Candidate) the objects changed
+        there are answered as they are in the candidate.
+        """
+        if candidate is not None and operation is None and candidate.touches(url):
+            entries = self._read_entries(device, url, live)
+            if isinstance(entries, list):
+                entries = candidate.overlay(url, entries)
+            return 200, self._stream_pages([(200, entries)], FilterPushDown(selection, url, local=True))
+
+        if device.mirror is None or operation is not None or not device.mirror.is_mirrored(url):
+            return self._read(device, operation, url, content, pushdown)
+
+        nodes = device.mirror.nodes(url, 0 if live else None)
+        return 200, self._stream_nodes(nodes, FilterPushDown(selection, url, local=True))
+
+    def _read_subtree(self, device, netconf_data, config=False, live=False, candidate=None):
+        """Reads and converts the single table selected by a filter subtree
+
+        Run in the fan-out threads, all the pages are read there.
+        """
+        y2rc = Yang2RestConverter(plan_cache=translation_plans)
+
+        (url, content, operation, selection) = y2rc.extract_url_content_operation_selection(netconf_data)
+        pushdown = FilterPushDown(selection, url)
+
+        logger.info("URL: %s, Parameters: %s", url, format(pushdown.parameters))
+
+        if config:
+            http_result, http_content = self._read_config(device, operation, url, content, pushdown,
+                                                          selection, live, candidate)
+        else:
+            http_result, http_content = self._read(device, operation, url, content, pushdown)
+        if http_result != 200:
+            raise Exception('http-result:' + str(http_result) + ', ' + str(http_content))
+        if isinstance(http_content, types.GeneratorType):
+            return list(http_content)
+        if not http_content:
+            return None
+        return pushdown.filter_locally(IterativeJson2Yang().convert_structure(http_content))
+
+    def _read_subtrees(self, device, rpc, subtrees, config=False, live=False, candidate=None):
+        # One REST call per table, concurrently, answers nested under their containers
+        # in a single <data>
+        logger.info("Reading %d tables", len(subtrees))
+
+        self._acquire(device, rpc)
+        try:
+            data = util.elm("data")
+            data.extend(fan_out(fanout_executor,
+                                lambda x: self._read_subtree(device, x, config, live, candidate),
+                                subtrees))
+            return data
+        finally:
+            device.release()
+
+    @staticmethod
+    def _stream_pages(pages, pushdown):
+        j2y = IterativeJson2Yang()
+        for http_result, http_content in pages:
+            if http_result != 200:
+                raise Exception('http-result:' + str(http_result) + ', ' + str(http_content))
+            for elem in pushdown.filter_locally(j2y.convert_structure(http_content)):
+                yield elem
+
+    @staticmethod
+    def _stream_nodes(nodes, pushdown):
+        # Converted entries kept by the mirror, only copies leave it
+        size = FGT_PAGE_SIZE or max(len(nodes), 1)
+        for i in range(0, len(nodes), size):
+            page = nodes[i:i + size]
+            if pushdown.needs_local_filter:
+                page = pushdown.filter_locally(page)
+            else:
+                page = [copy.deepcopy(x) for x in page]
+            for elem in page:
+                yield elem
+
+    def rpc_get(self, session, rpc, *unused_params):
         logger.info("rpc_get")
 
         logger.debug("RPC received:%s", format(etree.tostring(rpc, pretty_print=True)))
@@ -113,39 +362,50 @@ class NetconfMethods(server.NetconfMethods):
         # Locate object
         ns = {"nc": "urn:ietf:params:xml:ns:netconf:base:1.0"}
 
+        netconf_filter = rpc.find("nc:get/nc:filter", ns)
+        target = pop_target(netconf_filter)
         netconf_data = rpc.find("nc:get/nc:filter/", ns)
 
         if netconf_data is None:
             raise Exception("Not able to find filter tag")
 
-        y2rc = Yang2RestConverter()
+        if YangUtil.remove_urn(netconf_data.tag) == "statistics":
+            return Json2Yang().convert_structure(self._statistics())
+
+        device = self._device(session, rpc, target)
 
-        (url, content, operation) = y2rc.extract_url_content_operation(netconf_data)
+        subtrees = split_filter(netconf_filter)
+        if len(subtrees) > 1:
+            return self._read_subtrees(device, rpc, subtrees)
+
+        y2rc = Yang2RestConverter(plan_cache=translation_plans)
+
+        (url, content, operation, selection) = y2rc.extract_url_content_operation_selection(netconf_data)
+        pushdown = FilterPushDown(selection, url)
 
         logger.info("URL: %s", format(url))
         logger.info("Content: %s", format(content))
         logger.info("Operation: %s", format(operation))
+        logger.info("Parameters: %s", format(pushdown.parameters))
 
-        fosapi = FortiOSAPI()
-        fosapi.https('off')
-        fosapi.login(FGT_HOST, FGT_USER, FGT_PASSWORD)
-
-        rc = RestCaller()
-        rc.set_fos(fosapi)
-        http_result, http_content = rc.execute_rest_call(operation, url, content)
-
-        fosapi.logout()
+        self._acquire(device, rpc)
+        try:
+            http_result, http_content = self._read(device, operation, url, content, pushdown)
+        finally:
+            device.release()
 
         if http_result == 200 or 'success':
             if not http_content or http_content is None:
                 return etree.Element('ok')
+            elif isinstance(http_content, types.GeneratorType):
+                return http_content
             else:
-                j2y = Json2Yang()
-                return j2y.convert_json(str(http_content).replace("'", '"'))
+                j2y = IterativeJson2Yang()
+                return pushdown.filter_locally(j2y.convert_structure(http_content))
         else:
             raise Exception('http-result:' + str(http_result) + ', ' + http_content)
 
-    def rpc_get_config(self, unused_session, rpc, *unused_params):
+    def rpc_get_config(self, session, rpc, *unused_params):
         logger.info("rpc_get_config")
 
         logger.debug("RPC received:%s", format(etree.tostring(rpc, pretty_print=True)))
@@ -153,36 +413,52 @@ class NetconfMethods(server.NetconfMethods):
         # Locate object
         ns = {"nc": "urn:ietf:params:xml:ns:netconf:base:1.0"}
 
+        netconf_filter = rpc.find("nc:get-config/nc:filter", ns)
+        target = pop_target(netconf_filter)
+        live = pop_live(netconf_filter)
         netconf_data = rpc.find("nc:get-config/nc:filter/", ns)
 
         if netconf_data is None:
             raise Exception("Not able to find filter tag")
 
-        y2rc = Yang2RestConverter()
+        device = self._device(session, rpc, target)
+
+        candidate = None
+        if rpc.find("nc:get-config/nc:source/nc:candidate", ns) is not None:
+            self._check_candidate(rpc)
+            if len(device.candidate):
+                candidate = device.candidate
 
-        (url, content, operation) = y2rc.extract_url_content_operation(netconf_data)
+        subtrees = split_filter(netconf_filter)
+        if len(subtrees) > 1:
+            return self._read_subtrees(device, rpc, subtrees, config=True, live=live, candidate=candidate)
+
+        y2rc = Yang2RestConverter(plan_cache=translation_plans)
+
+        (url, content, operation, selection) = y2rc.extract_url_content_operation_selection(netconf_data)
+        pushdown = FilterPushDown(selection, url)
 
         logger.info("URL: %s", format(url))
         logger.info("Content: %s", format(content))
         logger.info("Operation: %s", format(operation))
+        logger.info("Parameters: %s", format(pushdown.parameters))
 
-        fosapi = FortiOSAPI()
-        fosapi.https('off')
-        fosapi.login(FGT_HOST, FGT_USER, FGT_PASSWORD)
-
-        rc = RestCaller()
-        rc.set_fos(fosapi)
-        http_result, http_content = rc.execute_rest_call(operation, url, content)
-
-        fosapi.logout()
+        self._acquire(device, rpc)
+        try:
+            http_result, http_content = self._read_config(device, operation, url, content, pushdown,
+                                                          selection, live, candidate)
+        finally:
+            device.release()
 
         if http_result == 200:
-            j2y = Json2Yang()
-            return j2y.convert_json(str(http_content).replace("'", '"'))
+            if isinstance(http_content, types.GeneratorType):
+                return http_content
+            j2y = IterativeJson2Yang()
+            return pushdown.filter_locally(j2y.convert_structure(http_content))
         else:
             raise Exception('http-result:' + str(http_result) + ', ' + http_content)
 
-    def rpc_edit_config(self, unused_session, rpc, *unused_params):
+    def rpc_edit_config(self, session, rpc, *unused_params):
         logger.info("rpc_edit_config")
 
         logger.debug("RPC received:%s", format(etree.tostring(rpc, pretty_print=True)))
@@ -190,9 +466,34 @@ class NetconfMethods(server.NetconfMethods):
         # #Locate object
         ns = {"nc": "urn:ietf:params:xml:ns:netconf:base:1.0"}
 
+        nc_config = rpc.find("nc:edit-config/nc:config", ns)
+        target = pop_target(nc_config)
         netconf_data = rpc.find("nc:edit-config/nc:config/", ns)
-
-        yrc = Yang2RestConverter()
+        device = self._device(session, rpc, target)
+        to_candidate = rpc.find("nc:edit-config/nc:target/nc:candidate", ns) is not None
+        if to_candidate:
+            self._check_candidate(rpc)
+
+        yrc = Yang2RestConverter(plan_cache=translation_plans)
+
+        error_option = rpc.findtext("nc:edit-config/nc:error-option", STOP_ON_ERROR, ns).strip()
+        if error_option not in ERROR_OPTIONS:
+            raise ncerror.RPCSvrInvalidValue(rpc, message="Unknown error-option " + error_option)
+
+        objects = []
+        if nc_config is not None:
+            for child in nc_config:
+                if isinstance(child.tag, str):
+                    objects.extend(split_config(child, yrc))
+        tables = any(obj.entries is not None for obj in objects)
+        if tables:
+            objects = self._diff_tables(device, rpc, objects, device.candidate if to_candidate else None)
+        if to_candidate:
+            if not objects and not tables:
+                raise ncerror.RPCSvrInvalidValue(rpc, message="No object with an operation in the config")
+            return self._edit_candidate(device, rpc, objects)
+        if len(objects) > 1 or tables:
+            return self._edit_objects(device, rpc, objects, error_option)
 
         (url, content, operation) = yrc.extract_url_content_operation(netconf_data)
 
@@ -200,31 +501,268 @@ class NetconfMethods(server.NetconfMethods):
         logger.info("Content: %s", format(content))
         logger.info("Operation: %s", format(operation))
 
-        fosapi = FortiOSAPI()
-        fosapi.https('off')
-        fosapi.login(FGT_HOST, FGT_USER, FGT_PASSWORD)
-
-        rc = RestCaller()
-        rc.set_fos(fosapi)
-        http_result, status = rc.execute_rest_call(operation, url, content)
-
-        fosapi.logout()
+        self._acquire(device, rpc)
+        try:
+            http_result, status = device.rest_caller().execute_rest_call(operation, url, content)
+            if http_result == 200:
+                self._update_mirror(device, objects)
+        finally:
+            device.release()
 
         if http_result == 200:
             return etree.Element("ok")
         else:
             raise Exception('http-result:' + str(http_result) + ', ' + status)
 
+    @staticmethod
+    def _edit_errors(rpc, objects):
+        # One rpc-error per object not modified, or not restored
+        error = None
+        for obj in objects:
+            if obj.state == FAILED:
+                tag = ncerror.RPCERR_TAG_OPERATION_FAILED
+            elif obj.state == ROLLBACK_FAILED:
+                tag = ncerror.RPCERR_TAG_ROLLBACK_FAILED
+            else:
+                continue
+            obj_error = ncerror.RPCServerError(rpc, ncerror.RPCERR_TYPE_APPLICATION, tag,
+                                               path=obj.path, message=obj.error)
+            if error is None:
+                error = obj_error
+            else:
+                error.reply.append(obj_error.reply[0])
+        return error
+
+    def _diff_tables(self, device, rpc, objects, candidate=None):
+        # Whole tables are replaced by the calls changing their entries only,
+        # compared with the candidate (Candidate) if edited there
+        diffed = []
+        self._acquire(device, rpc)
+        try:
+            for obj in objects:
+                if obj.entries is None:
+                    diffed.append(obj)
+                    continue
+                entries = self._read_entries(device, obj.url)
+                if candidate is not None and isinstance(entries, list):
+                    entries = candidate.overlay(obj.url, entries)
+                try:
+                    diff = TableDiff(obj, entries)
+                except TableDiffError as error:
+                    raise ncerror.RPCSvrInvalidValue(rpc, message=str(error))
+                logger.info("%s", str(diff))
+                table_diffs.add(diff)
+                diffed.extend(diff.objects())
+        finally:
+            device.release()
+        return diffed
+
+    @staticmethod
+    def _candidate_errors(rpc, errors):
+        # One rpc-error per CandidateError
+        error = None
+        for candidate_error in errors:
+            rpc_error = ncerror.RPCServerError(rpc, ncerror.RPCERR_TYPE_APPLICATION, candidate_error.tag,
+                                               path=candidate_error.path, message=str(candidate_error))
+            if error is None:
+                error = rpc_error
+            else:
+                error.reply.append(rpc_error.reply[0])
+        return error
+
+    def _edit_candidate(self, device, rpc, objects):
+        # Kept in the candidate until committed
+        try:
+            device.candidate.edit(objects)
+        except CandidateError as error:
+            raise self._candidate_errors(rpc, [error])
+        logger.info("%d objects edited in the candidate, %d pending", len(objects), len(device.candidate))
+        return etree.Element("ok")
+
+    def _candidate_device(self, session, rpc, operation):
+        # Device whose candidate is validated, committed or discarded: a
+        # <target> in the operation element (<commit><target>fw2</target>
+        # </commit>), else routed as any other request
+        ns = {"nc": "urn:ietf:params:xml:ns:netconf:base:1.0"}
+        return self._device(session, rpc, pop_target(rpc.find("nc:" + operation, ns)))
+
+    def rpc_validate(self, session, rpc, *unused_params):
+        logger.info("rpc_validate")
+
+        ns = {"nc": "urn:ietf:params:xml:ns:netconf:base:1.0"}
+
+        nc_config = rpc.find("nc:validate/nc:source/nc:config", ns)
+        if nc_config is not None:
+            # Validated as if edited in an empty candidate
+            target = pop_target(nc_config)
+            if target is None:
+                self._candidate_device(session, rpc, "validate")
+            else:
+                self._device(session, rpc, target)
+            yrc = Yang2RestConverter(plan_cache=translation_plans)
+            candidate = Candidate()
+            try:
+                candidate.edit([obj for child in nc_config if isinstance(child.tag, str)
+                                for obj in split_config(child, yrc)])
+            except CandidateError as error:
+                raise self._candidate_errors(rpc, [error])
+            changes = candidate.changes()
+        elif rpc.find("nc:validate/nc:source/nc:candidate", ns) is not None:
+            self._check_candidate(rpc)
+            changes = self._candidate_device(session, rpc, "validate").candidate.changes()
+        else:
+            # running is validated by FortiGate
+            changes = []
+
+        errors = Candidate.validate(changes)
+        if errors:
+            raise self._candidate_errors(rpc, errors)
+        return etree.Element("ok")
+
+    def rpc_commit(self, session, rpc, *unused_params):
+        logger.info("rpc_commit")
+
+        self._check_candidate(rpc)
+        device = self._candidate_device(session, rpc, "commit")
+        with device.candidate.committing() as changes:
+            if not changes:
+                return etree.Element("ok")
+            errors = Candidate.validate(changes)
+            if errors:
+                raise self._candidate_errors(rpc, errors)
+
+            waves = Candidate.plan(changes)
+            objects = [obj for wave in waves for obj in wave]
+            logger.info("Committing %d objects in %d waves", len(objects), len(waves))
+
+            bulk = BulkEdit(device.rest_caller(), fanout_executor, FGT_EDIT_WINDOW, FGT_COMMIT_ERROR_OPTION)
+            self._acquire(device, rpc)
+            try:
+                applied = bulk.run_waves(waves)
+                self._update_mirror(device, objects)
+            finally:
+                device.release()
+
+            if applied:
+                device.candidate.committed()
+                return etree.Element("ok")
+        # The candidate is kept, to be fixed and committed again
+        raise self._edit_errors(rpc, objects)
+
+    def rpc_discard_changes(self, session, rpc, *unused_params):
+        logger.info("rpc_discard_changes")
+
+        self._check_candidate(rpc)
+        self._candidate_device(session, rpc, "discard-changes").candidate.discard()
+        return etree.Element("ok")
+
+    @staticmethod
+    def _update_mirror(device, objects):
+        # A single object is updated in place in the mirror, the tables
+        # modified by bulk edits are read again when next requested.
+        if device.mirror is None:
+            return
+        if len(objects) == 1 and objects[0].state in (None, APPLIED):
+            obj = objects[0]
+            device.mirror.update(obj.operation, obj.url, obj.mkey, obj.mkey_value)
+            return
+        for obj in objects:
+            if obj.state not in (FAILED, SKIPPED):
+                device.mirror.invalidate(obj.url)
+
+    def _edit_objects(self, device, rpc, objects, error_option):
+        waves = plan_waves(objects)
+        logger.info("Modifying %d objects in %d waves, %s", len(objects), len(waves), error_option)
+
+        bulk = BulkEdit(device.rest_caller(), fanout_executor, FGT_EDIT_WINDOW, error_option)
+        self._acquire(device, rpc)
+        try:
+            applied = bulk.run_waves(waves)
+            self._update_mirror(device, objects)
+        finally:
+            device.release()
+
+        if applied:
+            return etree.Element("ok")
+        raise self._edit_errors(rpc, objects)
+
     def rpc_create_subscription(self, unused_session, rpc, *unused_params):
         return etree.Element("ok")
 
 
+# **********************************
+# Setup FortiGate sessions
+# **********************************
+
+def setup_fortigates():
+    "Load the inventory of FortiGates, each with its own REST session pool and cache"
+
+    global fortigates, fanout_executor  # pylint: disable=C0103
+
+    if fortigates is not None:
+        logger.error("FortiGate inventory is already loaded")
+    else:
+        fortigates = DeviceInventory(load_fortigates, new_fortigate_pool, new_response_cache,
+                                     new_config_mirror)
+        fanout_executor = futures.ThreadPoolExecutor(max_workers=FGT_FANOUT_WORKERS)
+
+
+def reload_fortigates(unused_signum=None, unused_frame=None):
+    "Reload the inventory of FortiGates, on SIGHUP"
+
+    try:
+        fortigates.reload()
+    except Exception as error:
+        logger.error("FortiGate inventory not reloaded: %s", str(error))
+
+
+def load_fortigates():
+    if FGT_INVENTORY:
+        return load_inventory_file(FGT_INVENTORY)
+
+    return {'default': 'default',
+            'devices': {'default': {'host': FGT_HOST,
+                                    'username': FGT_USER,
+                                    'password': FGT_PASSWORD}}}
+
+
+def new_fortigate_pool(config):
+    return FortiOSAPIPool(FortiOSAPI, config['host'], config.get('username', ''),
+                          config.get('password', ''),
+                          size=config.get('pool_size', FGT_POOL_SIZE),
+                          https=config.get('https', False),
+                          keepalive=FGT_KEEPALIVE)
+
+
+def new_response_cache(unused_config):
+    return RestResponseCache(CACHE_TTLS, max_bytes=CACHE_MAX_BYTES)
+
+
+def new_config_mirror(device):
+    if MIRROR_MAX_STALENESS <= 0:
+        return None
+    snapshot = None
+    if MIRROR_SNAPSHOT_DIR:
+        snapshot = MirrorSnapshot(os.path.join(MIRROR_SNAPSHOT_DIR, device.name.replace(os.sep, '_') + ".snap"),
+                                  device.name, device.config.get('host'))
+    revision_probe = None
+    revision_url = device.config.get('revision_url', MIRROR_REVISION_URL)
+    if revision_url:
+        revision_probe = RevisionProbe(device.rest_caller, revision_url)
+    return ConfigMirror(device.rest_caller, max_staleness=MIRROR_MAX_STALENESS,
+                        refresh_interval=MIRROR_REFRESH_INTERVAL, idle_timeout=MIRROR_IDLE_TIMEOUT,
+                        page_size=FGT_PAGE_SIZE or 1000, snapshot=snapshot,
+                        snapshot_interval=MIRROR_SNAPSHOT_INTERVAL,
+                        snapshot_max_age=MIRROR_SNAPSHOT_MAX_AGE,
+                        revision_probe=revision_probe)
+
+
 # **********************************
 # Setup Netconf
 # **********************************
 
-def setup_netconf():
-    "Configure Netconf server listener"
+def setup_netconf(worker_index=0, workers=1, generation=0):
+    "Configure Netconf server listener, worker_index of workers sharing NC_PORT"
 
     global netconf_server  # pylint: disable=C0103
 
@@ -233,11 +771,59 @@ def setup_netconf():
     else:
         server_ctl = server.SSHUserPassController(username=NC_USER,
                                                   password=NC_PASSWORD)
+        first_session_id = session_id_base(worker_index, workers, generation)
+        if NC_ASYNCIO:
+            # Sessions are coroutines, RPCs still run in NC_RPC_WORKERS threads.
+            netconf_server = aioserver.AsyncNetconfSSHServer(server_ctl=server_ctl,
+                                                             server_methods=NetconfMethods(),
+                                                             port=NC_PORT,
+                                                             host_key="keys/host_key",
+                                                             debug=SERVER_DEBUG,
+                                                             rpc_workers=max(NC_RPC_WORKERS, 1),
+                                                             max_inflight_rpcs=NC_MAX_INFLIGHT_RPCS,
+                                                             reuse_port=workers > 1,
+                                                             session_id_base=first_session_id,
+                                                             session_id_stride=workers)
+            asyncio.get_event_loop().run_until_complete(netconf_server.start())
+            return
         netconf_server = server.NetconfSSHServer(server_ctl=server_ctl,
                                                  server_methods=NetconfMethods(),
                                                  port=NC_PORT,
                                                  host_key="keys/host_key",
-                                                 debug=SERVER_DEBUG)
+                                                 debug=SERVER_DEBUG,
+                                                 rpc_workers=NC_RPC_WORKERS,
+                                                 max_inflight_rpcs=NC_MAX_INFLIGHT_RPCS,
+                                                 handshake_workers=NC_HANDSHAKE_WORKERS,
+                                                 reuse_port=workers > 1,
+                                                 session_id_base=first_session_id,
+                                                 session_id_stride=workers)
+
+
+def stop_netconf(unused_signum=None, unused_frame=None):
+    "Close the FortiGate sessions, writing the mirror snapshots, and exit, on SIGTERM/SIGINT"
+
+    logger.info("Stopping")
+    fortigates.close()
+    sys.exit(0)
+
+
+def serve_netconf(worker_index=0, workers=1, unused_port=None, generation=0):
+    "Serve Netconf requests, in a worker process when workers > 1"
+
+    setup_fortigates()
+    setup_netconf(worker_index, workers, generation)
+    signal.signal(signal.SIGHUP, reload_fortigates)
+    signal.signal(signal.SIGTERM, stop_netconf)
+    signal.signal(signal.SIGINT, stop_netconf)
+
+    # Start the loop for Netconf
+    logger.info("Listening Netconf")
+
+    if NC_ASYNCIO:
+        asyncio.get_event_loop().run_forever()
+
+    while True:
+        sleep(5)
 
 
 # **********************************
@@ -248,8 +834,43 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Netconf Server")
     parser.add_argument("-d", "--debug", action="store_true", help="Activate debug logs")
+    parser.add_argument("--pool-size", type=int, default=FGT_POOL_SIZE,
+                        help="Number of FortiGate REST sessions kept open")
+    parser.add_argument("--inventory", default=FGT_INVENTORY,
+                        help="Json inventory of the FortiGates served, reloaded on SIGHUP")
+    parser.add_argument("--rpc-workers", type=int, default=NC_RPC_WORKERS,
+                        help="Number of threads running Netconf RPCs, 0 runs them in the session thread")
+    parser.add_argument("--max-inflight-rpcs", type=int, default=NC_MAX_INFLIGHT_RPCS,
+                        help="Maximum number of RPCs in progress per Netconf session")
+    parser.add_argument("--handshake-workers", type=int, default=NC_HANDSHAKE_WORKERS,
+                        help="Number of threads doing the SSH handshake of new Netconf connections")
+    parser.add_argument("--workers", type=int, default=NC_WORKERS,
+                        help="Number of processes serving Netconf, each with its own FortiGate sessions")
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Serve Netconf sessions from an asyncio event loop (requires asyncssh)")
+    parser.add_argument("--page-size", type=int, default=FGT_PAGE_SIZE,
+                        help="Entries per page when reading FortiGate tables, 0 reads them at once")
+    parser.add_argument("--max-staleness", type=int, default=MIRROR_MAX_STALENESS,
+                        help="Seconds a get-config may be answered from the local config mirror, 0 disables it")
+    parser.add_argument("--snapshot-dir", default=MIRROR_SNAPSHOT_DIR,
+                        help="Directory where the config mirror is saved, to answer from it after a restart")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always query FortiGate, do not reuse previous answers")
     args = parser.parse_args()
 
+    if args.no_cache:
+        CACHE_TTLS = {}
+    FGT_POOL_SIZE = args.pool_size
+    FGT_PAGE_SIZE = args.page_size
+    FGT_INVENTORY = args.inventory
+    MIRROR_MAX_STALENESS = args.max_staleness
+    MIRROR_SNAPSHOT_DIR = args.snapshot_dir
+    NC_RPC_WORKERS = args.rpc_workers
+    NC_MAX_INFLIGHT_RPCS = args.max_inflight_rpcs
+    NC_HANDSHAKE_WORKERS = args.handshake_workers
+    NC_ASYNCIO = args.asyncio
+    NC_WORKERS = args.workers
+
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
     else:
@@ -258,10 +879,7 @@ if __name__ == "__main__":
     SERVER_DEBUG = logger.getEffectiveLevel() == logging.DEBUG
     logger.info("SERVER_DEBUG:" + str(SERVER_DEBUG))
 
-    setup_netconf()
-
-    # Start the loop for Netconf
-    logger.info("Listening Netconf")
-
-    while True:
-        sleep(5)
+    if NC_WORKERS > 1:
+        PreforkSupervisor(serve_netconf, NC_WORKERS, NC_PORT, debug=SERVER_DEBUG).run()
+    else:
+        serve_netconf()
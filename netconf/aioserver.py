@@ -0,0 +1,500 @@
+# -*- coding: utf-8 eval: (yapf-mode 1) -*-
+#
+# Copyright (c) 2015, Deutsche Telekom AG
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Netconf server running on an asyncio event loop
+
+Every session is a coroutine instead of a reader thread (plus the threads of
+the SSH transport), so idle sessions only cost memory. The server methods
+follow the same contract as for netconf.server.NetconfSSHServer; an rpc_X
+method may also be a coroutine function, it is then awaited on the event
+loop, while plain methods run in a thread pool shared by all sessions.
+
+Requires asyncssh (Python 3.6+).
+"""
+import asyncio
+import functools
+import logging
+from concurrent import futures
+import paramiko as ssh
+from lxml import etree
+
+from netconf import base
+import netconf.error as ncerror
+from netconf import NSMAP, MAXSSHBUF, qmap
+from netconf import server as ncserver
+from netconf import util as ncutil
+from sshutil.server import SSHUserPassController
+
+try:
+    import asyncssh
+    have_asyncssh = True
+except ImportError:
+    have_asyncssh = False
+
+logger = logging.getLogger(__name__)
+
+# Largest chunk length header "\n#4294967295\n"
+MAX_CHUNK_HEADER = 13
+
+
+class AsyncFramingTransport(object):
+    """Netconf framing over the streams of an asyncssh channel
+
+    Received PDUs are fed to an XML parser as they arrive, as done by
+    base.NetconfFramingTransport.receive_pdu_tree.
+    """
+
+    def __init__(self, reader, writer, max_chunk):
+        self.reader = reader
+        self.writer = writer
+        self.max_chunk = max_chunk
+        self.rbuffer = bytearray()
+
+    async def _fill(self):
+        data = await self.reader.read(self.max_chunk)
+        if not data:
+            raise ncerror.ChannelClosed(self)
+        self.rbuffer += data
+
+    async def receive_pdu_tree(self, new_framing):
+        parser = base.NetconfMessageParser()
+        if new_framing:
+            await self._receive_11(parser.feed)
+        else:
+            await self._receive_10(parser.feed)
+        return parser.close()
+
+    async def _receive_10(self, feed):
+        rbuffer = self.rbuffer
+        while True:
+            eomidx = rbuffer.find(b"]]>]]>")
+            if eomidx != -1:
+                break
+            # Keep what could be the start of the end marker.
+            if len(rbuffer) > 5:
+                feed(bytes(rbuffer[:-5]))
+                del rbuffer[:-5]
+            await self._fill()
+        feed(bytes(rbuffer[:eomidx]))
+        del rbuffer[:eomidx + 6]
+
+    async def _receive_11(self, feed):
+        rbuffer = self.rbuffer
+        while True:
+            while len(rbuffer) < 4:
+                await self._fill()
+            if rbuffer[:2] != b"\n#":
+                raise ncerror.FramingError(bytes(rbuffer[:4]))
+            if rbuffer[2:4] == b"#\n":
+                del rbuffer[:4]
+                return
+
+            while True:
+                idx = rbuffer.find(b"\n", 2)
+                if idx != -1:
+                    break
+                if len(rbuffer) >= MAX_CHUNK_HEADER:
+                    raise ncerror.FramingError(bytes(rbuffer[:MAX_CHUNK_HEADER]))
+                await self._fill()
+            try:
+                chunklen = int(rbuffer[2:idx])
+            except ValueError:
+                raise ncerror.FramingError(bytes(rbuffer[:idx + 1]))
+            if idx >= MAX_CHUNK_HEADER or not 0 < chunklen <= 4294967295:
+                raise ncerror.FramingError(bytes(rbuffer[:idx + 1]))
+            del rbuffer[:idx + 1]
+
+            while chunklen:
+                if not rbuffer:
+                    await self._fill()
+                size = min(len(rbuffer), chunklen)
+                feed(bytes(rbuffer[:size]))
+                del rbuffer[:size]
+                chunklen -= size
+
+    def pdu_writer(self, new_framing, loop=None):
+        """Return a base.NetconfPDUWriter writing to the channel
+
+        If loop is given the writer may be used from another thread, each
+        write then waits until the channel has room for more data.
+        """
+        return base.NetconfPDUWriter(_ChannelStream(self.writer, loop), self.max_chunk, new_framing)
+
+    async def drain(self):
+        await self.writer.drain()
+
+
+class _ChannelStream(object):
+    """sendall() over an asyncssh writer for base.NetconfPDUWriter"""
+
+    def __init__(self, writer, loop=None):
+        self.writer = writer
+        self.loop = loop
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    def sendall(self, data):
+        if self.loop is None:
+            self.writer.write(data)
+        else:
+            asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result()
+
+
+class AsyncNetconfServerSession(object):
+    """A Netconf session served by a coroutine"""
+
+    handled_rpc_methods = set(["close-session", "kill-session"])
+    barrier_rpc_methods = ncserver.NetconfServerSession.barrier_rpc_methods
+
+    def __init__(self, server, process):
+        self.server = server
+        self.methods = server.server_methods
+        self.debug = server.debug
+        self.pretty_print = server.pretty_print
+        self.process = process
+        # Available to the server methods, e.g. to route requests.
+        self.username = process.get_extra_info('username')
+        self.subsystem = process.subsystem
+        self.loop = asyncio.get_event_loop()
+        self.transport = AsyncFramingTransport(process.stdin, process.stdout, MAXSSHBUF)
+        self.session_id = server.allocate_session_id()
+        self.capabilities = set()
+        self.new_framing = False
+        self.session_open = False
+        self.inflight_sem = asyncio.Semaphore(server.max_inflight_rpcs)
+        # (rpc, task) in the order the rpcs were received, None when done.
+        self.pending = asyncio.Queue()
+        # rpcs still running, waited for by the ones changing a datastore.
+        self.running = set()
+
+    def __str__(self):
+        return "AsyncNetconfServerSession(sid:{})".format(self.session_id)
+
+    def close(self):
+        self.session_open = False
+        self.process.close()
+
+    async def run(self):
+        try:
+            await self._open_session()
+            sender = asyncio.ensure_future(self._send_replies())
+            try:
+                await self._read_messages()
+            finally:
+                await self.pending.put(None)
+                await sender
+        except (ncerror.ChannelClosed, ConnectionError, asyncssh.Error) as error:
+            if self.debug:
+                logger.debug("%s: Session closed: %s", str(self), str(error))
+        except ncerror.SessionError as error:
+            logger.error("%s: Closing session: %s", str(self), str(error))
+        except Exception as error:
+            logger.error("%s: Unexpected exception: %s", str(self), str(error))
+        finally:
+            self.session_open = False
+            self.process.exit(0)
+            if self.debug:
+                logger.debug("%s: Session ended.", str(self))
+
+    async def _open_session(self):
+        msg = ncutil.elm("hello", attrib={'xmlns': NSMAP['nc']})
+        caps = ncutil.elm("capabilities")
+        for cap in (base.NC_BASE_10, base.NC_BASE_11):
+            ncutil.subelm(caps, "capability").text = str(cap)
+        self.methods.nc_append_capabilities(caps)
+        msg.append(caps)
+        msg.append(ncutil.leaf_elm("session-id", str(self.session_id)))
+        await self._send_message(etree.tounicode(msg))
+
+        root = await self.transport.receive_pdu_tree(False)
+        if self.debug:
+            logger.debug("%s: Received HELLO", str(self))
+
+        for cap in root.xpath("//nc:hello/nc:capabilities/nc:capability", namespaces=NSMAP):
+            self.capabilities.add(cap.text)
+        if base.NC_BASE_11 in self.capabilities:
+            self.new_framing = True
+        elif base.NC_BASE_10 not in self.capabilities:
+            raise ncerror.SessionError(root, "Client doesn't implement 1.0 or 1.1 of netconf")
+        if root.xpath("//nc:hello/nc:session-id", namespaces=NSMAP):
+            raise ncerror.SessionError(root, "Client sent a session-id")
+
+        self.session_open = True
+        if self.debug:
+            logger.debug("%s: Opened version %s session.", str(self), "1.1"
+                         if self.new_framing else "1.0")
+
+    async def _read_messages(self):
+        while self.session_open:
+            msg = await self.transport.receive_pdu_tree(self.new_framing)
+
+            rpcs = msg.xpath("/nc:rpc", namespaces=NSMAP)
+            if not rpcs:
+                raise ncerror.SessionError(msg, "No rpc found")
+
+            for rpc in rpcs:
+                msg_id = rpc.get('message-id')
+                if self.debug:
+                    logger.debug("%s: Received rpc message-id: %s", str(self), msg_id)
+
+                rpc_method = rpc.getchildren()
+                rpcname = None
+                if len(rpc_method) == 1:
+                    rpcname = rpc_method[0].tag.replace(qmap('nc'), "")
+
+                # Bound the number of rpcs in flight, the session stops reading
+                # from the client until a reply has been sent.
+                await self.inflight_sem.acquire()
+                if rpcname in self.handled_rpc_methods:
+                    if self.debug:
+                        logger.debug("%s: Received %s msg-id: %s", str(self), rpcname, msg_id)
+                    # Sent after the replies to every previous rpc.
+                    done = self.loop.create_future()
+                    done.set_result(("reply", etree.Element("ok")))
+                    await self.pending.put((rpc, done))
+                    self.session_open = False
+                    return
+
+                barrier = rpcname in self.barrier_rpc_methods
+                if barrier and self.running:
+                    await asyncio.wait(list(self.running))
+
+                task = asyncio.ensure_future(self._run_rpc(rpc, msg))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+                await self.pending.put((rpc, task))
+                if barrier:
+                    await asyncio.wait([task])
+
+    async def _send_replies(self):
+        while True:
+            item = await self.pending.get()
+            if item is None:
+                return
+            rpc, task = item
+            try:
+                kind, value = await task
+                if kind == "reply":
+                    await self._send_rpc_reply(value, rpc)
+                else:
+                    await self._send_message(value)
+            except ncerror.SessionError as error:
+                logger.error("%s: Closing session: %s", str(self), str(error))
+                self.close()
+            except (ConnectionError, asyncssh.Error, EOFError) as error:
+                if self.debug:
+                    logger.debug("%s: Error sending reply: %s", str(self), str(error))
+                self.close()
+            finally:
+                self.inflight_sem.release()
+
+    async def _send_message(self, msg):
+        writer = self.transport.pdu_writer(self.new_framing)
+        writer.write((base.XML_HEADER + msg).encode('utf-8'))
+        writer.close()
+        await self.transport.drain()
+
+    async def _send_rpc_reply(self, rpc_reply, origmsg):
+        """Serialize the reply into the channel, see NetconfServerSession.send_rpc_reply
+
+        The reply is serialized by a worker thread, as the elements of a
+        generator are produced, waiting for the channel to drain between
+        chunks. The event loop keeps serving the other sessions meanwhile.
+        """
+        try:
+            rpc_reply.getchildren  # pylint: disable=W0104
+            elements = [rpc_reply]
+        except AttributeError:
+            elements = rpc_reply
+
+        if self.debug:
+            logger.debug("%s: Sending RPC-Reply to msg-id %s", str(self), origmsg.get('message-id'))
+
+        def write_reply(loop):
+            writer = self.transport.pdu_writer(self.new_framing, loop)
+            writer.write(base.XML_HEADER.encode('utf-8'))
+            ncserver.write_rpc_reply(writer, elements, origmsg, self.pretty_print)
+            writer.close()
+
+        try:
+            await self.loop.run_in_executor(self.server.rpc_executor,
+                                            functools.partial(write_reply, self.loop))
+        except (ConnectionError, asyncssh.Error, EOFError):
+            raise
+        except Exception as error:
+            raise ncerror.SessionError(origmsg, "RPC-Reply aborted: {}".format(error))
+
+    async def _call_method(self, method, rpc, params):
+        if asyncio.iscoroutinefunction(method):
+            return await method(self, rpc, *params)
+        return await self.loop.run_in_executor(self.server.rpc_executor,
+                                               functools.partial(method, self, rpc, *params))
+
+    async def _run_rpc(self, rpc, msg):
+        """Run the method for an rpc, returns ("reply", reply) or ("message", rpc-error)
+
+        Raises SessionError if the session must be closed instead.
+        """
+        msg_id = rpc.get('message-id')
+        try:
+            method_name, params = ncserver.rpc_method_params(rpc)
+            method = getattr(self.methods, method_name, None)
+            if method is None:
+                if self.debug:
+                    logger.debug("%s: Not Impl msg-id: %s", str(self), msg_id)
+                raise ncerror.RPCSvrErrNotImpl(rpc)
+            if self.debug:
+                logger.debug("%s: Calling method: %s", str(self), method_name)
+            try:
+                return "reply", await self._call_method(method, rpc, params)
+            except NotImplementedError:
+                raise ncerror.RPCSvrErrNotImpl(rpc)
+        except ncerror.RPCSvrErrBadMsg as msgerr:
+            if self.new_framing:
+                if self.debug:
+                    logger.debug("%s: RPCSvrErrBadMsg: %s", str(self), str(msgerr))
+                return "message", msgerr.get_reply_msg()
+            # If we are 1.0 we have to simply close the connection
+            # as we are not allowed to send this error
+            logger.warning("Closing 1.0 session due to malformed message")
+            raise ncerror.SessionError(msg, "Malformed message")
+        except ncerror.RPCServerError as error:
+            if self.debug:
+                logger.debug("%s: RPCServerError: %s", str(self), str(error))
+            return "message", error.get_reply_msg()
+        except Exception as exception:
+            if self.debug:
+                logger.debug("%s: Got unexpected exception running rpc: %s", str(self),
+                             str(exception))
+            return "message", ncerror.RPCSvrException(rpc, exception).get_reply_msg()
+
+
+class _SSHServer(asyncssh.SSHServer if have_asyncssh else object):
+    """Password authentication against a sshutil/netconf server controller"""
+
+    def __init__(self, server_ctl):
+        self.server_ctl = server_ctl
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return self.server_ctl.check_auth_password(username, password) == ssh.AUTH_SUCCESSFUL
+
+
+class AsyncNetconfSSHServer(object):
+    """A netconf server running on an asyncio event loop
+
+    Use: server = AsyncNetconfSSHServer(...); await server.start()
+    """
+
+    def __init__(self,
+                 server_ctl=None,
+                 server_methods=None,
+                 port=830,
+                 host_key=None,
+                 debug=False,
+                 rpc_workers=16,
+                 max_inflight_rpcs=8,
+                 pretty_print=False,
+                 reuse_port=False,
+                 session_id_base=1,
+                 session_id_stride=1):
+        """
+        Arguments are as for netconf.server.NetconfSSHServer, except that
+        rpc_workers threads are always used to run the server methods that
+        are not coroutine functions. Only password authentication is supported.
+        """
+        if not have_asyncssh:
+            raise ImportError("asyncssh is required by AsyncNetconfSSHServer")
+        if server_ctl is None:
+            server_ctl = SSHUserPassController()
+        if host_key is None:
+            host_key = "/etc/ssh/ssh_host_rsa_key"
+        self.server_ctl = server_ctl
+        self.server_methods = server_methods if server_methods is not None else ncserver.NetconfMethods()
+        self.port = port
+        self.host_key = host_key
+        self.debug = debug
+        self.rpc_executor = futures.ThreadPoolExecutor(max_workers=rpc_workers)
+        self.max_inflight_rpcs = max_inflight_rpcs
+        self.pretty_print = pretty_print
+        self.reuse_port = reuse_port
+        self.session_id = session_id_base
+        self.session_id_stride = session_id_stride
+        self.sessions = set()
+        self.acceptors = []
+
+    async def _listen(self, host, port):
+        acceptor = await asyncssh.listen(
+            host,
+            port,
+            server_factory=functools.partial(_SSHServer, self.server_ctl),
+            server_host_keys=[self.host_key],
+            process_factory=self._run_session,
+            encoding=None,
+            reuse_address=True,
+            reuse_port=self.reuse_port)
+        self.acceptors.append(acceptor)
+        return acceptor
+
+    async def start(self):
+        # As for sshutil.server.SSHServer listen on IPv4 and IPv6, an
+        # ephemeral port is picked on IPv4 first to use the same for both.
+        acceptor = await self._listen("0.0.0.0", self.port)
+        self.port = acceptor.sockets[0].getsockname()[1]
+        try:
+            await self._listen("::", self.port)
+        except OSError as error:
+            if self.debug:
+                logger.debug("%s: Not listening on IPv6: %s", str(self), str(error))
+        if self.debug:
+            logger.debug("%s: Listening", str(self))
+
+    def allocate_session_id(self):
+        sid = self.session_id
+        self.session_id += self.session_id_stride
+        return sid
+
+    async def _run_session(self, process):
+        if not process.subsystem or not ncserver.is_netconf_subsystem(process.subsystem):
+            process.exit(1)
+            return
+        session = AsyncNetconfServerSession(self, process)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+
+    def close(self):
+        for acceptor in self.acceptors:
+            acceptor.close()
+        for session in list(self.sessions):
+            session.close()
+        self.rpc_executor.shutdown(wait=False)
+
+    async def wait_closed(self):
+        for acceptor in self.acceptors:
+            await acceptor.wait_closed()
+
+    def __str__(self):
+        return "AsyncNetconfSSHServer(port={})".format(self.port)
@@ -18,6 +18,7 @@
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 import logging
+import contextlib
 import io
 import socket
 import sys
@@ -122,6 +123,150 @@ class NetconfPacketTransport(object):
         raise NotImplementedError()
 
 
+class NetconfReceiveBuffer(object):
+    """Receive buffer consumed in place
+
+    Received data is stored between start and end of a bytearray. Consuming
+    data only moves start; the storage is compacted or grown (doubling) when
+    there is no room left, so receiving a message is linear in its size.
+    Streams providing recv_into (sockets) are read straight into the storage.
+    """
+
+    def __init__(self, size):
+        self.storage = bytearray(size)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _reserve(self, size):
+        capacity = len(self.storage)
+        if capacity - self.end >= size:
+            return
+        used = self.end - self.start
+        if self.start >= used and capacity - used >= size:
+            # Compacting copies at most as much as has been consumed.
+            self.storage[:used] = self.storage[self.start:self.end]
+        else:
+            storage = bytearray(max(2 * capacity, used + size))
+            storage[:used] = self.storage[self.start:self.end]
+            self.storage = storage
+        self.start = 0
+        self.end = used
+
+    def fill(self, stream, size):
+        """Receive at most size bytes from stream, returns the number of bytes received"""
+        self._reserve(size)
+        try:
+            recv_into = stream.recv_into
+        except AttributeError:
+            data = stream.recv(size)
+            received = len(data)
+            self.storage[self.end:self.end + received] = data
+        else:
+            view = memoryview(self.storage)
+            try:
+                received = recv_into(view[self.end:self.end + size])
+            finally:
+                view.release()
+        self.end += received
+        return received
+
+    def find(self, sub, offset=0):
+        idx = self.storage.find(sub, self.start + offset, self.end)
+        return idx - self.start if idx != -1 else -1
+
+    def peek(self, size):
+        return bytes(self.storage[self.start:min(self.start + size, self.end)])
+
+    def skip(self, size):
+        self.start += size
+        if self.start >= self.end:
+            self.start = self.end = 0
+
+    def consume(self, size):
+        data = bytes(self.storage[self.start:self.start + size])
+        self.skip(size)
+        return data
+
+
+class NetconfMessageParser(object):
+    """Incremental parser for a received PDU, fed as the data arrives
+
+    Once a syntax error is found the rest of the PDU is ignored, close()
+    returns the root element or raises SessionError.
+    """
+
+    def __init__(self):
+        self.parser = etree.XMLParser()
+        self.error = None
+
+    def feed(self, data):
+        if self.error is None:
+            try:
+                self.parser.feed(data)
+            except etree.XMLSyntaxError as error:
+                self.error = error
+
+    def close(self):
+        if self.error is None:
+            try:
+                return self.parser.close()
+            except etree.XMLSyntaxError as error:
+                self.error = error
+        raise SessionError("Invalid XML received: {}".format(self.error))
+
+
+class NetconfPDUWriter(object):
+    """File-like object framing the encoded bytes written to it as a single PDU
+
+    With 1.1 framing the data is sent in chunks of max_chunk bytes as soon as
+    they are complete, so a message never has to be held whole in memory.
+    close() sends what is left and the end of message marker.
+    """
+
+    def __init__(self, stream, max_chunk, new_framing):
+        self.stream = stream
+        self.max_chunk = max_chunk
+        self.new_framing = new_framing
+        self.wbuffer = bytearray()
+        # Bytes of the message written so far
+        self.size = 0
+
+    def _send_chunk(self, chunk):
+        if self.new_framing:
+            self.stream.sendall("\n#{}\n".format(len(chunk)).encode('utf-8') + chunk)
+        else:
+            self.stream.sendall(chunk)
+
+    def write(self, data):
+        self.wbuffer += data
+        self.size += len(data)
+        # Apparently ssh has a bug that requires minimum of 64 bytes, so keep
+        # at least 64 bytes for the last send.
+        if len(self.wbuffer) >= self.max_chunk + 64:
+            sent = 0
+            while len(self.wbuffer) - sent >= self.max_chunk + 64:
+                self._send_chunk(bytes(self.wbuffer[sent:sent + self.max_chunk]))
+                sent += self.max_chunk
+            del self.wbuffer[:sent]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.new_framing:
+            tail = b"\n##\n"
+            if self.wbuffer:
+                tail = "\n#{}\n".format(len(self.wbuffer)).encode('utf-8') + bytes(self.wbuffer) + tail
+        else:
+            tail = bytes(self.wbuffer) + b"]]>]]>"
+        self.wbuffer = bytearray()
+        self.stream.sendall(tail)
+
+
 class NetconfFramingTransport(NetconfPacketTransport):
     """Packetize an ssh stream into netconf PDUs -- doesn't need to be SSH specific"""
 
@@ -130,7 +275,7 @@ class NetconfFramingTransport(NetconfPacketTransport):
         self.stream = stream
         self.max_chunk = max_chunk
         self.debug = debug
-        self.rbuffer = b""
+        self.rbuffer = NetconfReceiveBuffer(max_chunk)
 
     def __del__(self):
         self.close()
@@ -156,91 +301,121 @@ class NetconfFramingTransport(NetconfPacketTransport):
 
     def receive_pdu(self, new_framing):
         assert self.stream is not None
+        data = bytearray()
+        self._receive(data.extend, new_framing)
+        return data.decode('utf-8')
+
+    def receive_pdu_tree(self, new_framing):
+        """Receive a PDU feeding it to an XML parser as it arrives, returns its root element
+
+        The message is never held whole, as text, in memory. Raises SessionError
+        if it is not valid XML (the PDU is consumed anyway).
+        """
+        assert self.stream is not None
+        parser = NetconfMessageParser()
+        self._receive(parser.feed, new_framing)
+        return parser.close()
+
+    def _receive(self, feed, new_framing):
         if new_framing:
-            return self._receive_11()
+            self._receive_11(feed)
         else:
-            return self._receive_10()
+            self._receive_10(feed)
 
     def send_pdu(self, msg, new_framing):
         assert self.stream is not None
-        if new_framing:
-            bmsg = msg.encode('utf-8')
-            blen = len(bmsg)
-            msg = "\n#{}\n".format(blen).encode('utf-8') + bmsg + "\n##\n".encode('utf-8')
-        else:
-            msg += "]]>]]>"
+        writer = self.pdu_writer(new_framing)
+        writer.write(msg.encode('utf-8'))
+        writer.close()
 
-        # Apparently ssh has a bug that requires minimum of 64 bytes?
-        for chunk in chunkit(msg, self.max_chunk, 64):
-            self.stream.sendall(chunk)
+    def pdu_writer(self, new_framing):
+        """Return a file-like object sending what is written to it as a single PDU"""
+        assert self.stream is not None
+        return NetconfPDUWriter(self.stream, self.max_chunk, new_framing)
 
-    def _receive_10(self):
-        searchfrom = 0
+    def _fill(self, size):
+        """Read at least one more byte (at most size) into the receive buffer"""
+        stream = self.stream
+        if stream is None:
+            if self.debug:
+                logger.debug("Channel closed: stream is None")
+            raise ChannelClosed(self)
+        if not self.rbuffer.fill(stream, size):
+            if self.debug:
+                logger.debug("Channel closed: Zero bytes read")
+            raise ChannelClosed(self)
+
+    def _receive_10(self, feed):
+        rbuffer = self.rbuffer
         while True:
-            eomidx = self.rbuffer.find(b"]]>]]>", searchfrom)
+            eomidx = rbuffer.find(b"]]>]]>")
             if eomidx != -1:
                 break
-            searchfrom = max(0, len(self.rbuffer) - 5)
-            buf = self.stream.recv(self.max_chunk)
-            self.rbuffer += buf
+            # The last 5 bytes may be the start of the end of message marker
+            if len(rbuffer) > 5:
+                feed(rbuffer.consume(len(rbuffer) - 5))
+            self._fill(self.max_chunk)
 
-        msg = self.rbuffer[:eomidx]
-        self.rbuffer = self.rbuffer[eomidx + 6:]
-        return msg.decode('utf-8')
+        if eomidx:
+            feed(rbuffer.consume(eomidx))
+        rbuffer.skip(6)
 
-    def _receive_chunk(self):
-        blen = len(self.rbuffer)
-        while blen < 4:
-            buf = self.stream.recv(self.max_chunk)
-            self.rbuffer += buf
-            blen = len(self.rbuffer)
-            if self.stream is None:
-                if self.debug:
-                    logger.debug("Channel closed: stream is None")
-                raise ChannelClosed(self)
-            if not buf:
-                if self.debug:
-                    logger.debug("Channel closed: Zero bytes read")
-                raise ChannelClosed(self)
+    def _receive_chunk_header(self):
+        """Parse a chunk header in place, return the chunk length or None for end of chunks"""
+        rbuffer = self.rbuffer
+        while len(rbuffer) < 4:
+            self._fill(self.max_chunk)
+
+        if rbuffer.peek(2) != b"\n#":
+            raise FramingError(rbuffer.peek(12))
+        rbuffer.skip(2)
 
-        if self.rbuffer[:2] != b"\n#":
-            raise FramingError(self.rbuffer)
-        self.rbuffer = self.rbuffer[2:]
+        # Check for last chunk.
+        if rbuffer.peek(2) == b"#\n":
+            rbuffer.skip(2)
+            return None
 
-        # Get chunk length or termination indicator
+        # Get chunk length
         idx = -1
         searchfrom = 0
         while True:
-            idx = self.rbuffer.find(b"\n", searchfrom)
+            idx = rbuffer.find(b"\n", searchfrom)
             if 12 > idx > 0:
                 break
-            if idx > 12 or len(self.rbuffer) > 12:
-                raise FramingError(self.rbuffer)
-            searchfrom = len(self.rbuffer)
-            self.rbuffer += self.stream.recv(self.max_chunk)
+            if idx > 12 or len(rbuffer) > 12:
+                raise FramingError(rbuffer.peek(12))
+            searchfrom = len(rbuffer)
+            self._fill(self.max_chunk)
 
-        # Check for last chunk.
-        if self.rbuffer[0:2] == b"#\n":
-            self.rbuffer = self.rbuffer[2:]
-            return None
-
-        lenstr = self.rbuffer[:idx]
-        self.rbuffer = bytes(self.rbuffer[idx + 1:])
+        lenstr = rbuffer.consume(idx)
+        rbuffer.skip(1)
 
         try:
             chunklen = int(lenstr)
             if not (4294967295 >= chunklen > 0):
                 raise FramingError("Unacceptable chunk length: {}".format(chunklen))
         except ValueError:
-            raise FramingError("Frame length not integer: {}".format(lenstr.encode('utf-8')))
+            raise FramingError("Frame length not integer: {}".format(lenstr))
+        return chunklen
+
+    def _receive_chunk_data(self, chunklen, feed):
+        """Feed chunk data as it is received"""
+        rbuffer = self.rbuffer
+        remaining = chunklen
+        while remaining:
+            if not len(rbuffer):
+                self._fill(self.max_chunk)
+            size = min(len(rbuffer), remaining)
+            feed(rbuffer.consume(size))
+            remaining -= size
 
-        while True:
-            blen = len(self.rbuffer)
-            if blen >= chunklen:
-                chunk = self.rbuffer[:chunklen]
-                self.rbuffer = self.rbuffer[chunklen:]
-                return chunk
-            self.rbuffer += self.stream.recv(self.max_chunk)
+    def _receive_chunk(self):
+        chunklen = self._receive_chunk_header()
+        if chunklen is None:
+            return None
+        chunk = bytearray()
+        self._receive_chunk_data(chunklen, chunk.extend)
+        return bytes(chunk)
 
     def _iter_receive_chunks(self):
         assert self.stream is not None
@@ -249,10 +424,12 @@ class NetconfFramingTransport(NetconfPacketTransport):
             yield chunk
             chunk = self._receive_chunk()
 
-    def _receive_11(self):
+    def _receive_11(self, feed):
         assert self.stream is not None
-        data = b"".join([x for x in self._iter_receive_chunks()])
-        return data.decode('utf-8')
+        chunklen = self._receive_chunk_header()
+        while chunklen is not None:
+            self._receive_chunk_data(chunklen, feed)
+            chunklen = self._receive_chunk_header()
 
 
 class NetconfSession(object):
@@ -292,13 +469,32 @@ class NetconfSession(object):
             logger.debug("Sending message (%d): %s", len(msg), msg)
         pkt_stream.send_pdu(XML_HEADER + msg, self.new_framing)
 
+    @contextlib.contextmanager
+    def message_writer(self):
+        """Context manager giving a file-like object a message is written to (encoded)
+
+        The XML header is already written, the message is sent as it is written
+        and ended when the context exits without error.
+        """
+        with self.lock:
+            pkt_stream = self.pkt_stream
+        if not pkt_stream:
+            logger.debug("Dropping message b/c no stream")
+            yield io.BytesIO()
+            return
+        writer = pkt_stream.pdu_writer(self.new_framing)
+        writer.write(XML_HEADER.encode('utf-8'))
+        yield writer
+        writer.close()
+
     def _receive_message(self):
-        # private method to receive a full message.
+        # private method to receive a full message, parsed while it arrives.
+        # Returns the root element of the message.
         with self.lock:
             if self.reader_thread and not self.reader_thread.keep_running:
                 return None
             pkt_stream = self.pkt_stream
-        return pkt_stream.receive_pdu(self.new_framing)
+        return pkt_stream.receive_pdu_tree(self.new_framing)
 
     def send_hello(self, caplist, session_id=None):
         msg = ncutil.elm("hello", attrib={'xmlns': NSMAP['nc']})
@@ -349,13 +545,10 @@ class NetconfSession(object):
             self.send_hello((NC_BASE_10, NC_BASE_11), self.session_id)
 
             # Get reply
-            reply = self._receive_message()
+            root = self._receive_message()
             if self.debug:
                 logger.debug("Received HELLO")
 
-            # Parse reply
-            tree = etree.parse(io.BytesIO(reply.encode('utf-8')))
-            root = tree.getroot()
             caps = root.xpath("//nc:hello/nc:capabilities/nc:capability", namespaces=NSMAP)
 
             # Store capabilities
@@ -401,7 +594,8 @@ class NetconfSession(object):
         raise NotImplementedError("reader_exits")
 
     def reader_handle_message(self, msg):
-        # Called from reader thread after receiving a framed message
+        # Called from reader thread after receiving a framed message,
+        # msg is the root element of the parsed message
         raise NotImplementedError("read_handle_message")
 
     def _read_message_thread(self):
@@ -419,7 +613,7 @@ class NetconfSession(object):
                     assert pkt_stream is not None
 
                 msg = self._receive_message()
-                if msg:
+                if msg is not None:
                     self.reader_handle_message(msg)
                     closed = False
                 else:
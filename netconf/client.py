@@ -18,7 +18,6 @@
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
 import logging
-import io
 import threading
 import socket
 
@@ -147,6 +146,15 @@ class NetconfClientSession(NetconfSession):
             return self.rpc_out[msg_id] is not None
 
     def wait_reply(self, msg_id, timeout=None):
+        tree, reply = self._wait_reply(msg_id, timeout)
+        return tree, reply, etree.tounicode(tree)
+
+    def _wait_reply(self, msg_id, timeout=None):
+        """Same as wait_reply without the reply text
+
+        The reply is parsed while received, its text is only rebuilt
+        for the callers asking for it and for rpc-errors.
+        """
         assert msg_id in self.rpc_out
 
         check_timeout = Timeout(timeout)
@@ -169,17 +177,17 @@ class NetconfClientSession(NetconfSession):
             self.cv.release()
             raise SessionError("Session closed while waiting for reply")
 
-        tree, reply, msg = self.rpc_out[msg_id]
+        tree, reply = self.rpc_out[msg_id]
         del self.rpc_out[msg_id]
         self.cv.release()
 
         error = reply.xpath("nc:rpc-error", namespaces=NSMAP)
         if error:
-            raise RPCError(msg, tree, error[0])
+            raise RPCError(etree.tounicode(tree), tree, error[0])
 
         # data = reply.xpath("nc:data", namespaces=self.nsmap)
         # ok = reply.xpath("nc:ok", namespaces=self.nsmap)
-        return tree, reply, msg
+        return tree, reply
 
     def reader_exits(self):
         if self.debug:
@@ -188,13 +196,8 @@ class NetconfClientSession(NetconfSession):
             self.cv.notify_all()
 
     def reader_handle_message(self, msg):
-        """Handle a message, lock is already held"""
-        try:
-            tree = etree.parse(io.BytesIO(msg.encode('utf-8')))
-            if not tree:
-                raise SessionError(msg, "Invalid XML from server.")
-        except etree.XMLSyntaxError:
-            raise SessionError(msg, "Invalid XML from server.")
+        """Handle a message (root element), lock is already held"""
+        tree = msg.getroottree()
 
         replies = tree.xpath("/nc:rpc-reply", namespaces=NSMAP)
         if not replies:
@@ -226,7 +229,7 @@ class NetconfClientSession(NetconfSession):
                     if self.debug:
                         logger.debug("%s: Received rpc-reply message-id: %s", str(self),
                                      str(msg_id))
-                    self.rpc_out[msg_id] = tree, reply, msg
+                    self.rpc_out[msg_id] = tree, reply
                 except Exception as error:
                     logger.debug("%s: Unexpected exception: %s", str(self), str(error))
                     raise
@@ -241,7 +244,7 @@ class NetconfClientSession(NetconfSession):
 
     def get_config(self, source="running", select=None, timeout=None):
         msg_id = self.get_config_async(source, select)
-        _, reply, _ = self.wait_reply(msg_id, timeout)
+        _, reply = self._wait_reply(msg_id, timeout)
         return reply.find("nc:config", namespaces=NSMAP)
 
     def get_async(self, select):
@@ -250,7 +253,7 @@ class NetconfClientSession(NetconfSession):
 
     def get(self, select=None, timeout=None):
         msg_id = self.get_async(select)
-        _, reply, _ = self.wait_reply(msg_id, timeout)
+        _, reply = self._wait_reply(msg_id, timeout)
         return reply.find("nc:data", namespaces=NSMAP)
 
 
@@ -17,11 +17,14 @@
 # limitations under the License.
 #
 from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
-import io
+import collections
+import functools
 import logging
 import os
+import socket
 import sys
 import threading
+from concurrent import futures
 import paramiko as ssh
 from lxml import etree
 import sshutil.server
@@ -44,6 +47,11 @@ except ImportError:
     have_pam = False
 
 
+def is_netconf_subsystem(name):
+    """netconf, or netconf@<name> to let the server methods pick e.g. a backend device"""
+    return name == "netconf" or name.startswith("netconf@")
+
+
 class SSHAuthController(ssh.ServerInterface):
     def __init__(self, users=None):
         self.event = threading.Event()
@@ -157,7 +165,10 @@ class SSHAuthController(ssh.ServerInterface):
 
     def check_channel_subsystem_request(self, channel, name):
         self.event.set()
-        return name == "netconf"
+        if not is_netconf_subsystem(name):
+            return False
+        channel.netconf_subsystem = name
+        return True
 
 
 class SSHUserPassController(ssh.ServerInterface):
@@ -186,12 +197,88 @@ class SSHUserPassController(ssh.ServerInterface):
 
     def check_channel_subsystem_request(self, channel, name):
         self.event.set()
-        return name == "netconf"
+        if not is_netconf_subsystem(name):
+            return False
+        channel.netconf_subsystem = name
+        return True
+
+
+class _PendingReply(object):
+    """An rpc handed to the executor, sender is set once its reply is ready"""
+
+    def __init__(self, rpc):
+        self.rpc = rpc
+        self.sender = None
+
+
+def write_rpc_reply(fileobj, elements, origmsg, pretty_print=False):
+    """Serialize the rpc-reply to origmsg holding elements into a file-like object
+
+    Elements are written (encoded) as they are produced when given a generator.
+    """
+    with etree.xmlfile(fileobj, encoding='utf-8') as xf:
+        with xf.element(qmap('nc') + "rpc-reply", attrib=origmsg.attrib, nsmap=origmsg.nsmap):
+            for elem in elements:
+                xf.write(elem, pretty_print=pretty_print, with_tail=False)
+
+
+def rpc_method_params(rpc):
+    """Validate an rpc and return the name of the method handling it and its parameters
+
+    Raises an RPCServerError if the rpc is not valid (RPCSvrErrBadMsg if malformed).
+    """
+    # Get the first child of rpc as the method name
+    rpc_method = rpc.getchildren()
+    if len(rpc_method) != 1:
+        raise ncerror.RPCSvrErrBadMsg(rpc)
+    rpc_method = rpc_method[0]
+
+    rpcname = rpc_method.tag.replace(qmap('nc'), "")
+    params = rpc_method.getchildren()
+    paramslen = len(params)
+
+    if rpcname == "get":
+        # Validate GET parameters
+
+        if paramslen > 1:
+            # XXX need to specify all elements not known
+            raise ncerror.RPCSvrErrBadMsg(rpc)
+        if params and not util.filter_tag_match(params[0], "nc:filter"):
+            raise ncerror.RPCSvrUnknownElement(rpc, params[0])
+        if not params:
+            params = [None]
+    elif rpcname == "get-config":
+        # Validate GET-CONFIG parameters
+
+        # XXX verify that the source parameter is present
+        if paramslen > 2:
+            # XXX need to specify all elements not known
+            raise ncerror.RPCSvrErrBadMsg(rpc)
+        source_param = rpc_method.find("nc:source", namespaces=NSMAP)
+        if source_param is None:
+            raise ncerror.RPCSvrMissingElement(rpc, util.elm("nc:source"))
+        filter_param = None
+        if paramslen == 2:
+            filter_param = rpc_method.find("nc:filter", namespaces=NSMAP)
+            if filter_param is None:
+                unknown_elm = params[0] if params[0] != source_param else params[1]
+                raise ncerror.RPCSvrUnknownElement(rpc, unknown_elm)
+        params = [source_param, filter_param]
+
+    # Handle any namespaces or prefixes in the tag, other than
+    # "nc" which was removed above. Of course, this does not handle
+    # namespace collisions, but that seems reasonable for now.
+    rpcname = rpcname.rpartition("}")[-1]
+    return "rpc_" + rpcname.replace('-', '_'), params
 
 
 class NetconfServerSession(base.NetconfSession):
     """Netconf Server-side Session Protocol"""
     handled_rpc_methods = set(["close-session", "kill-session"])
+    # RPCs that change the datastores: they start once every earlier rpc of the
+    # session is done and later ones wait for them, only reads run concurrently.
+    barrier_rpc_methods = set(["edit-config", "copy-config", "delete-config", "lock", "unlock",
+                               "commit", "cancel-commit", "discard-changes", "validate"])
 
     def __init__(self, channel, server, unused_extra_args, debug):
         self.server = server
@@ -201,6 +288,20 @@ class NetconfServerSession(base.NetconfSession):
             logger.debug("NetconfServerSession: Creating session-id %s", str(sid))
 
         self.methods = server.server_methods
+        self.pretty_print = getattr(server, "pretty_print", False)
+
+        # RPCs are run by the server executor (if any) and their replies queued here
+        # so they are still sent in the order the rpcs were received.
+        self.rpc_executor = getattr(server, "rpc_executor", None)
+        self.inflight_sem = threading.BoundedSemaphore(getattr(server, "max_inflight_rpcs", 1))
+        self.pending = collections.deque()
+        self.pending_cv = threading.Condition()
+        self.send_lock = threading.Lock()
+
+        # Available to the server methods, e.g. to route requests.
+        self.channel = channel
+        self.username = channel.get_transport().get_username()
+
         super(NetconfServerSession, self).__init__(channel, debug, sid)
         super(NetconfServerSession, self)._open_session(True)
 
@@ -214,6 +315,11 @@ class NetconfServerSession(base.NetconfSession):
     def __str__(self):
         return "NetconfServerSession(sid:{})".format(self.session_id)
 
+    @property
+    def subsystem(self):
+        # The client requests the subsystem before sending its hello
+        return getattr(self.channel, "netconf_subsystem", "netconf")
+
     def close(self):
         # XXX should be invoking a method in self.methods?
         if self.debug:
@@ -229,16 +335,31 @@ class NetconfServerSession(base.NetconfSession):
             logger.debug("%s: Closed.", str(self))
 
     def send_rpc_reply(self, rpc_reply, origmsg):
-        reply = etree.Element(qmap('nc') + "rpc-reply", attrib=origmsg.attrib, nsmap=origmsg.nsmap)
+        """Serialize the reply straight into the framing transport
+
+        rpc_reply is an element, a list of elements or a generator of elements.
+        Elements are written as they are produced and the encoded bytes sent in
+        chunks as they fill, so the whole reply is never held in memory. Once
+        the reply has started an error can no longer be reported as an
+        rpc-error, so the session is closed instead.
+        """
         try:
             rpc_reply.getchildren  # pylint: disable=W0104
-            reply.append(rpc_reply)
+            elements = [rpc_reply]
         except AttributeError:
-            reply.extend(rpc_reply)
-        ucode = etree.tounicode(reply, pretty_print=True)
-        if self.debug:
-            logger.debug("%s: Sending RPC-Reply: %s", str(self), str(ucode))
-        self.send_message(ucode)
+            elements = rpc_reply
+
+        try:
+            with self.message_writer() as writer:
+                write_rpc_reply(writer, elements, origmsg, self.pretty_print)
+            if self.debug:
+                logger.debug("%s: Sent RPC-Reply to msg-id %s: %d bytes", str(self),
+                             origmsg.get('message-id'), getattr(writer, 'size', 0))
+        except (socket.error, EOFError):
+            # Transport errors are handled by the callers as for any other message
+            raise
+        except Exception as error:
+            raise ncerror.SessionError(origmsg, "RPC-Reply aborted: {}".format(error))
 
     def send_rpc_reply_error(self, error):
         self.send_message(error.get_reply_msg())
@@ -255,21 +376,12 @@ class NetconfServerSession(base.NetconfSession):
         return
 
     def reader_handle_message(self, msg):
-        """Handle a message, lock is already held"""
+        """Handle a message (root element), lock is already held"""
         if not self.session_open:
             return
 
-        # Any error with XML encoding here is going to cause a session close
-        # Technically we should be able to return malformed message I think.
-        try:
-            tree = etree.parse(io.BytesIO(msg.encode('utf-8')))
-            if not tree:
-                raise ncerror.SessionError(msg, "Invalid XML from client.")
-        except etree.XMLSyntaxError:
-            logger.warning("Closing session due to malformed message")
-            raise ncerror.SessionError(msg, "Invalid XML from client.")
-
-        rpcs = tree.xpath("/nc:rpc", namespaces=NSMAP)
+        # Malformed XML already closed the session while the message was received.
+        rpcs = msg.xpath("/nc:rpc", namespaces=NSMAP)
         if not rpcs:
             raise ncerror.SessionError(msg, "No rpc found")
 
@@ -281,108 +393,142 @@ class NetconfServerSession(base.NetconfSession):
             except (TypeError, ValueError):
                 raise ncerror.SessionError(msg, "No valid message-id attribute found")
 
-            try:
-                # Get the first child of rpc as the method name
-                rpc_method = rpc.getchildren()
-                if len(rpc_method) != 1:
-                    if self.debug:
-                        logger.debug("%s: Bad Msg: msg-id: %s", str(self), msg_id)
-                    raise ncerror.RPCSvrErrBadMsg(rpc)
-                rpc_method = rpc_method[0]
-
-                rpcname = rpc_method.tag.replace(qmap('nc'), "")
-                params = rpc_method.getchildren()
-                paramslen = len(params)
+            rpc_method = rpc.getchildren()
+            rpcname = None
+            if len(rpc_method) == 1:
+                rpcname = rpc_method[0].tag.replace(qmap('nc'), "")
 
+            if rpcname in self.handled_rpc_methods:
+                # Replies to every previous rpc must go out before the session ends.
+                self._wait_pending_replies()
+                # XXX should be RPC-unlocking if need be
+                # XXX for kill-session we are supposed to cleanly abort anything underway
                 if self.debug:
-                    logger.debug("%s: RPC: %s: paramslen: %s", str(self), rpcname, str(paramslen))
-
-                if rpcname == "close-session":
-                    # XXX should be RPC-unlocking if need be
-                    if self.debug:
-                        logger.debug("%s: Received close-session msg-id: %s", str(self), msg_id)
-                    self.send_rpc_reply(etree.Element("ok"), rpc)
-                    self.close()
-                    # XXX should we also call the user method if it exists?
-                    return
-                elif rpcname == "kill-session":
-                    # XXX we are supposed to cleanly abort anything underway
-                    if self.debug:
-                        logger.debug("%s: Received kill-session msg-id: %s", str(self), msg_id)
+                    logger.debug("%s: Received %s msg-id: %s", str(self), rpcname, msg_id)
+                # The last reply may still be being written once it left pending.
+                with self.send_lock:
                     self.send_rpc_reply(etree.Element("ok"), rpc)
                     self.close()
-                    # XXX should we also call the user method if it exists?
-                    return
-                elif rpcname == "get":
-                    # Validate GET parameters
-
-                    if paramslen > 1:
-                        # XXX need to specify all elements not known
-                        raise ncerror.RPCSvrErrBadMsg(rpc)
-                    if params and not util.filter_tag_match(params[0], "nc:filter"):
-                        raise ncerror.RPCSvrUnknownElement(rpc, params[0])
-                    if not params:
-                        params = [None]
-                elif rpcname == "get-config":
-                    # Validate GET-CONFIG parameters
-
-                    # XXX verify that the source parameter is present
-                    if paramslen > 2:
-                        # XXX need to specify all elements not known
-                        raise ncerror.RPCSvrErrBadMsg(rpc)
-                    source_param = rpc_method.find("nc:source", namespaces=NSMAP)
-                    if source_param is None:
-                        raise ncerror.RPCSvrMissingElement(rpc, util.elm("nc:source"))
-                    filter_param = None
-                    if paramslen == 2:
-                        filter_param = rpc_method.find("nc:filter", namespaces=NSMAP)
-                        if filter_param is None:
-                            unknown_elm = params[0] if params[0] != source_param else params[1]
-                            raise ncerror.RPCSvrUnknownElement(rpc, unknown_elm)
-                    params = [source_param, filter_param]
-
-                #------------------
-                # Call the method.
-                #------------------
+                # XXX should we also call the user method if it exists?
+                return
+
+            if self.rpc_executor is None:
+                self._run_rpc(rpc, msg)()
+                continue
+
+            barrier = rpcname in self.barrier_rpc_methods
+            if barrier:
+                self._wait_pending_replies()
+
+            # Bound the number of rpcs in flight for this session, the reader blocks
+            # (and so stops reading from the client) until a reply has been sent.
+            self.inflight_sem.acquire()
+            pending = _PendingReply(rpc)
+            with self.pending_cv:
+                self.pending.append(pending)
+            try:
+                self.rpc_executor.submit(self._run_pending_rpc, pending, msg)
+            except RuntimeError as error:
+                # Executor was shutdown under us.
+                pending.sender = functools.partial(self.send_message,
+                                                   ncerror.RPCSvrException(rpc, error).get_reply_msg())
+                self._send_completed_replies()
 
+            if barrier:
+                self._wait_pending_replies()
+
+    def _run_pending_rpc(self, pending, msg):
+        try:
+            pending.sender = self._run_rpc(pending.rpc, msg)
+        except ncerror.SessionError as error:
+            pending.sender = functools.partial(self._raise_session_error, error)
+        self._send_completed_replies()
+
+    @staticmethod
+    def _raise_session_error(error):
+        raise error
+
+    def _send_completed_replies(self):
+        """Send replies of finished rpcs in the order the rpcs were received"""
+        with self.send_lock:
+            while True:
+                with self.pending_cv:
+                    if not self.pending or self.pending[0].sender is None:
+                        return
+                    pending = self.pending.popleft()
                 try:
-                    # Handle any namespaces or prefixes in the tag, other than
-                    # "nc" which was removed above. Of course, this does not handle
-                    # namespace collisions, but that seems reasonable for now.
-                    rpcname = rpcname.rpartition("}")[-1]
-                    method_name = "rpc_" + rpcname.replace('-', '_')
-                    method = getattr(self.methods, method_name, self._rpc_not_implemented)
-                    if self.debug:
-                        logger.debug("%s: Calling method: %s", str(self), method_name)
-                    reply = method(self, rpc, *params)
-                    self.send_rpc_reply(reply, rpc)
-                except NotImplementedError:
-                    raise ncerror.RPCSvrErrNotImpl(rpc)
-            except ncerror.RPCSvrErrBadMsg as msgerr:
-                if self.new_framing:
-                    if self.debug:
-                        logger.debug("%s: RPCSvrErrBadMsg: %s", str(self), str(msgerr))
-                    self.send_message(msgerr.get_reply_msg())
-                else:
-                    # If we are 1.0 we have to simply close the connection
-                    # as we are not allowed to send this error
-                    logger.warning("Closing 1.0 session due to malformed message")
-                    raise ncerror.SessionError(msg, "Malformed message")
-            except ncerror.RPCServerError as error:
+                    pending.sender()
+                except ncerror.SessionError as error:
+                    logger.error("%s Session error [closing session]: %s", str(self), str(error))
+                    self.close()
+                except Exception as error:
+                    if self.session_open:
+                        logger.error("%s: Unexpected exception sending reply to msg-id %s: %s",
+                                     str(self), pending.rpc.get('message-id'), str(error))
+                    elif self.debug:
+                        logger.debug("%s: Dropping reply to msg-id %s, session closed",
+                                     str(self), pending.rpc.get('message-id'))
+                finally:
+                    self.inflight_sem.release()
+                    with self.pending_cv:
+                        self.pending_cv.notify_all()
+
+    def _wait_pending_replies(self):
+        with self.pending_cv:
+            while self.pending:
+                self.pending_cv.wait()
+
+    def _run_rpc(self, rpc, msg):
+        """Run the method for an rpc and return a callable that sends its reply
+
+        Raises SessionError if the session must be closed instead.
+        """
+        msg_id = rpc.get('message-id')
+        try:
+            try:
+                method_name, params = rpc_method_params(rpc)
+            except ncerror.RPCSvrErrBadMsg:
                 if self.debug:
-                    logger.debug("%s: RPCServerError: %s", str(self), str(error))
-                self.send_message(error.get_reply_msg())
-            except EOFError:
+                    logger.debug("%s: Bad Msg: msg-id: %s", str(self), msg_id)
+                raise
+
+            #------------------
+            # Call the method.
+            #------------------
+
+            try:
+                method = getattr(self.methods, method_name, self._rpc_not_implemented)
                 if self.debug:
-                    logger.debug("%s: Got EOF in reader_handle_message", str(self))
-                error = ncerror.RPCSvrException(rpc, EOFError("EOF"))
-                self.send_message(error.get_reply_msg())
-            except Exception as exception:
+                    logger.debug("%s: Calling method: %s", str(self), method_name)
+                reply = method(self, rpc, *params)
+                return functools.partial(self.send_rpc_reply, reply, rpc)
+            except NotImplementedError:
+                raise ncerror.RPCSvrErrNotImpl(rpc)
+        except ncerror.RPCSvrErrBadMsg as msgerr:
+            if self.new_framing:
                 if self.debug:
-                    logger.debug("%s: Got unexpected exception in reader_handle_message: %s",
-                                 str(self), str(exception))
-                error = ncerror.RPCSvrException(rpc, exception)
-                self.send_message(error.get_reply_msg())
+                    logger.debug("%s: RPCSvrErrBadMsg: %s", str(self), str(msgerr))
+                return functools.partial(self.send_message, msgerr.get_reply_msg())
+            else:
+                # If we are 1.0 we have to simply close the connection
+                # as we are not allowed to send this error
+                logger.warning("Closing 1.0 session due to malformed message")
+                raise ncerror.SessionError(msg, "Malformed message")
+        except ncerror.RPCServerError as error:
+            if self.debug:
+                logger.debug("%s: RPCServerError: %s", str(self), str(error))
+            return functools.partial(self.send_message, error.get_reply_msg())
+        except EOFError:
+            if self.debug:
+                logger.debug("%s: Got EOF in reader_handle_message", str(self))
+            error = ncerror.RPCSvrException(rpc, EOFError("EOF"))
+            return functools.partial(self.send_message, error.get_reply_msg())
+        except Exception as exception:
+            if self.debug:
+                logger.debug("%s: Got unexpected exception in reader_handle_message: %s",
+                             str(self), str(exception))
+            error = ncerror.RPCSvrException(rpc, exception)
+            return functools.partial(self.send_message, error.get_reply_msg())
 
 
 class NetconfMethods(object):
@@ -390,6 +536,9 @@ class NetconfMethods(object):
 
     The server return not-implemented if the method is not found in the methods object,
     so feel free to use duck-typing here (i.e., no need to inherit)
+
+    When served by netconf.aioserver.AsyncNetconfSSHServer the rpc_X methods
+    may also be coroutine functions.
     """
 
     def nc_append_capabilities(self, capabilities):  # pylint: disable=W0613
@@ -436,27 +585,68 @@ class NetconfSSHServer(sshutil.server.SSHServer):
     def __del__(self):
         logger.error("Deleting %s", str(self))
 
-    def __init__(self, server_ctl=None, server_methods=None, port=830, host_key=None, debug=False):
+    def __init__(self,
+                 server_ctl=None,
+                 server_methods=None,
+                 port=830,
+                 host_key=None,
+                 debug=False,
+                 rpc_workers=None,
+                 max_inflight_rpcs=8,
+                 pretty_print=False,
+                 handshake_workers=8,
+                 reuse_port=False,
+                 session_id_base=1,
+                 session_id_stride=1):
         """
         server_methods is a an object that implements the Netconf RPC methods
         for the server. The method names are "rpc_X" where X is the netconf method
         with dash (-) replaced by underscore (_) e.g., rpc_get_config.
+
+        rpc_workers is the number of threads shared by all sessions to run the
+        RPC methods. If None the methods are run inline by each session reader
+        thread. max_inflight_rpcs bounds the number of RPCs of a single session
+        that may be running or waiting for their reply to be sent.
+
+        pretty_print indents the replies sent (only for reading them, it adds
+        to their size and the time to serialize them).
+
+        handshake_workers is the number of threads doing the SSH handshake of
+        new connections (see sshutil.server.SSHServer).
+
+        reuse_port lets several worker processes serve the same port (see
+        sshutil.prefork). Session ids are then kept unique across them by
+        allocating session_id_base + n * session_id_stride, the workers using
+        sshutil.prefork.session_id_base and their number as stride.
         """
         self.server_methods = server_methods if server_methods is not None else NetconfMethods()
-        self.session_id = 1
+        self.session_id = session_id_base
+        self.session_id_stride = session_id_stride
+        self.rpc_executor = None
+        if rpc_workers:
+            self.rpc_executor = futures.ThreadPoolExecutor(max_workers=rpc_workers)
+        self.max_inflight_rpcs = max_inflight_rpcs
+        self.pretty_print = pretty_print
         super(NetconfSSHServer, self).__init__(
             server_ctl,
             server_session_class=NetconfServerSession,
             port=port,
             host_key=host_key,
-            debug=debug)
+            debug=debug,
+            handshake_workers=handshake_workers,
+            reuse_port=reuse_port)
 
     def allocate_session_id(self):
         with self.lock:
             sid = self.session_id
-            self.session_id += 1
+            self.session_id += self.session_id_stride
             return sid
 
+    def close(self):
+        super(NetconfSSHServer, self).close()
+        if self.rpc_executor is not None:
+            self.rpc_executor.shutdown(wait=False)
+
     def __str__(self):
         return "NetconfSSHServer(port={})".format(self.port)
 
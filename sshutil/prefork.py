@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-#
+#
+# Copyright (c) 2016, Deutsche Telekom AG.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Pre-fork worker processes sharing a listening port
+
+Each worker runs its own server opened with reuse_port=True on the same port
+and the kernel spreads new connections among them (SO_REUSEPORT, Linux 3.9+),
+so the work done under the GIL (SSH crypto, XML) uses several cores.
+"""
+from __future__ import absolute_import, division, unicode_literals, print_function, nested_scopes
+import errno
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Session ids a worker allocates before reaching those of its respawn.
+GENERATION_SESSION_IDS = 1 << 16
+
+
+def reserve_port (port=0):
+    """Bind (without listening) a SO_REUSEPORT socket to port and return it and the port
+
+    Keeping it open while the workers run makes sure an ephemeral port (port 0)
+    is the same for all of them and is not taken by someone else in between.
+    """
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("::", port, 0, 0))
+    return sock, sock.getsockname()[1]
+
+
+def session_id_base (index, workers, generation=0):
+    """First session id of a worker, its next ones are spaced by workers
+
+    Each respawn of a worker (generation) starts past the ids of the previous
+    ones, so the ids of sessions opened before it died are not given again.
+    """
+    return 1 + index + workers * GENERATION_SESSION_IDS * generation
+
+
+class PreforkSupervisor (object):
+    """Start worker processes serving the same port and restart those that die
+
+    worker(index, workers, port, generation) is called in each child process,
+    index going from 0 to workers - 1 and generation counting the times that
+    worker was restarted (see session_id_base). It should open its server with reuse_port=True on
+    port and only return once done serving. Anything the worker needs of its
+    own (e.g. sessions towards a backend) must be created in the worker, after
+    the fork.
+    """
+
+    # A worker dying sooner than this after being started is restarted late.
+    min_uptime = 1.0
+
+    def __init__ (self, worker, workers, port=0, debug=False, respawn=True):
+        assert workers > 0
+        self.worker = worker
+        self.workers = workers
+        self.debug = debug
+        self.respawn = respawn
+        self.stopping = False
+        self.reserve_socket, self.port = reserve_port(port)
+        # pid -> (index, start time)
+        self.children = {}
+        # Times each worker was started, minus one
+        self.generations = [-1] * workers
+
+    def __str__ (self):
+        return "PreforkSupervisor(port={}, workers={})".format(self.port, self.workers)
+
+    def _spawn (self, index):
+        self.generations[index] += 1
+        pid = os.fork()
+        if pid:
+            self.children[pid] = (index, time.time())
+            if self.debug:
+                logger.debug("%s: Started worker %d generation %d pid %d", str(self), index,
+                             self.generations[index], pid)
+            return
+
+        # Worker process
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            self.reserve_socket.close()
+            self.worker(index, self.workers, self.port, self.generations[index])
+        except Exception as error:
+            logger.error("%s: Worker %d failed: %s", str(self), index, str(error))
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)  # pylint: disable=W0212
+
+    def _signal_stop (self, unused_signum, unused_frame):
+        self.stop()
+
+    def _signal_forward (self, signum, unused_frame):
+        # e.g. SIGHUP asking the workers to reload their configuration
+        self.kill(signum)
+
+    def kill (self, signum):
+        "Send a signal to every worker"
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except OSError as error:
+                if error.errno != errno.ESRCH:
+                    raise
+
+    def stop (self):
+        "Stop the workers, run() returns once they have all exited"
+        self.stopping = True
+        self.kill(signal.SIGTERM)
+
+    def run (self):
+        """Start the workers and supervise them until stopped (SIGTERM/SIGINT)
+
+        SIGHUP is forwarded to the workers.
+        """
+        previous = [signal.signal(signal.SIGTERM, self._signal_stop),
+                    signal.signal(signal.SIGINT, self._signal_stop),
+                    signal.signal(signal.SIGHUP, self._signal_forward)]
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except OSError as error:
+                    if error.errno == errno.EINTR:
+                        continue
+                    if error.errno == errno.ECHILD:
+                        break
+                    raise
+
+                index, started = self.children.pop(pid)
+                if self.stopping or not self.respawn:
+                    continue
+                logger.error("%s: Worker %d pid %d exited with status %d, restarting it",
+                             str(self), index, pid, status)
+                if time.time() - started < self.min_uptime:
+                    time.sleep(self.min_uptime)
+                if not self.stopping:
+                    self._spawn(index)
+        finally:
+            signal.signal(signal.SIGTERM, previous[0])
+            signal.signal(signal.SIGINT, previous[1])
+            signal.signal(signal.SIGHUP, previous[2])
+            self.reserve_socket.close()
@@ -24,11 +24,16 @@ import select
 import socket
 import threading
 import traceback
+from concurrent import futures
 import paramiko as ssh
 
 
 logger = logging.getLogger(__name__)
 
+# Seconds an accept of channels waits before checking the connection is
+# still up, in case its end was missed (no channel is opened meanwhile).
+ACCEPT_TIMEOUT = 60
+
 
 class SSHUserPassController (ssh.ServerInterface):
     def __init__ (self, username=None, password=None):
@@ -54,7 +59,11 @@ class SSHUserPassController (ssh.ServerInterface):
 
     def check_channel_subsystem_request (self, channel, name):
         self.event.set()
-        return name == "netconf"
+        # netconf@<name> lets the server pick e.g. a backend device
+        if name != "netconf" and not name.startswith("netconf@"):
+            return False
+        channel.netconf_subsystem = name
+        return True
 
 
 class SSHServerSession (object):
@@ -235,9 +244,17 @@ class SSHServerSocket (object):
             # Closing one of these should cause a blocking accept to exit
             if self.ssh:
                 logger.debug("%s: close closing ssh conn %s", str(self), str(self.ssh))
-                self.ssh.close()
+                ssh_conn = self.ssh
+                ssh_conn.close()
                 self.ssh = None
 
+                # The transport only wakes up accept when it ends, it may have
+                # ended already so wake it up here too (else ACCEPT_TIMEOUT does).
+                accept_cv = getattr(ssh_conn, "server_accept_cv", None)
+                if accept_cv is not None:
+                    with ssh_conn.lock:
+                        accept_cv.notify_all()
+
             if self.client_socket:
                 logger.debug("%s: close closing client socket %s",
                              str(self),
@@ -265,9 +282,13 @@ class SSHServerSocket (object):
                 if self.debug:
                     logger.debug("%s: Accepting channel connections", str(self))
 
-                # accept with 1s timeout, this doesn't return when we close the connection for some
-                # reason so we cannot just simply wait forever which would be preferable.
-                channel = ssh_conn.accept(timeout=1)
+                # Wait for the next channel without polling, paramiko wakes us up when the
+                # connection ends and close() does when we close it. Both may happen
+                # between is_active() and accept(), so the wait is bound anyway.
+                if not ssh_conn.is_active():
+                    channel = None
+                else:
+                    channel = ssh_conn.accept(ACCEPT_TIMEOUT)
 
                 with self.lock:
                     if not self.running:
@@ -285,10 +306,8 @@ class SSHServerSocket (object):
                             self.running = False
                             return
 
-                        # We can't warn here if we are doing timeouts see above.
-                        # logger.warn("%s: Got channel as None still active.", str(self))
                         if self.debug:
-                            logger.debug("%s: Got channel as None must be timeout.", str(self))
+                            logger.debug("%s: Got channel as None still active.", str(self))
                         continue
 
                 session = self.session_class(channel, self.server, self.extra_args, self.debug)
@@ -326,7 +345,20 @@ class SSHServer (object):
                   extra_args=None,
                   port=None,
                   host_key=None,
-                  debug=False):
+                  debug=False,
+                  handshake_workers=8,
+                  max_pending_handshakes=128,
+                  reuse_port=False):
+        """
+        SSH handshakes of new connections are run by a pool of handshake_workers
+        threads so a slow client does not delay the next ones. At most
+        max_pending_handshakes connections are handshaking or waiting to, further
+        clients wait in the listen backlog.
+
+        With reuse_port the listening socket is opened with SO_REUSEPORT so
+        several processes can serve the same port, the kernel spreading the new
+        connections among them (see sshutil.prefork).
+        """
 
         if server_ctl is None:
             server_ctl = SSHUserPassController()
@@ -359,11 +391,17 @@ class SSHServer (object):
                     self.host_key = ssh.RSAKey.from_private_key_file(keypath)
                     break
 
+        self.handshake_executor = futures.ThreadPoolExecutor(max_workers=handshake_workers)
+        self.handshake_sem = threading.BoundedSemaphore(max_pending_handshakes)
+        self.closing = False
+
         # Bind first to IPv6, if the OS supports binding per AF then the IPv4
         # will succeed, otherwise the IPv6 will support both AF.
         for pname, host, proto in [ ("IPv6", '::', socket.AF_INET6), ("IPv4", '', socket.AF_INET) ]:
             protosocket = socket.socket(proto, socket.SOCK_STREAM)
             protosocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                protosocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
             if self.debug:
                 logger.debug("Server binding to proto %s port %s", str(pname), str(port))
             if proto == socket.AF_INET:
@@ -404,11 +442,19 @@ class SSHServer (object):
             self.thread.daemon = True
             self.thread.start()
 
+            # SO_REUSEPORT lets the IPv4 bind succeed on the port of a dual
+            # stack IPv6 socket, which already gets the IPv4 connections.
+            if reuse_port and proto == socket.AF_INET6 and \
+                    not protosocket.getsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY):
+                break
+
     def close (self):
         with self.lock:
             logger.info("Sending close signal to accept socket")
             assert self.thread.is_alive()
+            self.closing = True
             self.close_wsocket.send(b"!")
+        self.handshake_executor.shutdown(wait=False)
 
     def join (self):
         "Wait on server to terminate"
@@ -467,22 +513,15 @@ class SSHServer (object):
                 if proto_sock in rfds:
                     client, addr = proto_sock.accept()
                     logger.debug("%s: Client accepted: %s: %s", str(self), str(client), str(addr))
+
+                    # The handshake is run by the pool, back to accepting right away.
+                    self.handshake_sem.acquire()
                     try:
-                        sock = self.server_socket_class(self.server_ctl,
-                                                        self.server_session_class,
-                                                        self.extra_args,
-                                                        self,
-                                                        client,
-                                                        addr,
-                                                        self.debug)
-                        with self.lock:
-                            self.sockets.append(sock)
-                    except ssh.AuthenticationException as error:
-                        logger.debug("%s: Client auth failed: %s: %s: %s",
-                                     str(self),
-                                     str(client),
-                                     str(addr),
-                                     str(error))
+                        self.handshake_executor.submit(self._handshake, client, addr)
+                    except RuntimeError:
+                        # Executor was shutdown under us.
+                        self.handshake_sem.release()
+                        client.close()
 
         except Exception as error:
             if self.debug:
@@ -495,6 +534,37 @@ class SSHServer (object):
                              str(self),
                              str(error))
 
+    def _handshake (self, client, addr):
+        """Called from a handshake worker to set up the SSH connection of a client."""
+        try:
+            sock = self.server_socket_class(self.server_ctl,
+                                            self.server_session_class,
+                                            self.extra_args,
+                                            self,
+                                            client,
+                                            addr,
+                                            self.debug)
+            with self.lock:
+                closing = self.closing
+                if not closing:
+                    self.sockets.append(sock)
+            if closing:
+                sock.close()
+        except ssh.AuthenticationException as error:
+            logger.debug("%s: Client auth failed: %s: %s: %s",
+                         str(self),
+                         str(client),
+                         str(addr),
+                         str(error))
+        except Exception as error:
+            logger.error("%s: Client handshake failed: %s: %s",
+                         str(self),
+                         str(addr),
+                         str(error))
+            client.close()
+        finally:
+            self.handshake_sem.release()
+
     def __str__ (self):
         return "SSHServer(port={})".format(self.port)
 
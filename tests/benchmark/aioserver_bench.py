@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Compares the threaded and the asyncio Netconf servers with many idle sessions.
+
+For each mode and number of sessions a server is started in a child process,
+the sessions are opened and left idle, then the thread count and resident
+memory of the server are read from /proc and get RPCs are sent over randomly
+chosen sessions to measure latency.
+
+Use: python tests/benchmark/aioserver_bench.py [--modes threads asyncio]
+                                               [--rpcs N] [sessions ...]
+"""
+from __future__ import print_function
+
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import asyncssh
+
+BASEDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+HOST_KEY = os.path.join(BASEDIR, "keys", "host_key")
+USER = "bench"
+PASSWORD = "bench"
+
+HELLO = (b'<?xml version="1.0" encoding="UTF-8"?>'
+         b'<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+         b'<capability>urn:ietf:params:netconf:base:1.0</capability>'
+         b'</capabilities></hello>]]>]]>')
+GET = (b'<?xml version="1.0" encoding="UTF-8"?>'
+       b'<rpc xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1"><get/></rpc>]]>]]>')
+
+
+def raise_nofile():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def serve(mode):
+    """Child process: run a server and print its port"""
+    sys.path.insert(0, BASEDIR)
+    from netconf import server, util
+    from sshutil.server import SSHUserPassController
+
+    class Methods(server.NetconfMethods):
+        def rpc_get(self, session, rpc, filter_or_none):
+            return util.elm("data")
+
+    raise_nofile()
+    ctl = SSHUserPassController(USER, PASSWORD)
+    if mode == "threads":
+        srv = server.NetconfSSHServer(ctl, Methods(), 0, HOST_KEY, rpc_workers=16)
+        print(srv.port)
+        sys.stdout.flush()
+        while True:
+            time.sleep(3600)
+
+    from netconf import aioserver
+    srv = aioserver.AsyncNetconfSSHServer(ctl, Methods(), 0, HOST_KEY)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(srv.start())
+    print(srv.port)
+    sys.stdout.flush()
+    loop.run_forever()
+
+
+def proc_status(pid):
+    status = {}
+    with open("/proc/{}/status".format(pid)) as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            status[key] = value.strip()
+    return int(status["Threads"]), int(status["VmRSS"].split()[0]) // 1024
+
+
+class Session(object):
+
+    def __init__(self, conn, stdin, stdout):
+        self.conn = conn
+        self.stdin = stdin
+        self.stdout = stdout
+
+    async def receive(self):
+        return await self.stdout.readuntil(b"]]>]]>")
+
+    async def get(self):
+        self.stdin.write(GET)
+        await self.receive()
+
+
+async def open_session(port, limit):
+    async with limit:
+        conn = await asyncssh.connect("127.0.0.1", port, username=USER, password=PASSWORD,
+                                      known_hosts=None)
+        stdin, stdout, _ = await conn.open_session(subsystem="netconf", encoding=None)
+        session = Session(conn, stdin, stdout)
+        await session.receive()
+        stdin.write(HELLO)
+        return session
+
+
+async def run_clients(pid, port, count, rpcs):
+    limit = asyncio.Semaphore(64)
+    start = time.time()
+    sessions = await asyncio.gather(*[open_session(port, limit) for _ in range(count)])
+    opened = time.time() - start
+
+    await asyncio.sleep(1)
+    threads, rss = proc_status(pid)
+
+    latencies = []
+    for _ in range(rpcs):
+        session = random.choice(sessions)
+        start = time.time()
+        await session.get()
+        latencies.append(time.time() - start)
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    for session in sessions:
+        session.conn.close()
+    await asyncio.gather(*[x.conn.wait_closed() for x in sessions])
+    return opened, threads, rss, p99
+
+
+def bench(mode, count, rpcs):
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode],
+                             stdout=subprocess.PIPE)
+    try:
+        port = int(child.stdout.readline())
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run_clients(child.pid, port, count, rpcs))
+        finally:
+            loop.close()
+    finally:
+        child.kill()
+        child.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Netconf server scaling benchmark")
+    parser.add_argument("--serve", choices=["threads", "asyncio"], help=argparse.SUPPRESS)
+    parser.add_argument("--modes", nargs="+", choices=["threads", "asyncio"],
+                        default=["threads", "asyncio"])
+    parser.add_argument("--rpcs", type=int, default=1000, help="get RPCs sent to measure latency")
+    parser.add_argument("sessions", type=int, nargs="*", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    raise_nofile()
+    for count in args.sessions:
+        for mode in args.modes:
+            try:
+                opened, threads, rss, p99 = bench(mode, count, args.rpcs)
+            except Exception as error:
+                print("{:8} {:5} sessions: failed: {}".format(mode, count, error))
+                continue
+            print("{:8} {:5} sessions: opened in {:7.2f}s  threads {:6}  rss {:6} MB  p99 {:7.2f} ms".format(
+                mode, count, opened, threads, rss, p99 * 1000))
+
+
+if __name__ == "__main__":
+    main()
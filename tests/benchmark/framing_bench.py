@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measures receiving Netconf 1.0 and 1.1 framed messages of growing size.
+
+The stream hands out data in pieces of at most 32 KB, as an SSH channel
+does. The receive buffer is compared with the previous implementation
+(bytes concatenation and slicing), which is only run up to --legacy-max
+bytes since it is quadratic.
+
+Use: python tests/benchmark/framing_bench.py [--legacy-max BYTES] [size ...]
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from netconf import MAXSSHBUF
+from netconf.base import NetconfFramingTransport
+
+PIECE = 32 * 1024
+
+
+class FakeChannel(object):
+    """recv only stream, as a paramiko Channel"""
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def recv(self, size):
+        size = min(size, PIECE)
+        data = self.data[self.pos:self.pos + size].tobytes()
+        self.pos += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class FakeSocket(FakeChannel):
+    """Stream providing recv_into, as a socket"""
+
+    def recv_into(self, buf):
+        size = min(len(buf), PIECE, len(self.data) - self.pos)
+        buf[:size] = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return size
+
+
+class LegacyFramingTransport(NetconfFramingTransport):
+    """Receive code as it was before the receive buffer"""
+
+    def __init__(self, stream, max_chunk, debug):
+        super(LegacyFramingTransport, self).__init__(stream, max_chunk, debug)
+        self.rbuffer = b""
+
+    def receive_pdu(self, new_framing):
+        if new_framing:
+            return self._legacy_receive_11()
+        return self._legacy_receive_10()
+
+    def _legacy_receive_10(self):
+        searchfrom = 0
+        while True:
+            eomidx = self.rbuffer.find(b"]]>]]>", searchfrom)
+            if eomidx != -1:
+                break
+            searchfrom = max(0, len(self.rbuffer) - 5)
+            buf = self.stream.recv(self.max_chunk)
+            self.rbuffer += buf
+
+        msg = self.rbuffer[:eomidx]
+        self.rbuffer = self.rbuffer[eomidx + 6:]
+        return msg.decode('utf-8')
+
+    def _legacy_receive_chunk(self):
+        while len(self.rbuffer) < 4:
+            self.rbuffer += self.stream.recv(self.max_chunk)
+        self.rbuffer = self.rbuffer[2:]
+
+        idx = -1
+        searchfrom = 0
+        while True:
+            idx = self.rbuffer.find(b"\n", searchfrom)
+            if 12 > idx > 0:
+                break
+            searchfrom = len(self.rbuffer)
+            self.rbuffer += self.stream.recv(self.max_chunk)
+
+        if self.rbuffer[0:2] == b"#\n":
+            self.rbuffer = self.rbuffer[2:]
+            return None
+
+        chunklen = int(self.rbuffer[:idx])
+        self.rbuffer = bytes(self.rbuffer[idx + 1:])
+
+        while True:
+            if len(self.rbuffer) >= chunklen:
+                chunk = self.rbuffer[:chunklen]
+                self.rbuffer = self.rbuffer[chunklen:]
+                return chunk
+            self.rbuffer += self.stream.recv(self.max_chunk)
+
+    def _legacy_receive_11(self):
+        chunks = []
+        chunk = self._legacy_receive_chunk()
+        while chunk:
+            chunks.append(chunk)
+            chunk = self._legacy_receive_chunk()
+        return b"".join(chunks).decode('utf-8')
+
+
+def message(size):
+    entry = b"<element><name>address</name><subnet>10.0.0.0 255.255.255.0</subnet></element>\n"
+    return (entry * (size // len(entry) + 1))[:size]
+
+
+def frame(msg, framing):
+    if framing == "1.0":
+        return msg + b"]]>]]>"
+    if framing == "1.1":
+        # Single chunk, as sent by most clients
+        return "\n#{}\n".format(len(msg)).encode('utf-8') + msg + b"\n##\n"
+    chunks = []
+    for i in range(0, len(msg), MAXSSHBUF):
+        chunk = msg[i:i + MAXSSHBUF]
+        chunks.append("\n#{}\n".format(len(chunk)).encode('utf-8') + chunk)
+    return b"".join(chunks) + b"\n##\n"
+
+
+def bench(transport_class, stream_class, data, new_framing):
+    transport = transport_class(stream_class(data), MAXSSHBUF, False)
+    gc.collect()
+    start = time.time()
+    msg = transport.receive_pdu(new_framing)
+    elapsed = time.time() - start
+    transport.stream = None
+    return elapsed, len(msg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Netconf framing benchmark")
+    parser.add_argument("--legacy-max", type=int, default=10 * 1024 * 1024,
+                        help="Largest message received with the previous implementation")
+    parser.add_argument("sizes", type=int, nargs="*",
+                        default=[1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024])
+    args = parser.parse_args()
+
+    for framing in ["1.0", "1.1", "1.1/16K"]:
+        for size in args.sizes:
+            data = frame(message(size), framing)
+            new_framing = framing != "1.0"
+
+            channel_time, received = bench(NetconfFramingTransport, FakeChannel, data, new_framing)
+            assert received == size
+            socket_time, received = bench(NetconfFramingTransport, FakeSocket, data, new_framing)
+            assert received == size
+
+            line = "{:8} {:>10} bytes: recv {:8.4f}s  recv_into {:8.4f}s".format(
+                framing, size, channel_time, socket_time)
+            if size <= args.legacy_max:
+                legacy_time, received = bench(LegacyFramingTransport, FakeChannel, data, new_framing)
+                assert received == size
+                line += "  legacy {:8.4f}s  speedup {:7.2f}x".format(legacy_time, legacy_time / channel_time)
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Compares Json2Yang and IterativeJson2Yang on synthetic FortiGate tables.
+
+Use: python tests/benchmark/json2yang_bench.py [entries ...]
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from lxml import etree
+
+from yang2rest.json2yang import Json2Yang, IterativeJson2Yang
+
+
+def address_table(entries):
+    return [{'name': 'address{}'.format(i),
+             'q_origin_key': 'address{}'.format(i),
+             'uuid': '6b3c5c4e-{:04x}-51e8-1c3b-a5a5d2c3f1e1'.format(i % 0xffff),
+             'subnet': '10.{}.{}.0 255.255.255.0'.format(i // 256 % 256, i % 256),
+             'type': 'ipmask',
+             'comment': '',
+             'visibility': 'enable',
+             'associated-interface': '',
+             'color': 0,
+             'tagging': [],
+             'list': []} for i in range(entries)]
+
+
+def policy_table(entries):
+    return [{'policyid': i,
+             'name': 'policy{}'.format(i),
+             'srcintf': [{'name': 'port1'}],
+             'dstintf': [{'name': 'port2'}],
+             'srcaddr': [{'name': 'address{}'.format(i)}, {'name': 'all'}],
+             'dstaddr': [{'name': 'all'}],
+             'action': 'accept',
+             'status': 'enable',
+             'schedule': 'always',
+             'service': [{'name': 'HTTP'}, {'name': 'HTTPS'}],
+             'logtraffic': 'utm',
+             'nat': 'disable',
+             'comments': ''} for i in range(entries)]
+
+
+def bench(engine, structure):
+    gc.collect()
+    start = time.time()
+    nodes = engine().convert_structure(structure)
+    return time.time() - start, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON to YANG conversion benchmark")
+    parser.add_argument("sizes", type=int, nargs="*", default=[1000, 10000, 50000],
+                        help="Number of entries of the tables")
+    sizes = parser.parse_args().sizes
+
+    for table_name, builder in [("firewall/address", address_table),
+                                ("firewall/policy", policy_table)]:
+        for entries in sizes:
+            structure = builder(entries)
+            recursive_time, recursive_nodes = bench(Json2Yang, structure)
+            iterative_time, iterative_nodes = bench(IterativeJson2Yang, structure)
+
+            identical = ([etree.tostring(x) for x in recursive_nodes] ==
+                         [etree.tostring(x) for x in iterative_nodes])
+
+            print("{:18} {:>7} entries: recursive {:8.3f}s  iterative {:8.3f}s  "
+                  "speedup {:5.2f}x  identical: {}".format(table_name, entries,
+                                                           recursive_time, iterative_time,
+                                                           recursive_time / iterative_time,
+                                                           identical))
+
+
+if __name__ == "__main__":
+    main()
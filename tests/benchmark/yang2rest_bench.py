@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measures Yang2RestConverter on the tests/unit_test/yangrest_tester.py requests
+scaled up to many entries, comparing the single pass YangUtil.walk with the
+previous translation that scanned the subtree once per extracted item.
+
+Use: python tests/benchmark/yang2rest_bench.py [entries ...]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from lxml import etree
+
+from yang2rest.yang2restconverter import Yang2RestConverter, YangUtil
+
+CREATE_OBJECT = """
+      <cmdb xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+        <webfilter>
+           <urlfilter mkey="id" nc:operation="create">
+             <id>1</id>
+             <comment></comment>
+             <one-arm-ips-urlfilter>disable</one-arm-ips-urlfilter>
+             <ip-addr-block>disable</ip-addr-block>
+             <entries>{0}</entries>
+           </urlfilter>
+        </webfilter>
+      </cmdb>"""
+
+CREATE_CHILD_OBJECT = """
+      <cmdb xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+        <webfilter>
+           <urlfilter mkey="id">
+             <id>1</id>
+             <entries nc:operation="create" mkey="id">
+               <id>48</id>
+               {0}
+             </entries>
+           </urlfilter>
+        </webfilter>
+      </cmdb>"""
+
+GET_CHILD_OBJECT = """
+      <cmdb xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+        <webfilter>
+           <urlfilter mkey="id">
+             <id>1</id>
+             <entries mkey="id">
+               <id>48</id>
+             </entries>
+             {0}
+           </urlfilter>
+        </webfilter>
+      </cmdb>"""
+
+
+def entries(count):
+    return "".join("<entry><id>{0}</id><url>www.test{0}.com</url><action>block</action></entry>"
+                   .format(i) for i in range(count))
+
+
+def leaves(count):
+    return "".join("<attr{0}>value{0}</attr{0}>".format(i) for i in range(count))
+
+
+def legacy_name_content_operation(netconf_data):
+    # Translation before YangUtil.walk, kept to compare against
+    operation = None
+    try:
+        operation = YangUtil.extract_operation(netconf_data)
+    except Exception:
+        pass
+
+    path = ""
+    while not YangUtil.contains_operation(netconf_data):
+        path += "/" + YangUtil.remove_urn(netconf_data.tag)
+        if YangUtil.contains_mkey(netconf_data):
+            path += "/" + YangUtil.extract_mkey(netconf_data)
+            if len(netconf_data) > 1:
+                netconf_data = netconf_data[1]
+            else:
+                break
+        else:
+            if len(netconf_data) > 0:
+                netconf_data = netconf_data[0]
+            else:
+                break
+    if YangUtil.contains_operation(netconf_data):
+        path += "/" + YangUtil.remove_urn(netconf_data.tag)
+
+    content = YangUtil.extract_content_under_operation(netconf_data)
+    return path, content, operation
+
+
+class LegacyYang2RestConverter(Yang2RestConverter):
+
+    def _extract_name_content_operation(self, netconf_data, leaf_path=False):
+        # The legacy walk always stops at the operation element
+        return legacy_name_content_operation(netconf_data) + (None,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Netconf to REST translation benchmark")
+    parser.add_argument("sizes", type=int, nargs="*", default=[10, 100, 1000, 10000],
+                        help="Number of entries or leaves of the requests")
+    sizes = parser.parse_args().sizes
+    walk = Yang2RestConverter()
+    legacy = LegacyYang2RestConverter()
+
+    for name, template, builder in [("create-object", CREATE_OBJECT, entries),
+                                    ("create-child-object", CREATE_CHILD_OBJECT, leaves),
+                                    ("get-child-object", GET_CHILD_OBJECT, entries)]:
+        for size in sizes:
+            root = etree.fromstring(template.format(builder(size)))
+            number = max(1, 20000 // size)
+
+            assert walk.extract_url_content_operation(root) == \
+                legacy.extract_url_content_operation(root)
+
+            walk_time = timeit.timeit(lambda: walk.extract_url_content_operation(root),
+                                      number=number) / number
+            legacy_time = timeit.timeit(lambda: legacy.extract_url_content_operation(root),
+                                        number=number) / number
+
+            print("{:20} {:>6} items: previous {:10.1f}us  single pass {:10.1f}us  "
+                  "speedup {:5.2f}x".format(name, size, legacy_time * 1e6, walk_time * 1e6,
+                                            legacy_time / walk_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import time
+
+from lxml import etree
+
+from netconf import NSMAP, util
+from netconf.aioserver import AsyncFramingTransport, AsyncNetconfSSHServer, _SSHServer
+from netconf.error import ChannelClosed, FramingError, SessionError
+from netconf.server import NetconfMethods
+from sshutil.server import SSHUserPassController
+
+HELLO = (b'<hello xmlns="urn:ietf:params:xml:ns:netconf:base:1.0"><capabilities>'
+         b'<capability>urn:ietf:params:netconf:base:1.0</capability>'
+         b'</capabilities></hello>]]>]]>')
+
+
+class FakeReader(object):
+
+    def __init__(self, data, piece=7):
+        self.data = data
+        self.piece = piece
+
+    async def read(self, size):
+        data = self.data[:min(size, self.piece)]
+        self.data = self.data[len(data):]
+        return data
+
+
+class FakeWriter(object):
+
+    def __init__(self):
+        self.data = bytearray()
+        self.drains = 0
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drains += 1
+
+
+class FakeProcess(object):
+    # asyncssh SSHServerProcess of a client sending data and then closing the channel
+
+    subsystem = "netconf"
+
+    def __init__(self, data):
+        self.stdin = FakeReader(data, 4096)
+        self.stdout = FakeWriter()
+        self.exit_status = None
+
+    def get_extra_info(self, name):
+        return "admin" if name == "username" else None
+
+    def close(self):
+        pass
+
+    def exit(self, status):
+        self.exit_status = status
+
+
+class Methods(NetconfMethods):
+    # get sleeps the seconds of its filter, edit-config and get-config are coroutines
+
+    def __init__(self):
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def rpc_get(self, session, rpc, filter_or_none):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        delay = float(filter_or_none.text) if filter_or_none is not None else 0
+        self.events.append(("get start", rpc.get("message-id")))
+        time.sleep(delay)
+        self.events.append(("get end", rpc.get("message-id")))
+        with self.lock:
+            self.running -= 1
+        return util.elm("data")
+
+    async def rpc_get_config(self, session, rpc, *unused_params):
+        data = util.elm("data")
+        for i in range(10000):
+            util.subelm(data, "entry").text = str(i)
+        return data
+
+    async def rpc_edit_config(self, session, rpc, *unused_params):
+        self.events.append(("edit start", rpc.get("message-id")))
+        await asyncio.sleep(0.05)
+        self.events.append(("edit end", rpc.get("message-id")))
+        return etree.Element("ok")
+
+
+def _rpc(msg_id, body):
+    return ('<rpc xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="{}">{}</rpc>'
+            ']]>]]>'.format(msg_id, body)).encode('utf-8')
+
+
+def _session(rpcs, methods=None, max_inflight_rpcs=8):
+    """Runs a session with the rpcs sent by the client, returns its hello, replies and process"""
+    server = AsyncNetconfSSHServer(server_methods=methods or Methods(),
+                                   max_inflight_rpcs=max_inflight_rpcs)
+    process = FakeProcess(HELLO + b"".join(rpcs))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(server._run_session(process))
+    finally:
+        loop.close()
+        server.rpc_executor.shutdown()
+
+    messages = [etree.fromstring(x) for x in bytes(process.stdout.data).split(b"]]>]]>")[:-1]]
+    return messages[0], messages[1:], process
+
+
+def _receive(data, new_framing, count=1):
+    transport = AsyncFramingTransport(FakeReader(data), None, 100)
+
+    async def receive():
+        return [await transport.receive_pdu_tree(new_framing) for _ in range(count)]
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(receive())
+    finally:
+        loop.close()
+
+
+def test_messages_are_parsed_as_received():
+    msgs = _receive(b"<a><b>1</b></a>]]>]]><c/>]]>]]>", False, 2)
+    assert [x.tag for x in msgs] == ["a", "c"]
+
+    msgs = _receive(b"\n#4\n<a><\n#5\nb/></\n#2\na>\n##\n\n#4\n<c/>\n##\n", True, 2)
+    assert [x.tag for x in msgs] == ["a", "c"]
+    assert msgs[0][0].tag == "b"
+
+
+def test_bad_messages():
+    for data, new_framing, error in [(b"<a></b>]]>]]>", False, SessionError),
+                                     (b"\n#x\n<a/>\n##\n", True, FramingError),
+                                     (b"\n#12345678901234\n", True, FramingError),
+                                     (b"<a/>", False, ChannelClosed)]:
+        try:
+            _receive(data, new_framing)
+        except error:
+            pass
+        else:
+            assert False, data
+
+
+def test_hello_and_replies_in_order():
+    hello, replies, process = _session([_rpc(1, "<get><filter>0.2</filter></get>"),
+                                        _rpc(2, "<get/>"),
+                                        _rpc(3, "<get-config><source><running/></source></get-config>"),
+                                        _rpc(4, "<close-session/>"),
+                                        _rpc(5, "<get/>")])
+
+    assert hello.findtext("nc:session-id", namespaces=NSMAP) == "1"
+    # Replies follow the rpcs, the coroutine handler answered too
+    assert [x.get("message-id") for x in replies] == ["1", "2", "3", "4"]
+    assert len(replies[2].find("nc:data", namespaces=NSMAP)) == 10000
+    assert replies[3].find("nc:ok", namespaces=NSMAP) is not None
+    assert process.exit_status == 0
+
+
+def test_barriers_wait_for_the_rpcs_before_and_after_them():
+    methods = Methods()
+    _, replies, _ = _session([_rpc(1, "<get><filter>0.1</filter></get>"),
+                              _rpc(2, "<edit-config><target><running/></target><config/></edit-config>"),
+                              _rpc(3, "<get/>")], methods)
+
+    assert [x.get("message-id") for x in replies] == ["1", "2", "3"]
+    assert methods.events == [("get start", "1"), ("get end", "1"),
+                              ("edit start", "2"), ("edit end", "2"),
+                              ("get start", "3"), ("get end", "3")]
+
+
+def test_rpcs_in_flight_are_bounded():
+    methods = Methods()
+    _, replies, _ = _session([_rpc(i, "<get><filter>0.05</filter></get>") for i in range(8)],
+                             methods, max_inflight_rpcs=2)
+
+    assert len(replies) == 8
+    assert methods.max_running == 2
+
+
+def test_large_replies_are_drained_while_written():
+    _, replies, process = _session([_rpc(1, "<get-config><source><running/></source></get-config>")])
+
+    assert len(replies) == 1
+    # Hello and one drain per chunk of the reply
+    assert process.stdout.drains > len(process.stdout.data) // (16 * 1024)
+
+
+def test_password_authentication():
+    ssh_server = _SSHServer(SSHUserPassController("admin", "secret"))
+
+    assert ssh_server.password_auth_supported()
+    assert ssh_server.validate_password("admin", "secret")
+    assert not ssh_server.validate_password("admin", "wrong")
+    assert not ssh_server.validate_password("other", "secret")
+
+
+if __name__ == "__main__":
+    test_messages_are_parsed_as_received()
+    test_bad_messages()
+    test_hello_and_replies_in_order()
+    test_barriers_wait_for_the_rpcs_before_and_after_them()
+    test_rpcs_in_flight_are_bounded()
+    test_large_replies_are_drained_while_written()
+    test_password_authentication()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,173 @@
+import threading
+import time
+from concurrent import futures
+
+from lxml import etree
+
+from yang2rest.bulkedit import BulkEdit, plan_waves, split_config, APPLIED, FAILED, SKIPPED, ROLLED_BACK, \
+    CONTINUE_ON_ERROR, ROLLBACK_ON_ERROR, STOP_ON_ERROR
+from yang2rest.restcache import RestResponseCache
+from yang2rest.restcaller import RestCaller
+
+NC = 'xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0"'
+
+
+class FakeFortiOSAPI(object):
+    # Objects named 'bad' are refused
+
+    def __init__(self):
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def _call(self, method, path, name, data):
+        with self.lock:
+            self.calls.append((method, path + '/' + name, dict(data or {})))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        if data and data.get('name') == 'bad':
+            return {'http_status': 500, 'status': 'error'}
+        return {'http_status': 200, 'status': 'success'}
+
+    def get(self, path, name, vdom=None, mkey=None, parameters=None):
+        self._call('get', path, name, None)
+        return {'http_status': 200, 'results': [{'name': name, 'comment': 'before'}]}
+
+    def post(self, path, name, data=None, vdom=None):
+        return self._call('post', path, name, data)
+
+    def put(self, path, name, data=None, vdom=None):
+        return self._call('put', path, name, data)
+
+    def delete(self, path, name, data=None, vdom=None):
+        return self._call('delete', path, name, data)
+
+
+def _config(objects):
+    return etree.fromstring("<cmdb " + NC + "><firewall>" + objects + "</firewall></cmdb>")
+
+
+def _address(name, operation="create"):
+    return '<address nc:operation="{}" mkey="name"><name>{}</name><comment>new</comment></address>'.format(
+        operation, name)
+
+
+def _run(fos, objects, error_option, window=4):
+    rc = RestCaller()
+    rc.set_fos(fos)
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        return BulkEdit(rc, executor, window, error_option).run(objects)
+
+
+def test_objects_are_split():
+    objects = split_config(etree.fromstring(
+        "<cmdb " + NC + "><firewall>" + _address('a') + _address('b', 'delete') + "</firewall>"
+        '<webfilter><urlfilter mkey="id"><id>1</id>'
+        '<entries nc:operation="replace" mkey="id"><id>48</id><url>x</url></entries>'
+        "</urlfilter></webfilter></cmdb>"))
+
+    assert [(x.operation, x.url, x.path) for x in objects] == \
+        [('create', 'cmdb/firewall/address', "/cmdb/firewall/address[name='a']"),
+         ('delete', 'cmdb/firewall/address', "/cmdb/firewall/address[name='b']"),
+         ('replace', 'cmdb/webfilter/urlfilter/1/entries',
+          "/cmdb/webfilter/urlfilter[id='1']/entries[id='48']")]
+    assert objects[2].content == {'id': '48', 'url': 'x'}
+    assert objects[2].mkey_value == '48'
+
+
+def test_window_is_bounded():
+    fos = FakeFortiOSAPI()
+    objects = split_config(_config("".join(_address('a' + str(x)) for x in range(20))))
+
+    assert _run(fos, objects, STOP_ON_ERROR, window=4)
+    assert fos.max_running == 4
+    assert all(x.state == APPLIED for x in objects)
+
+
+def test_continue_on_error():
+    fos = FakeFortiOSAPI()
+    objects = split_config(_config(_address('a') + _address('bad') + _address('c')))
+
+    assert not _run(fos, objects, CONTINUE_ON_ERROR)
+    assert [x.state for x in objects] == [APPLIED, FAILED, APPLIED]
+    assert objects[1].error == 'http-result:500, error'
+
+
+def test_stop_on_error():
+    fos = FakeFortiOSAPI()
+    objects = split_config(_config(_address('bad') + _address('b') + _address('c')))
+
+    assert not _run(fos, objects, STOP_ON_ERROR, window=1)
+    assert [x.state for x in objects] == [FAILED, SKIPPED, SKIPPED]
+    assert len(fos.calls) == 1
+
+
+def test_rollback_on_error():
+    fos = FakeFortiOSAPI()
+    objects = split_config(_config(_address('a') + _address('b', 'replace') + _address('bad')))
+
+    assert not _run(fos, objects, ROLLBACK_ON_ERROR, window=1)
+    assert [x.state for x in objects] == [ROLLED_BACK, ROLLED_BACK, FAILED]
+    assert fos.calls[-2:] == [('put', 'firewall/address', {'name': 'b', 'comment': 'before'}),
+                              ('delete', 'firewall/address', {'name': 'a', 'comment': 'new'})]
+
+
+def test_waves_are_rolled_back_together():
+    fos = FakeFortiOSAPI()
+    first = split_config(_config(_address('a') + _address('b')))
+    second = split_config(_config(_address('bad')))
+    third = split_config(_config(_address('c')))
+    rc = RestCaller()
+    rc.set_fos(fos)
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        assert not BulkEdit(rc, executor, 4, ROLLBACK_ON_ERROR).run_waves([first, second, third])
+
+    assert [x.state for x in first + second + third] == [ROLLED_BACK, ROLLED_BACK, FAILED, SKIPPED]
+    assert [x[0] for x in fos.calls[-2:]] == ['delete', 'delete']
+
+
+def test_waves_follow_the_tables():
+    objects = split_config(_config(
+        _address('x', 'delete') + _address('a') +
+        '<addrgrp nc:operation="create" mkey="name"><name>g</name><member><element><name>a</name>'
+        '</element></member></addrgrp>' +
+        '<addrgrp nc:operation="delete" mkey="name"><name>h</name></addrgrp>' +
+        _address('b', 'delete') + _address('b') + _address('a', 'merge')))
+
+    waves = [[(x.operation, x.url.split('/')[-1], x.mkey_value) for x in wave] for wave in plan_waves(objects)]
+    assert waves == [[('create', 'address', 'a'), ('delete', 'address', 'b')],
+                     [('create', 'address', 'b'), ('merge', 'address', 'a')],
+                     [('create', 'addrgrp', 'g')],
+                     [('delete', 'addrgrp', 'h')],
+                     [('delete', 'address', 'x')]]
+
+
+def test_rollback_reads_fortigate():
+    fos = FakeFortiOSAPI()
+    cache = RestResponseCache({'cmdb/firewall/address': 60})
+    rc = RestCaller()
+    rc.set_fos(fos)
+    rc.set_cache(cache)
+    rc.execute_rest_call(None, 'cmdb/firewall/address/b', {})
+    objects = split_config(_config(_address('b', 'replace')))
+
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        assert BulkEdit(rc, executor, 4, ROLLBACK_ON_ERROR).run(objects)
+    assert [x[0] for x in fos.calls] == ['get', 'get', 'put']
+
+
+if __name__ == "__main__":
+    test_objects_are_split()
+    test_window_is_bounded()
+    test_continue_on_error()
+    test_stop_on_error()
+    test_rollback_on_error()
+    test_waves_are_rolled_back_together()
+    test_waves_follow_the_tables()
+    test_rollback_reads_fortigate()
+
+    print("\nAll tests finished OK")
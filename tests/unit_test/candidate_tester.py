@@ -0,0 +1,110 @@
+import threading
+import time
+
+from lxml import etree
+
+from yang2rest.bulkedit import split_config
+from yang2rest.candidate import Candidate, CandidateError, DATA_EXISTS
+
+NC = 'xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0"'
+
+
+def _objects(objects):
+    return split_config(etree.fromstring(
+        "<cmdb " + NC + "><firewall>" + "".join(objects) + "</firewall></cmdb>"))
+
+
+def _object(name, operation="create", comment=None, table="address"):
+    return '<{0} nc:operation="{1}" mkey="name"><name>{2}</name>{3}</{0}>'.format(
+        table, operation, name, "<comment>{}</comment>".format(comment) if comment else "")
+
+
+def _pending(candidate):
+    return [[(x.operation, x.mkey_value, x.content) for x in calls] for calls in candidate.changes()]
+
+
+def test_edits_of_an_object_are_collapsed():
+    candidate = Candidate()
+    candidate.edit(_objects([_object('a', comment='1'), _object('b', 'merge', '1'),
+                             _object('c', 'delete'), _object('d')]))
+    candidate.edit(_objects([_object('a', 'merge', '2'), _object('b', 'replace', '2'),
+                             _object('c', 'create', '3'), _object('d', 'delete')]))
+
+    assert _pending(candidate) == [[('create', 'a', {'name': 'a', 'comment': '2'})],
+                                   [('replace', 'b', {'name': 'b', 'comment': '2'})],
+                                   [('delete', 'c', {'name': 'c'}),
+                                    ('create', 'c', {'name': 'c', 'comment': '3'})]]
+
+    # Conflicting edits leave the candidate untouched
+    try:
+        candidate.edit(_objects([_object('e'), _object('a')]))
+        assert False
+    except CandidateError as error:
+        assert error.tag == DATA_EXISTS
+        assert error.path == "/cmdb/firewall/address[name='a']"
+    assert len(candidate) == 3
+
+
+def test_plan_orders_tables_and_deletes():
+    candidate = Candidate()
+    candidate.edit(_objects([_object('x', 'delete'), _object('a'), _object('g', table='addrgrp'),
+                             _object('b'), _object('h', 'delete', table='addrgrp')]))
+    candidate.edit(_objects([_object('x', 'create')]))
+
+    waves = [[(x.operation, x.url.split('/')[-1], x.mkey_value) for x in wave]
+             for wave in Candidate.plan(candidate.changes())]
+    assert waves == [[('delete', 'address', 'x')],
+                     [('create', 'address', 'x'), ('create', 'address', 'a'), ('create', 'address', 'b')],
+                     [('create', 'addrgrp', 'g')],
+                     [('delete', 'addrgrp', 'h')]]
+
+
+def test_candidate_view_of_a_table():
+    candidate = Candidate()
+    candidate.edit(_objects([_object('a', 'merge', 'new'), _object('b', 'delete'), _object('c')]))
+    running = [{'name': 'a', 'comment': 'old', 'subnet': '1'}, {'name': 'b'}]
+
+    assert candidate.touches('cmdb/firewall/address')
+    assert candidate.touches('cmdb/firewall/address/c')
+    assert not candidate.touches('cmdb/firewall/addrgrp')
+    assert candidate.overlay('cmdb/firewall/address', running) == \
+        [{'name': 'a', 'comment': 'new', 'subnet': '1'}, {'name': 'c'}]
+    assert candidate.overlay('cmdb/firewall/address/b', [{'name': 'b'}]) == []
+    assert running[0]['comment'] == 'old'
+
+
+def test_edits_wait_for_the_commit():
+    candidate = Candidate()
+    candidate.edit(_objects([_object('a')]))
+    edit = threading.Thread(target=candidate.edit, args=(_objects([_object('a', 'merge', 'later')]),))
+
+    with candidate.committing() as changes:
+        edit.start()
+        time.sleep(0.05)
+        assert len(changes) == 1 and edit.is_alive()
+        candidate.committed()
+    edit.join()
+
+    assert _pending(candidate) == [[('merge', 'a', {'name': 'a', 'comment': 'later'})]]
+
+
+def test_validate():
+    objects = split_config(etree.fromstring(
+        "<cmdb " + NC + '><firewall><address nc:operation="delete"><comment>x</comment></address>'
+        "</firewall></cmdb>"))
+    candidate = Candidate()
+    candidate.edit(objects)
+
+    errors = Candidate.validate(candidate.changes())
+    assert [str(x) for x in errors] == ["Delete without the key of the object"]
+    assert Candidate.validate(Candidate().changes()) == []
+
+
+if __name__ == "__main__":
+    test_edits_of_an_object_are_collapsed()
+    test_plan_orders_tables_and_deletes()
+    test_candidate_view_of_a_table()
+    test_edits_wait_for_the_commit()
+    test_validate()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,39 @@
+from yang2rest.mirror import ConfigMirror
+from yang2rest.restcaller import RestCaller
+
+
+class FakeFortiOSAPI(object):
+    # Stand-in fortiosapi.FortiOSAPI with one cmdb table (firewall
+    # address by default). reads are the paths read, calls the REST
+    # parameters given, start/count are answered a page of the table
+
+    def __init__(self, table=None):
+        if table is None:
+            table = [{'name': 'a', 'comment': '1'}, {'name': 'b', 'comment': '2'}]
+        self.table = table
+        self.reads = []
+        self.calls = []
+
+    def get(self, path, name, vdom=None, mkey=None, parameters=None):
+        self.reads.append(path + '/' + name)
+        self.calls.append(parameters)
+        if path == 'firewall/address':
+            # An object of the table
+            return {'http_status': 200, 'results': [x for x in self.table if x['name'] == name]}
+        results = list(self.table)
+        if parameters and 'start' in parameters:
+            results = results[parameters['start']:parameters['start'] + parameters['count']]
+        return {'http_status': 200, 'results': results}
+
+
+def make_rest_caller(fos):
+    # Factory of RestCaller as the ones given to ConfigMirror and RevisionProbe
+    def rest_caller():
+        rc = RestCaller()
+        rc.set_fos(fos)
+        return rc
+    return rest_caller
+
+
+def make_mirror(fos, **kwargs):
+    return ConfigMirror(make_rest_caller(fos), **kwargs)
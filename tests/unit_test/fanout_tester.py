@@ -0,0 +1,73 @@
+import time
+from concurrent import futures
+
+from lxml import etree
+
+from yang2rest.fanout import split_filter, fan_out
+from yang2rest.yang2restconverter import Yang2RestConverter
+
+
+def test_filter_is_split_per_table():
+    nc_filter = etree.fromstring("<filter><cmdb>"
+                                 "<firewall><address><name/></address><addrgrp/></firewall>"
+                                 "<system><interface/></system>"
+                                 "</cmdb></filter>")
+    subtrees = split_filter(nc_filter)
+
+    assert [x[0] for x in subtrees] == [['cmdb', 'firewall', 'address'],
+                                        ['cmdb', 'firewall', 'addrgrp'],
+                                        ['cmdb', 'system', 'interface']]
+    assert [Yang2RestConverter().extract_url_content_operation(x[1])[0] for x in subtrees] == \
+        ['cmdb/firewall/address', 'cmdb/firewall/addrgrp', 'cmdb/system/interface']
+    # The request is not modified
+    assert len(nc_filter[0][0]) == 2
+
+
+def test_single_table_is_not_copied():
+    nc_filter = etree.fromstring("<filter><cmdb><firewall><address><name/></address></firewall></cmdb></filter>")
+
+    assert split_filter(nc_filter) == [(['cmdb', 'firewall', 'address'], nc_filter[0])]
+
+
+def test_tables_are_read_concurrently_and_nested():
+    nc_filter = etree.fromstring("<filter><cmdb><firewall><address/><addrgrp/><policy/></firewall></cmdb></filter>")
+
+    def read(netconf_data):
+        time.sleep(0.2)
+        entry = etree.Element('element')
+        entry.text = netconf_data[0][0].tag
+        return [entry]
+
+    start = time.time()
+    with futures.ThreadPoolExecutor(max_workers=4) as executor:
+        result = fan_out(executor, read, split_filter(nc_filter))
+
+    assert time.time() - start < 0.4
+    assert [etree.tostring(x) for x in result] == \
+        [b"<cmdb><firewall><address><element>address</element></address>"
+         b"<addrgrp><element>addrgrp</element></addrgrp>"
+         b"<policy><element>policy</element></policy></firewall></cmdb>"]
+
+
+def test_first_error_is_raised():
+    nc_filter = etree.fromstring("<filter><cmdb><firewall><address/><addrgrp/></firewall></cmdb></filter>")
+
+    def read(netconf_data):
+        raise Exception(netconf_data[0][0].tag)
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        try:
+            fan_out(executor, read, split_filter(nc_filter))
+        except Exception as error:
+            assert str(error) == 'address'
+        else:
+            assert False
+
+
+if __name__ == "__main__":
+    test_filter_is_split_per_table()
+    test_single_table_is_not_copied()
+    test_tables_are_read_concurrently_and_nested()
+    test_first_error_is_raised()
+
+    print("\nAll tests finished OK")
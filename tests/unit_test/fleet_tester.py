@@ -0,0 +1,143 @@
+from lxml import etree
+
+from yang2rest.bulkedit import EditObject
+from yang2rest.fleet import DeviceInventory, DeviceAccessError, DeviceBusyError, UnknownDeviceError, \
+    pop_target
+
+
+class FakePool(object):
+
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        self.closed = True
+
+
+def _inventory(document):
+    return DeviceInventory(lambda: document, FakePool)
+
+
+def test_routing_precedence():
+    fleet = _inventory({'default': 'fw1',
+                        'devices': {'fw1': {'host': '10.0.0.1'},
+                                    'fw2': {'host': '10.0.0.2', 'users': ['alice']},
+                                    'fw3': {'host': '10.0.0.3'}}})
+
+    assert fleet.route().name == 'fw1'
+    assert fleet.route(username='bob').name == 'fw1'
+    assert fleet.route(username='alice').name == 'fw2'
+    assert fleet.route(username='alice', subsystem='netconf@fw3').name == 'fw3'
+    assert fleet.route(username='alice', subsystem='netconf@fw3', target='fw1').name == 'fw1'
+    try:
+        fleet.route(target='fw4')
+    except UnknownDeviceError:
+        pass
+    else:
+        assert False
+
+
+def test_devices_with_users_only_serve_them():
+    fleet = _inventory({'default': 'fw1',
+                        'devices': {'fw1': {'host': '10.0.0.1'},
+                                    'fw2': {'host': '10.0.0.2', 'users': ['alice']}}})
+
+    assert fleet.route(username='alice', target='fw1').name == 'fw1'
+    for routing in ({'target': 'fw2'}, {'subsystem': 'netconf@fw2'}):
+        try:
+            fleet.route(username='bob', **routing)
+        except DeviceAccessError:
+            pass
+        else:
+            assert False
+
+
+def test_reload_keeps_unchanged_devices():
+    document = {'devices': {'fw1': {'host': '10.0.0.1'},
+                            'fw2': {'host': '10.0.0.2'}}}
+    fleet = _inventory(document)
+    fw1 = fleet.route(target='fw1')
+    fw2 = fleet.route(target='fw2')
+
+    document['devices'] = {'fw1': {'host': '10.0.0.1'},
+                           'fw3': {'host': '10.0.0.3'}}
+    fleet.reload()
+
+    assert fleet.route(target='fw1') is fw1
+    assert fw2.pool.closed
+    assert fleet.route(target='fw3').pool.config == {'host': '10.0.0.3'}
+    try:
+        fleet.route()
+    except UnknownDeviceError:
+        pass
+    else:
+        assert False
+
+
+def test_replaced_devices_are_closed_after_their_requests():
+    document = {'devices': {'fw1': {'host': '10.0.0.1'},
+                            'fw2': {'host': '10.0.0.2'}}}
+    fleet = _inventory(document)
+    fw1 = fleet.route(target='fw1')
+    fw2 = fleet.route(target='fw2')
+    fw1.candidate.edit([EditObject.for_content('cmdb/firewall/address', 'create',
+                                               {'name': 'a'}, 'address', 'name', 'a')])
+
+    fw1.acquire()
+    fw2.hold()
+    document['devices'] = {'fw1': {'host': '10.0.0.1', 'max_rpcs': 2}}
+    fleet.reload()
+
+    assert not fw1.pool.closed and not fw2.pool.closed
+    fw1.release()
+    fw2.unhold()
+    assert fw1.pool.closed and fw2.pool.closed
+    try:
+        fw2.acquire()
+    except DeviceBusyError:
+        pass
+    else:
+        assert False
+    # Same FortiGate, the pending changes are kept
+    assert len(fleet.route(target='fw1').candidate) == 1
+
+
+def test_rpcs_per_device_are_bounded():
+    fleet = _inventory({'devices': {'fw1': {'host': '10.0.0.1', 'max_rpcs': 1}}})
+    device = fleet.route(target='fw1')
+
+    with device.slot():
+        try:
+            device.acquire(0.01)
+        except DeviceBusyError:
+            pass
+        else:
+            assert False
+    device.acquire(0.01)
+    device.release()
+
+    assert device.stats()['rejected'] == 1
+    assert device.stats()['rpcs'] == 2
+
+
+def test_target_is_removed_from_filter():
+    nc_filter = etree.fromstring("<filter><target>fw2</target><cmdb><firewall/></cmdb></filter>")
+
+    assert pop_target(nc_filter) == 'fw2'
+    assert [x.tag for x in nc_filter] == ['cmdb']
+    assert pop_target(nc_filter) is None
+
+
+if __name__ == "__main__":
+    test_routing_precedence()
+    test_devices_with_users_only_serve_them()
+    test_reload_keeps_unchanged_devices()
+    test_replaced_devices_are_closed_after_their_requests()
+    test_rpcs_per_device_are_bounded()
+    test_target_is_removed_from_filter()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,81 @@
+import threading
+
+from yang2rest.fospool import FortiOSAPIPool, PoolTimeoutError
+from yang2rest.restcaller import RestCaller
+
+
+class FakeFortiOSAPI(object):
+    instances = []
+
+    def __init__(self):
+        self.logins = 0
+        self.expired = False
+        FakeFortiOSAPI.instances.append(self)
+
+    def https(self, status):
+        self.https_status = status
+
+    def login(self, host, username, password):
+        self.logins += 1
+        self.expired = False
+
+    def logout(self):
+        pass
+
+    def get(self, path, name, vdom=None, mkey=None, parameters=None):
+        if self.expired:
+            return {'http_status': 401, 'status': 'error'}
+        return {'http_status': 200, 'results': [{'name': name}]}
+
+
+def test_sessions_are_reused():
+    FakeFortiOSAPI.instances = []
+    pool = FortiOSAPIPool(FakeFortiOSAPI, "fgt", "admin", "", size=2, keepalive=0)
+
+    rc = RestCaller()
+    rc.set_fos(pool)
+    for _ in range(10):
+        (http_result, content) = rc.execute_rest_call(None, "cmdb/firewall/address", {})
+        assert http_result == 200
+        assert content == [{'name': 'address'}]
+
+    assert len(FakeFortiOSAPI.instances) == 1
+    assert FakeFortiOSAPI.instances[0].logins == 1
+
+
+def test_expired_session_logs_in_again():
+    FakeFortiOSAPI.instances = []
+    pool = FortiOSAPIPool(FakeFortiOSAPI, "fgt", "admin", "", size=1, keepalive=0)
+
+    pool.get("firewall", "address")
+    FakeFortiOSAPI.instances[0].expired = True
+    result = pool.get("firewall", "address")
+
+    assert result['http_status'] == 200
+    assert FakeFortiOSAPI.instances[0].logins == 2
+    assert pool.stats()['relogins'] == 1
+
+
+def test_pool_is_bounded():
+    FakeFortiOSAPI.instances = []
+    pool = FortiOSAPIPool(FakeFortiOSAPI, "fgt", "admin", "", size=1, keepalive=0)
+
+    pooled = pool.acquire()
+    try:
+        pool.acquire(timeout=0.1)
+        assert False, "Second session should not be handed out"
+    except PoolTimeoutError:
+        pass
+
+    releaser = threading.Timer(0.1, pool.release, [pooled])
+    releaser.start()
+    assert pool.acquire(timeout=5) is pooled
+    assert len(FakeFortiOSAPI.instances) == 1
+
+
+if __name__ == "__main__":
+    test_sessions_are_reused()
+    test_expired_session_logs_in_again()
+    test_pool_is_bounded()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,94 @@
+from lxml import etree
+
+from netconf.base import NetconfFramingTransport
+from netconf.error import SessionError
+
+
+class FakeStream(object):
+
+    def __init__(self, data=b"", piece=7):
+        self.sent = []
+        self.data = data
+        self.piece = piece
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        data = self.data[:min(size, self.piece)]
+        self.data = self.data[len(data):]
+        return data
+
+    def close(self):
+        pass
+
+
+def test_streamed_message_is_chunked():
+    stream = FakeStream()
+    transport = NetconfFramingTransport(stream, 100, False)
+
+    pieces = ["<x>{}</x>".format(i) for i in range(100)]
+    writer = transport.pdu_writer(True)
+    for piece in pieces:
+        writer.write(piece.encode('utf-8'))
+    writer.close()
+
+    # Every chunk is sent as soon as it is complete
+    assert len(stream.sent) > 1
+    data = b"".join(stream.sent)
+    assert data.endswith(b"\n##\n")
+
+    # Decoding the chunks gives back the whole message
+    transport.stream = FakeStream(data)
+    assert transport.receive_pdu(True) == "".join(pieces)
+
+
+def test_reply_serialized_into_writer():
+    stream = FakeStream()
+    transport = NetconfFramingTransport(stream, 100, False)
+
+    writer = transport.pdu_writer(False)
+    with etree.xmlfile(writer, encoding='utf-8') as xf:
+        with xf.element("rpc-reply"):
+            for i in range(50):
+                xf.write(etree.Element("x", name=str(i)))
+    writer.close()
+
+    data = b"".join(stream.sent)
+    assert data.endswith(b"]]>]]>")
+    reply = etree.fromstring(data[:-6])
+    assert len(reply) == 50
+
+
+def test_messages_parsed_while_received():
+    msg = b"<rpc message-id='1'>" + b"<x>\xc3\xb1</x>" * 100 + b"</rpc>"
+    chunked = b"\n#10\n" + msg[:10] + b"\n#" + str(len(msg) - 10).encode() + b"\n" + msg[10:] + b"\n##\n"
+    stream = FakeStream(msg + b"]]>]]>" + chunked)
+    transport = NetconfFramingTransport(stream, 100, False)
+
+    for new_framing in (False, True):
+        root = transport.receive_pdu_tree(new_framing)
+        assert root.get('message-id') == '1'
+        assert len(root) == 100
+        assert root[99].text == u"\xf1"
+
+
+def test_malformed_message_is_consumed():
+    stream = FakeStream(b"\n#6\n<rpc><\n##\n\n#7\n<rpc/>\n\n##\n")
+    transport = NetconfFramingTransport(stream, 100, False)
+
+    try:
+        transport.receive_pdu_tree(True)
+        assert False, "Malformed message should not be parsed"
+    except SessionError:
+        pass
+    assert transport.receive_pdu_tree(True).tag == "rpc"
+
+
+if __name__ == "__main__":
+    test_streamed_message_is_chunked()
+    test_reply_serialized_into_writer()
+    test_messages_parsed_while_received()
+    test_malformed_message_is_consumed()
+
+    print("\nAll tests finished OK")
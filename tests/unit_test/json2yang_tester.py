@@ -0,0 +1,87 @@
+import json
+
+from lxml import etree
+
+from yang2rest.json2yang import Json2Yang, IterativeJson2Yang, MAX_CACHED_TAGS
+
+ADDRESS_TABLE = [{'name': 'address1',
+                  'subnet': '10.0.0.1 255.255.255.255',
+                  'comment': "Bob's laptop",
+                  'associated-interface': '',
+                  'tagging': [],
+                  'list': [{'name': 'tag1'}, {'name': 'tag2'}],
+                  'visibility': 'enable',
+                  'color': 3,
+                  '1st': 'fixed tag'}]
+
+
+def _to_strings(nodes):
+    return [etree.tostring(x) for x in nodes]
+
+
+def test_convert_structure_matches_convert_json():
+    j2y = Json2Yang()
+
+    from_structure = j2y.convert_structure(ADDRESS_TABLE)
+    from_json = j2y.convert_json(json.dumps(ADDRESS_TABLE))
+
+    assert _to_strings(from_structure) == _to_strings(from_json)
+
+
+def test_convert_structure_keeps_quotes():
+    j2y = Json2Yang()
+
+    nodes = j2y.convert_structure(ADDRESS_TABLE)
+
+    assert len(nodes) == 1
+    assert nodes[0].tag == 'element'
+    assert nodes[0].find('comment').text == "Bob's laptop"
+    assert nodes[0].find('color').text == '3'
+    assert nodes[0].find('tag_1st').text == 'fixed tag'
+    assert [x.text for x in nodes[0].findall('list/element/name')] == ['tag1', 'tag2']
+
+
+def test_iterative_engine_output_is_identical():
+    structures = [ADDRESS_TABLE,
+                  {'http_method': 'GET', 'results': ADDRESS_TABLE, 'size': 1, 'empty': {}},
+                  [[1, 2], [], [{'a': None, 'b': True}], 'text'],
+                  'scalar',
+                  42]
+
+    for structure in structures:
+        expected = Json2Yang().convert_structure(structure)
+        result = IterativeJson2Yang().convert_structure(structure)
+        if isinstance(expected, list):
+            assert _to_strings(result) == _to_strings(expected)
+        else:
+            assert result == expected
+
+
+def test_iterative_engine_deep_nesting():
+    structure = value = {}
+    for _ in range(5000):
+        value['child'] = {}
+        value = value['child']
+
+    nodes = IterativeJson2Yang().convert_structure(structure)
+
+    assert len(list(nodes[0].iter())) == 5000
+
+
+def test_tag_cache_is_bounded():
+    structure = dict(('10.0.%d.%d' % (i // 256, i % 256), 'up') for i in range(MAX_CACHED_TAGS + 10))
+
+    nodes = IterativeJson2Yang().convert_structure(structure)
+
+    assert nodes[0].tag == 'tag_10.0.0.0'
+    assert len(IterativeJson2Yang._tag_cache) <= MAX_CACHED_TAGS
+
+
+if __name__ == "__main__":
+    test_convert_structure_matches_convert_json()
+    test_convert_structure_keeps_quotes()
+    test_iterative_engine_output_is_identical()
+    test_iterative_engine_deep_nesting()
+    test_tag_cache_is_bounded()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,93 @@
+import time
+
+from lxml import etree
+
+from fakes import FakeFortiOSAPI, make_mirror, make_rest_caller
+from yang2rest.mirror import ConfigMirror, pop_live
+from yang2rest.restcache import RestResponseCache
+
+
+def test_tables_are_loaded_lazily_and_bounded_in_staleness():
+    fos = FakeFortiOSAPI()
+    mirror = make_mirror(fos, max_staleness=0.2, refresh_interval=0)
+
+    assert fos.reads == []
+    assert mirror.get('cmdb/firewall/address') == fos.table
+    fos.table = fos.table + [{'name': 'c'}]
+    assert len(mirror.get('cmdb/firewall/address')) == 2
+    assert len(mirror.get('cmdb/firewall/address', 0)) == 3
+    fos.table = fos.table[:1]
+    time.sleep(0.25)
+    assert len(mirror.get('cmdb/firewall/address')) == 1
+
+    stats = mirror.stats()
+    assert stats['loads'] == 3
+    assert stats['hits'] == 1
+    assert stats['tables'] == 1 and stats['entries'] == 1
+
+
+def test_modifications_are_applied_in_place():
+    fos = FakeFortiOSAPI()
+    mirror = make_mirror(fos, refresh_interval=0)
+    mirror.get('cmdb/firewall/address')
+
+    fos.table = [{'name': 'a', 'comment': 'new'}, {'name': 'b', 'comment': '2'}, {'name': 'c'}]
+    mirror.update('replace', 'cmdb/firewall/address', 'name', 'a')
+    mirror.update('create', 'cmdb/firewall/address', 'name', 'c')
+    mirror.update('delete', 'cmdb/firewall/address', 'name', 'b')
+
+    assert mirror.get('cmdb/firewall/address') == [{'name': 'a', 'comment': 'new'}, {'name': 'c'}]
+    assert fos.reads == ['firewall/address', 'firewall/address/a', 'firewall/address/c']
+
+    # Child objects drop the table
+    mirror.update('create', 'cmdb/firewall/address/a/tagging', 'name', 't')
+    assert mirror.stats()['tables'] == 0
+
+
+def test_tables_are_refreshed():
+    fos = FakeFortiOSAPI()
+    mirror = make_mirror(fos, refresh_interval=0.1)
+    mirror.get('cmdb/firewall/address')
+    fos.table = []
+    time.sleep(0.35)
+
+    assert mirror.get('cmdb/firewall/address') == []
+    assert mirror.stats()['refreshes'] >= 1
+    mirror.close()
+
+
+def test_live_reads_bypass_the_response_cache():
+    fos = FakeFortiOSAPI()
+    cache = RestResponseCache({'cmdb/': 60})
+
+    def rest_caller():
+        rc = make_rest_caller(fos)()
+        rc.set_cache(cache)
+        return rc
+
+    mirror = ConfigMirror(rest_caller, refresh_interval=0)
+    # Warm, as a read of the table outside the mirror would
+    list(rest_caller().iter_rest_pages('cmdb/firewall/address', 1000))
+    assert mirror.get('cmdb/firewall/address') == fos.table
+
+    fos.table = [{'name': 'c'}]
+    assert mirror.get('cmdb/firewall/address', 0) == [{'name': 'c'}]
+    assert cache.stats()['hits'] == 0
+
+
+def test_live_is_removed_from_filter():
+    nc_filter = etree.fromstring("<filter><live/><cmdb><firewall><address/></firewall></cmdb></filter>")
+
+    assert pop_live(nc_filter)
+    assert [x.tag for x in nc_filter] == ['cmdb']
+    assert not pop_live(nc_filter)
+
+
+if __name__ == "__main__":
+    test_tables_are_loaded_lazily_and_bounded_in_staleness()
+    test_modifications_are_applied_in_place()
+    test_tables_are_refreshed()
+    test_live_reads_bypass_the_response_cache()
+    test_live_is_removed_from_filter()
+
+    print("\nAll tests finished OK")
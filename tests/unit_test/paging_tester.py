@@ -0,0 +1,31 @@
+from fakes import FakeFortiOSAPI
+from yang2rest.restcaller import RestCaller
+
+
+def test_table_is_read_in_pages():
+    fos = FakeFortiOSAPI([{'name': str(x)} for x in range(25)])
+    rc = RestCaller()
+    rc.set_fos(fos)
+
+    pages = list(rc.iter_rest_pages("cmdb/firewall/address", 10))
+
+    assert [len(x[1]) for x in pages] == [10, 10, 5]
+    assert [x['start'] for x in fos.calls] == [0, 10, 20]
+    assert pages[2][1][-1] == {'name': '24'}
+
+
+def test_exact_multiple_ends_with_empty_page():
+    fos = FakeFortiOSAPI([{'name': str(x)} for x in range(20)])
+    rc = RestCaller()
+    rc.set_fos(fos)
+
+    pages = list(rc.iter_rest_pages("cmdb/firewall/address", 10))
+
+    assert [len(x[1]) for x in pages] == [10, 10, 0]
+
+
+if __name__ == "__main__":
+    test_table_is_read_in_pages()
+    test_exact_multiple_ends_with_empty_page()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,106 @@
+from lxml import etree
+
+from yang2rest.plancache import TranslationPlanCache
+from yang2rest.yang2restconverter import Yang2RestConverter
+
+CHILD_OBJECT = """
+          <cmdb xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+            <webfilter>
+               <urlfilter mkey="id">
+                 <id>{0}</id>
+                 <entries nc:operation="create" mkey="id">
+                        <id>{1}</id>
+                        <url>{2}</url>
+                 </entries>
+               </urlfilter>
+            </webfilter>
+          </cmdb>"""
+
+GET_OBJECT = """
+          <cmdb>
+            <firewall>
+               <address mkey="name">
+                 <name>{0}</name>
+               </address>
+            </firewall>
+          </cmdb>"""
+
+
+def _compare(template, values_list):
+    plans = TranslationPlanCache()
+    cached = Yang2RestConverter(plan_cache=plans)
+    uncached = Yang2RestConverter()
+
+    for values in values_list:
+        data = template.format(*values)
+        expected = uncached.extract_url_content_operation(etree.fromstring(data))
+        result = cached.extract_url_content_operation(etree.fromstring(data))
+        assert result == expected
+
+    return plans.stats()
+
+
+def test_plans_are_reused_across_values():
+    stats = _compare(CHILD_OBJECT, [("1", "48", "www.test.com"),
+                                    ("2", "49", "www.other.com"),
+                                    ("1", "1", "1")])
+
+    assert stats['plans'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 2
+
+
+def test_values_with_special_characters():
+    _compare(GET_OBJECT, [("address1",),
+                          ("host/32",),
+                          ("a{0}b",),
+                          ("\\1",)])
+
+
+def test_different_shapes_get_different_plans():
+    plans = TranslationPlanCache()
+    yrc = Yang2RestConverter(plan_cache=plans)
+
+    yrc.extract_url_content_operation(etree.fromstring(GET_OBJECT.format("address1")))
+    (url, content, operation) = yrc.extract_url_content_operation(
+        etree.fromstring(CHILD_OBJECT.format("1", "48", "www.test.com")))
+
+    assert url == "cmdb/webfilter/urlfilter/1/entries"
+    assert content == {'id': '48', 'url': 'www.test.com'}
+    assert operation == "create"
+    assert plans.stats()['plans'] == 2
+
+
+def test_lru_bound():
+    plans = TranslationPlanCache(max_plans=1)
+    yrc = Yang2RestConverter(plan_cache=plans)
+
+    yrc.extract_url_content_operation(etree.fromstring(GET_OBJECT.format("address1")))
+    yrc.extract_url_content_operation(etree.fromstring(CHILD_OBJECT.format("1", "48", "x")))
+    yrc.extract_url_content_operation(etree.fromstring(GET_OBJECT.format("address2")))
+
+    stats = plans.stats()
+    assert stats['plans'] == 1
+    assert stats['evictions'] == 2
+    assert stats['hits'] == 0
+
+
+def test_large_requests_are_not_cached():
+    plans = TranslationPlanCache(max_nodes=4)
+    yrc = Yang2RestConverter(plan_cache=plans)
+    data = etree.fromstring(CHILD_OBJECT.format("1", "48", "x"))
+
+    assert yrc.extract_url_content_operation(data) == Yang2RestConverter().extract_url_content_operation(data)
+    stats = plans.stats()
+    assert stats['plans'] == 0
+    assert stats['too-large'] == 1
+
+
+if __name__ == "__main__":
+    test_plans_are_reused_across_values()
+    test_values_with_special_characters()
+    test_different_shapes_get_different_plans()
+    test_lru_bound()
+    test_large_requests_are_not_cached()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,73 @@
+import os
+import signal
+
+from netconf import server
+from sshutil.prefork import GENERATION_SESSION_IDS, PreforkSupervisor, reserve_port, session_id_base
+from sshutil.server import SSHUserPassController
+
+HOST_KEY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "keys", "host_key")
+
+
+def test_workers_share_port_with_unique_session_ids():
+    reserve_socket, port = reserve_port()
+    workers = [server.NetconfSSHServer(SSHUserPassController(), port=port, host_key=HOST_KEY,
+                                       reuse_port=True, session_id_base=index + 1,
+                                       session_id_stride=3)
+               for index in range(3)]
+    try:
+        assert [x.port for x in workers] == [port] * 3
+
+        sids = [x.allocate_session_id() for x in workers for _ in range(4)]
+        assert sorted(sids) == list(range(1, 13))
+    finally:
+        for worker in workers:
+            worker.close()
+        reserve_socket.close()
+
+
+def test_supervisor_runs_each_worker():
+    results = os.pipe()
+
+    def worker(index, workers, port, generation):
+        os.write(results[1], "{} {} {} {}\n".format(index, workers, port, generation).encode('ascii'))
+
+    supervisor = PreforkSupervisor(worker, 2, respawn=False)
+    supervisor.run()
+    os.close(results[1])
+
+    with os.fdopen(results[0]) as f:
+        lines = sorted(f.read().split("\n")[:-1])
+    assert lines == ["0 2 {} 0".format(supervisor.port), "1 2 {} 0".format(supervisor.port)]
+
+
+def test_respawned_workers_do_not_reuse_session_ids():
+    results = os.pipe()
+
+    def worker(index, workers, port, generation):
+        os.write(results[1], "{} {}\n".format(index, generation).encode('ascii'))
+        if generation == 0:
+            os._exit(1)  # pylint: disable=W0212
+        # Restarted once, stop the supervisor
+        os.kill(os.getppid(), signal.SIGTERM)
+
+    supervisor = PreforkSupervisor(worker, 1)
+    supervisor.min_uptime = 0
+    supervisor.run()
+    os.close(results[1])
+
+    with os.fdopen(results[0]) as f:
+        assert f.read() == "0 0\n0 1\n"
+
+    # Ids of both generations of worker 0 of 3, then of worker 1
+    first = [session_id_base(0, 3, 0) + 3 * x for x in range(GENERATION_SESSION_IDS)]
+    respawned = [session_id_base(0, 3, 1) + 3 * x for x in range(GENERATION_SESSION_IDS)]
+    assert not set(first) & set(respawned)
+    assert session_id_base(1, 3) == 2
+
+
+if __name__ == "__main__":
+    test_workers_share_port_with_unique_session_ids()
+    test_supervisor_runs_each_worker()
+    test_respawned_workers_do_not_reuse_session_ids()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,96 @@
+from lxml import etree
+
+from fakes import FakeFortiOSAPI
+from yang2rest.json2yang import Json2Yang
+from yang2rest.pushdown import FilterPushDown
+from yang2rest.restcaller import RestCaller
+from yang2rest.restcache import RestResponseCache
+from yang2rest.yang2restconverter import Yang2RestConverter
+
+
+def _pushdown(xml):
+    netconf_data = etree.fromstring(xml)
+    (url, _, _, selection) = Yang2RestConverter().extract_url_content_operation_selection(netconf_data)
+    return url, FilterPushDown(selection, url)
+
+
+def test_selection_and_content_match_parameters():
+    url, pushdown = _pushdown("<cmdb><firewall><address>"
+                              "<subnet/><type>ipmask</type><comment>a,b</comment>"
+                              "</address></firewall></cmdb>")
+
+    assert url == "cmdb/firewall/address"
+    assert pushdown.parameters == {'format': 'subnet|type|comment',
+                                   'filter': ['type==ipmask', 'comment==a\\,b']}
+    assert pushdown.needs_local_filter
+
+
+def test_no_filter_no_parameters():
+    url, pushdown = _pushdown("<cmdb><firewall><address/></firewall></cmdb>")
+
+    assert url == "cmdb/firewall/address"
+    assert pushdown.parameters is None
+    assert pushdown.key is None
+
+
+def test_content_matches_are_checked_again_locally():
+    url, pushdown = _pushdown("<cmdb><firewall><address><name>Foo</name></address></firewall></cmdb>")
+
+    # As answered by FortiOS to filter=name==Foo
+    nodes = Json2Yang().convert_structure([{'name': 'Foo', 'subnet': '1'}, {'name': 'foo', 'subnet': '2'}])
+    filtered = pushdown.filter_locally(nodes)
+    assert [x.findtext('name') for x in filtered] == ['Foo']
+    assert filtered[0].findtext('subnet') == '1'
+
+
+def test_parameters_are_part_of_cache_key():
+    fos = FakeFortiOSAPI([{'name': 'a', 'subnet': '10.0.0.0 255.0.0.0'}])
+    rc = RestCaller()
+    rc.set_fos(fos)
+    rc.set_cache(RestResponseCache({'cmdb/': 60}))
+
+    url, pushdown = _pushdown("<cmdb><firewall><address><subnet/></address></firewall></cmdb>")
+    rc.execute_rest_call(None, url, {}, pushdown)
+    rc.execute_rest_call(None, url, {}, pushdown)
+    rc.execute_rest_call(None, url, {})
+
+    assert fos.calls == [{'format': 'subnet'}, None]
+
+
+def test_monitor_filter_is_applied_locally():
+    url, pushdown = _pushdown("<monitor><system><status><version/><serial/></status></system></monitor>")
+
+    assert url == "monitor/system/status"
+    assert pushdown.parameters is None
+    assert pushdown.needs_local_filter
+
+    nodes = Json2Yang().convert_structure({'version': 'v6.0.2', 'serial': 'FGVM01', 'build': 202})
+    filtered = pushdown.filter_locally(nodes)
+    assert [x.tag for x in filtered] == ['version', 'serial']
+
+
+def test_filter_namespace_is_ignored_locally():
+    url, pushdown = _pushdown('<monitor xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                              '<system><status><version/><serial/></status></system></monitor>')
+
+    nodes = Json2Yang().convert_structure({'version': 'v6.0.2', 'serial': 'FGVM01', 'build': 202})
+    assert [x.tag for x in pushdown.filter_locally(nodes)] == ['version', 'serial']
+
+
+def test_monitor_url_follows_single_children():
+    url, pushdown = _pushdown("<monitor><system><resource><usage></usage></resource></system></monitor>")
+
+    assert url == "monitor/system/resource/usage"
+    assert not pushdown.needs_local_filter
+
+
+if __name__ == "__main__":
+    test_selection_and_content_match_parameters()
+    test_no_filter_no_parameters()
+    test_content_matches_are_checked_again_locally()
+    test_parameters_are_part_of_cache_key()
+    test_monitor_filter_is_applied_locally()
+    test_filter_namespace_is_ignored_locally()
+    test_monitor_url_follows_single_children()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,91 @@
+import time
+
+from yang2rest.restcache import RestResponseCache
+
+
+def test_ttl_per_prefix():
+    cache = RestResponseCache({'cmdb/': 60, 'cmdb/firewall/policy': 0.05})
+
+    cache.put("cmdb/firewall/address", [1])
+    cache.put("cmdb/firewall/policy", [2])
+    cache.put("monitor/system/status", [3])
+
+    assert cache.get("cmdb/firewall/address") == [1]
+    assert cache.get("cmdb/firewall/policy") == [2]
+    assert cache.get("monitor/system/status") is None
+
+    time.sleep(0.1)
+    assert cache.get("cmdb/firewall/address") == [1]
+    assert cache.get("cmdb/firewall/policy") is None
+
+    stats = cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 2
+    assert stats['expirations'] == 1
+
+
+def test_lru_eviction():
+    cache = RestResponseCache({'cmdb/': 60}, max_bytes=25)
+
+    cache.put("cmdb/a", "x" * 8)
+    cache.put("cmdb/b", "x" * 8)
+    cache.get("cmdb/a")
+    cache.put("cmdb/c", "x" * 8)
+
+    assert cache.get("cmdb/a") is not None
+    assert cache.get("cmdb/b") is None
+    assert cache.get("cmdb/c") is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate_ancestors_and_descendants():
+    cache = RestResponseCache({'cmdb/': 60})
+
+    urls = ["cmdb/webfilter",
+            "cmdb/webfilter/urlfilter",
+            "cmdb/webfilter/urlfilter/1",
+            "cmdb/webfilter/urlfilter/1/entries/48",
+            "cmdb/webfilter/urlfilter/2",
+            "cmdb/firewall/address"]
+    for url in urls:
+        cache.put(url, url)
+
+    cache.invalidate("cmdb/webfilter/urlfilter/1")
+
+    assert cache.get("cmdb/webfilter") is None
+    assert cache.get("cmdb/webfilter/urlfilter") is None
+    assert cache.get("cmdb/webfilter/urlfilter/1") is None
+    assert cache.get("cmdb/webfilter/urlfilter/1/entries/48") is None
+    assert cache.get("cmdb/webfilter/urlfilter/2") == "cmdb/webfilter/urlfilter/2"
+    assert cache.get("cmdb/firewall/address") == "cmdb/firewall/address"
+
+
+def test_reads_in_flight_when_invalidated_are_not_stored():
+    cache = RestResponseCache({'cmdb/': 60})
+
+    generation = cache.generation()
+    cache.invalidate("cmdb/firewall/address/a")
+    cache.put("cmdb/firewall/address", [1], generation=generation)
+    assert cache.get("cmdb/firewall/address") is None
+    assert cache.stats()['stale-puts'] == 1
+
+    cache.put("cmdb/firewall/address", [2], generation=cache.generation())
+    assert cache.get("cmdb/firewall/address") == [2]
+
+
+def test_size_of_large_tables_is_estimated():
+    cache = RestResponseCache({'cmdb/': 60})
+
+    table = [{'name': str(x % 10)} for x in range(1000)]
+    cache.put("cmdb/firewall/address", (200, table))
+    assert 12000 < cache.stats()['bytes'] < 14000
+
+
+if __name__ == "__main__":
+    test_ttl_per_prefix()
+    test_lru_eviction()
+    test_invalidate_ancestors_and_descendants()
+    test_reads_in_flight_when_invalidated_are_not_stored()
+    test_size_of_large_tables_is_estimated()
+
+    print("\nAll tests finished OK")
@@ -0,0 +1,121 @@
+import time
+
+from fakes import make_rest_caller
+from yang2rest.mirror import ConfigMirror
+from yang2rest.revision import RevisionProbe, payload_hash
+
+
+class FakeFortiGate(object):
+    # Stand-in FortiGate: cmdb tables and a configuration checksum
+    # changed by every modification
+
+    def __init__(self):
+        self.tables = {'firewall/address': [{'name': 'a', 'subnet': '1'}, {'name': 'b', 'subnet': '2'}],
+                       'firewall/addrgrp': [{'name': 'g'}]}
+        self.checksum = 1
+        self.calls = []
+        self.fail_monitor = False
+
+    def get(self, path, name, vdom=None, mkey=None, parameters=None):
+        self.calls.append('get ' + path + '/' + name)
+        return {'http_status': 200, 'results': [dict(x) for x in self.tables[path + '/' + name]]}
+
+    def monitor(self, path, name, vdom=None, mkey=None, parameters=None):
+        self.calls.append('monitor ' + path + '/' + name)
+        if self.fail_monitor:
+            return {'http_status': 404, 'status': 'error'}
+        return {'http_status': 200, 'results': [{'checksum': {'global': str(self.checksum)}}]}
+
+    def post(self, path, name, data=None, vdom=None):
+        self.tables[path + '/' + name].append(dict(data))
+        self.checksum += 1
+        return {'http_status': 200, 'status': 'success'}
+
+    def reads(self):
+        return [x for x in self.calls if x.startswith('get')]
+
+
+def test_probe_answer_is_reused_and_changes_detected():
+    fgt = FakeFortiGate()
+    probe = RevisionProbe(make_rest_caller(fgt), min_interval=0.1)
+
+    revision = probe.revision()
+    assert revision is not None and probe.revision() == revision
+    assert fgt.calls == ['monitor system/ha-checksums']
+
+    fgt.post('firewall', 'address', {'name': 'c'})
+    time.sleep(0.15)
+    assert probe.revision() != revision
+    assert probe.stats()['changes'] == 1
+
+    fgt.fail_monitor = True
+    time.sleep(0.15)
+    assert probe.revision() is None
+    assert probe.stats()['probe-errors'] == 1
+
+
+def test_unchanged_tables_are_not_read_again():
+    fgt = FakeFortiGate()
+    rest_caller = make_rest_caller(fgt)
+    mirror = ConfigMirror(rest_caller, max_staleness=0.05, refresh_interval=0,
+                          revision_probe=RevisionProbe(rest_caller, min_interval=0))
+
+    nodes = mirror.nodes('cmdb/firewall/address')
+    assert [x.findtext('name') for x in nodes] == ['a', 'b']
+    time.sleep(0.1)
+    assert mirror.nodes('cmdb/firewall/address') is nodes
+    assert fgt.reads() == ['get firewall/address']
+
+    # Changed elsewhere, the table is read again but it is the same
+    fgt.post('firewall', 'addrgrp', {'name': 'h'})
+    time.sleep(0.1)
+    assert mirror.nodes('cmdb/firewall/address') is nodes
+    assert len(fgt.reads()) == 2
+
+    fgt.post('firewall', 'address', {'name': 'c'})
+    time.sleep(0.1)
+    nodes = mirror.nodes('cmdb/firewall/address')
+    assert [x.findtext('name') for x in nodes] == ['a', 'b', 'c']
+
+    stats = mirror.stats()
+    assert stats['unchanged'] == 1 and stats['same-payload'] == 1
+    assert stats['conversions'] == 2
+
+
+def test_restored_tables_are_revalidated_by_revision():
+    fgt = FakeFortiGate()
+    rest_caller = make_rest_caller(fgt)
+    probe = RevisionProbe(rest_caller)
+    entries = fgt.tables['firewall/address']
+    mirror = ConfigMirror(rest_caller, refresh_interval=0, revision_probe=probe)
+    mirror.restore([('cmdb/firewall/address', 0, probe.revision(), lambda: entries)])
+
+    for _ in range(50):
+        if mirror.stats()['unchanged']:
+            break
+        time.sleep(0.02)
+    assert fgt.reads() == []
+    assert payload_hash(mirror.get('cmdb/firewall/address')) == payload_hash(entries)
+
+
+def test_tables_are_not_revalidated_past_the_probe():
+    fgt = FakeFortiGate()
+    rest_caller = make_rest_caller(fgt)
+    mirror = ConfigMirror(rest_caller, max_staleness=0.05, refresh_interval=0,
+                          revision_probe=RevisionProbe(rest_caller, min_interval=10))
+    assert len(mirror.get('cmdb/firewall/address')) == 2
+
+    # Changed after the probe, its answer is still reused
+    fgt.post('firewall', 'address', {'name': 'c'})
+    time.sleep(0.1)
+    assert len(mirror.get('cmdb/firewall/address')) == 3
+    assert mirror.stats()['loads'] == 2
+
+
+if __name__ == "__main__":
+    test_probe_answer_is_reused_and_changes_detected()
+    test_unchanged_tables_are_not_read_again()
+    test_restored_tables_are_revalidated_by_revision()
+    test_tables_are_not_revalidated_past_the_probe()
+
+    print("\nAll tests finished OK")
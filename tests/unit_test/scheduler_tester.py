@@ -0,0 +1,55 @@
+import threading
+import time
+
+from yang2rest.scheduler import RestScheduler, INTERACTIVE, BULK, BACKGROUND
+
+
+def test_higher_priority_goes_first():
+    scheduler = RestScheduler(max_inflight=1)
+    order = []
+
+    def call(priority):
+        with scheduler.slot(priority):
+            order.append(priority)
+
+    scheduler.acquire()
+    threads = []
+    for priority in (BACKGROUND, BULK, INTERACTIVE):
+        t = threading.Thread(target=call, args=(priority,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.05)
+
+    stats = scheduler.stats()
+    assert stats['inflight'] == 1
+    assert stats['background']['queued'] == 1
+    scheduler.release()
+    for t in threads:
+        t.join()
+
+    assert order == [INTERACTIVE, BULK, BACKGROUND]
+    stats = scheduler.stats()
+    assert stats['inflight'] == 0
+    assert stats['background']['queued'] == 0
+    assert stats['background']['wait-max'] >= 0.1
+    assert stats['interactive']['calls'] == 2
+
+
+def test_rate_is_limited():
+    scheduler = RestScheduler(max_inflight=4, rate=20, burst=2)
+    start = time.time()
+    for _ in range(6):
+        with scheduler.slot(BULK):
+            pass
+
+    # 2 calls in the burst, the other 4 at 20 per second
+    assert time.time() - start >= 0.18
+    assert scheduler.stats()['throttled'] == 4
+    assert scheduler.stats()['bulk']['calls'] == 6
+
+
+if __name__ == "__main__":
+    test_higher_priority_goes_first()
+    test_rate_is_limited()
+
+    print("\nAll tests finished OK")
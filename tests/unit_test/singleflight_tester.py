@@ -0,0 +1,114 @@
+import threading
+import time
+
+from yang2rest.restcaller import RestCaller
+from yang2rest.singleflight import SingleFlight
+
+
+class SlowFortiOSAPI(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.comment = 'old'
+
+    def monitor(self, path, name, vdom=None, mkey=None, parameters=None):
+        self.calls += 1
+        time.sleep(0.2)
+        return {'http_status': 200, 'results': {'name': name}}
+
+    def get(self, path, name, vdom=None, mkey=None, parameters=None):
+        self.calls += 1
+        comment = self.comment
+        time.sleep(0.2)
+        return {'http_status': 200, 'results': [{'name': 'a', 'comment': comment}]}
+
+    def put(self, path, name, data=None, vdom=None):
+        self.comment = data['comment']
+        return {'http_status': 200, 'status': 'success'}
+
+
+def test_concurrent_reads_are_coalesced():
+    fos = SlowFortiOSAPI()
+    coalescer = SingleFlight()
+    results = []
+
+    def read():
+        rc = RestCaller()
+        rc.set_fos(fos)
+        rc.set_coalescer(coalescer)
+        results.append(rc.execute_rest_call(None, "monitor/system/status", {}))
+
+    threads = [threading.Thread(target=read) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fos.calls == 1
+    assert results == [(200, {'name': 'status'})] * 10
+    assert coalescer.stats()['coalesced'] == 9
+
+
+def test_errors_are_shared():
+    coalescer = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def follower():
+        started.wait()
+        try:
+            coalescer.do("key", failing)
+        except ValueError as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=follower)
+    thread.start()
+    try:
+        coalescer.do("key", failing)
+    except ValueError as error:
+        errors.append(error)
+    thread.join()
+
+    assert len(errors) == 2
+    assert coalescer.stats()['in-flight'] == 0
+
+
+def test_reads_after_an_edit_do_not_join_reads_before_it():
+    fos = SlowFortiOSAPI()
+    coalescer = SingleFlight()
+
+    def rest_caller():
+        rc = RestCaller()
+        rc.set_fos(fos)
+        rc.set_coalescer(coalescer)
+        return rc
+
+    before = []
+    thread = threading.Thread(target=lambda: before.append(
+        rest_caller().execute_rest_call(None, "cmdb/firewall/address", {})))
+    thread.start()
+    time.sleep(0.05)
+
+    rc = rest_caller()
+    rc.execute_rest_call('merge', "cmdb/firewall/address/a", {'name': 'a', 'comment': 'new'})
+    after = rc.execute_rest_call(None, "cmdb/firewall/address", {})
+    thread.join()
+
+    assert before == [(200, [{'name': 'a', 'comment': 'old'}])]
+    assert after == (200, [{'name': 'a', 'comment': 'new'}])
+    assert fos.calls == 2
+    assert coalescer.stats()['detached'] == 1
+    assert coalescer.stats()['in-flight'] == 0
+
+
+if __name__ == "__main__":
+    test_concurrent_reads_are_coalesced()
+    test_errors_are_shared()
+    test_reads_after_an_edit_do_not_join_reads_before_it()
+
+    print("\nAll tests finished OK")
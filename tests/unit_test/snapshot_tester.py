@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import time
+
+from fakes import FakeFortiOSAPI, make_mirror
+from yang2rest.snapshot import MirrorSnapshot
+
+
+def test_snapshot_is_loaded_back():
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, "fgt.snap")
+        tables = [('cmdb/firewall/address', 10.0, 'r1', [{'name': 'a'}]),
+                  ('cmdb/system/interface', 20.0, None, [])]
+        MirrorSnapshot(path, "fgt", "10.0.0.1").write(tables)
+
+        loaded = MirrorSnapshot(path, "fgt", "10.0.0.1").load()
+        assert sorted((url, when, revision, decode()) for url, when, revision, decode in loaded) == sorted(tables)
+
+        # Another FortiGate, too old or not a snapshot
+        assert MirrorSnapshot(path, "fgt", "10.0.0.2").load() == []
+        time.sleep(0.1)
+        assert MirrorSnapshot(path, "fgt", "10.0.0.1").load(max_age=0.05) == []
+        with open(path, 'wb') as f:
+            f.write(b"garbage")
+        assert MirrorSnapshot(path, "fgt", "10.0.0.1").load() == []
+        assert MirrorSnapshot(path + ".missing", "fgt", "10.0.0.1").load() == []
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_restored_mirror_answers_and_revalidates():
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot = MirrorSnapshot(os.path.join(directory, "fgt.snap"), "fgt", "10.0.0.1")
+        fos = FakeFortiOSAPI()
+        mirror = make_mirror(fos, refresh_interval=0, snapshot=snapshot)
+        mirror.get('cmdb/firewall/address')
+        mirror.close()
+        assert mirror.stats()['snapshots'] == 1
+
+        # Restarted, FortiGate changed meanwhile
+        fos = FakeFortiOSAPI()
+        fos.table = []
+        mirror = make_mirror(fos, refresh_interval=0, snapshot=snapshot, max_staleness=0.01)
+        for _ in range(50):
+            if mirror.stats()['revalidations']:
+                break
+            time.sleep(0.02)
+        stats = mirror.stats()
+        assert stats['restored'] == 1 and stats['revalidations'] == 1
+        assert fos.reads == ['firewall/address']
+        assert mirror.get('cmdb/firewall/address', 60) == []
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_restored_tables_older_than_max_staleness_are_not_answered():
+    directory = tempfile.mkdtemp()
+    try:
+        snapshot = MirrorSnapshot(os.path.join(directory, "fgt.snap"), "fgt", "10.0.0.1")
+        snapshot.write([('cmdb/firewall/address', time.time() - 100, None, [{'name': 'old'}])])
+
+        class SlowFortiOSAPI(FakeFortiOSAPI):
+            # The background revalidation is still reading meanwhile
+            def get(self, *args, **kwargs):
+                time.sleep(0.2)
+                return super(SlowFortiOSAPI, self).get(*args, **kwargs)
+
+        fos = SlowFortiOSAPI()
+        mirror = make_mirror(fos, refresh_interval=0, snapshot=snapshot, max_staleness=30)
+        assert mirror.get('cmdb/firewall/address') == fos.table
+        mirror.close()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    test_snapshot_is_loaded_back()
+    test_restored_mirror_answers_and_revalidates()
+    test_restored_tables_older_than_max_staleness_are_not_answered()
+
+    print("\nAll tests finished OK")
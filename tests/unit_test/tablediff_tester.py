@@ -0,0 +1,110 @@
+from lxml import etree
+
+from yang2rest.bulkedit import split_config
+from yang2rest.tablediff import TableDiff, TableDiffError, TableDiffStats
+
+NC = 'xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0"'
+
+RUNNING = [{'name': 'a', 'subnet': '1', 'comment': '', 'tagging': []},
+           {'name': 'b', 'subnet': '2', 'comment': 'x', 'tagging': []},
+           {'name': 'c', 'subnet': '3', 'comment': '', 'tagging': []}]
+
+
+def _table(entries, operation="replace", mkey=' mkey="name"', table="address"):
+    objects = split_config(etree.fromstring(
+        "<cmdb " + NC + '><firewall><{0} nc:operation="{1}"{2}>{3}</{0}></firewall></cmdb>'.format(
+            table, operation, mkey, "".join("<element>" + x + "</element>" for x in entries))))
+    assert len(objects) == 1
+    return objects[0]
+
+
+def _calls(diff):
+    return [(x.operation, x.url, x.mkey_value, x.content) for x in diff.objects()]
+
+
+def test_table_is_given_as_entries():
+    table = _table(["<name>a</name><subnet>1</subnet>", "<name>d</name>"], mkey="")
+
+    assert table.url == 'cmdb/firewall/address'
+    assert table.mkey == 'name'
+    assert table.entries == [{'name': 'a', 'subnet': '1'}, {'name': 'd'}]
+
+
+def test_only_changes_are_sent():
+    diff = TableDiff(_table(["<name>a</name><subnet>1</subnet>",
+                             "<name>b</name><subnet>2</subnet><comment>y</comment>",
+                             "<name>d</name><subnet>4</subnet>"]), RUNNING)
+
+    assert _calls(diff) == [('create', 'cmdb/firewall/address', 'd', {'name': 'd', 'subnet': '4'}),
+                            ('replace', 'cmdb/firewall/address', 'b',
+                             {'name': 'b', 'subnet': '2', 'comment': 'y'}),
+                            ('delete', 'cmdb/firewall/address', 'c', {'name': 'c'})]
+    assert diff.objects()[1].path == "/cmdb/firewall/address[name='b']"
+    assert diff.unchanged == 1 and len(diff) == 3
+
+    # Merge does not delete and sends the changed attributes only,
+    # empty text is an empty attribute
+    diff = TableDiff(_table(["<name>a</name><comment></comment>",
+                             "<name>b</name><subnet>2</subnet><comment>y</comment>"], "merge"), RUNNING)
+    assert _calls(diff) == [('merge', 'cmdb/firewall/address', 'b', {'name': 'b', 'comment': 'y'})]
+
+    stats = TableDiffStats()
+    stats.add(diff)
+    assert stats.stats()['unchanged'] == 1 and stats.stats()['changes'] == 1
+
+
+def test_numeric_keys():
+    running = [{'policyid': 1, 'action': 'accept'}, {'policyid': 2, 'action': 'deny'}]
+    diff = TableDiff(_table(["<policyid>1</policyid><action>accept</action>"],
+                            mkey=' mkey="policyid"'), running)
+
+    assert _calls(diff) == [('delete', 'cmdb/firewall/address', '2', {'policyid': '2'})]
+
+
+def test_lists_are_compared():
+    # As FortiGate answers them, q_origin_key is not given back
+    running = [{'name': 'g1', 'comment': '', 'member': [{'name': 'a', 'q_origin_key': 'a'},
+                                                         {'name': 'b', 'q_origin_key': 'b'}]},
+               {'name': 'g2', 'comment': '', 'member': []}]
+    members = "<member><element><name>a</name></element><element><name>b</name></element></member>"
+
+    diff = TableDiff(_table(["<name>g1</name><comment></comment>" + members,
+                             "<name>g2</name><comment></comment><member></member>"], table="addrgrp"), running)
+    assert _calls(diff) == [] and diff.unchanged == 2
+
+    diff = TableDiff(_table(["<name>g1</name><member><element><name>a</name></element></member>",
+                             "<name>g2</name>" + members, "<name>g3</name>" + members],
+                            table="addrgrp"), running)
+    assert _calls(diff) == [
+        ('create', 'cmdb/firewall/addrgrp', 'g3', {'name': 'g3', 'member': [{'name': 'a'}, {'name': 'b'}]}),
+        ('replace', 'cmdb/firewall/addrgrp', 'g1', {'name': 'g1', 'member': [{'name': 'a'}]}),
+        ('replace', 'cmdb/firewall/addrgrp', 'g2', {'name': 'g2', 'member': [{'name': 'a'}, {'name': 'b'}]})]
+
+    running = [{'policyid': 1, 'action': 'accept', 'srcintf': [{'name': 'port1', 'q_origin_key': 'port1'}],
+                'srcaddr': [{'name': 'all', 'q_origin_key': 'all'}], 'schedule': 'always'}]
+    diff = TableDiff(_table(["<policyid>1</policyid><action>accept</action>"
+                             "<srcintf><element><name>port1</name></element></srcintf>"
+                             "<srcaddr><element><name>all</name></element></srcaddr>"],
+                            mkey=' mkey="policyid"', table="policy"), running)
+    assert _calls(diff) == []
+
+
+def test_invalid_tables():
+    for entries, operation in ((["<subnet>1</subnet>"], "replace"),
+                               (["<name>a</name>", "<name>a</name>"], "replace"),
+                               (["<name>a</name>"], "create")):
+        try:
+            TableDiff(_table(entries, operation), RUNNING)
+            assert False
+        except TableDiffError:
+            pass
+
+
+if __name__ == "__main__":
+    test_table_is_given_as_entries()
+    test_only_changes_are_sent()
+    test_numeric_keys()
+    test_lists_are_compared()
+    test_invalid_tables()
+
+    print("\nAll tests finished OK")
@@ -1,4 +1,5 @@
-from yang2rest.yang2restconverter import Yang2RestConverter
+from yang2rest import yang2restconverter
+from yang2rest.yang2restconverter import Yang2RestConverter, YangUtil
 from lxml import etree
 
 
@@ -211,6 +212,13 @@ def test_edit_urlfilter_child_object():
     assert operation == "replace"
 
 
+def test_local_names_are_bounded():
+    for i in range(yang2restconverter.MAX_LOCAL_NAMES + 10):
+        assert YangUtil.local_name('{urn:x}tag%d' % i) == 'tag%d' % i
+
+    assert len(yang2restconverter._LOCAL_NAMES) <= yang2restconverter.MAX_LOCAL_NAMES
+
+
 
 if __name__ == "__main__":
     test_create_urlfilter_object()
@@ -221,6 +229,7 @@ if __name__ == "__main__":
     test_get_urlfilter_child_object()
     test_edit_urlfilter_object()
     test_edit_urlfilter_child_object()
+    test_local_names_are_bounded()
 
     print("\nAll tests finished OK")
 
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Bulk edit-config: many objects in a single Netconf request.
+#
+# Every tag with an 'operation' attribute is an object, modified
+# with its own REST call. Objects may refer to the ones of the tables
+# given before (e.g. address groups to addresses) and child objects
+# need their parent, so they are run in waves (see plan_waves): tables
+# in the order they are given, children after their parents, and
+# deletes at the end the other way round. The calls of a wave are run
+# concurrently, at most window at a time, following the Netconf
+# error-option:
+#
+#  - stop-on-error: no more objects are started after an error
+#  - continue-on-error: every object is tried
+#  - rollback-on-error: the objects already modified are restored
+#    to the state they had, read before modifying them
+#
+# A whole table can be replaced giving its entries as get-config
+# answers them, <element> children of the table tag (see tablediff.py).
+#
+#************************************************
+"""
+
+import copy
+import logging
+from collections import Counter, OrderedDict
+from concurrent import futures
+
+from yang2rest.yang2restconverter import Yang2RestConverter, YangUtil
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+STOP_ON_ERROR = "stop-on-error"
+CONTINUE_ON_ERROR = "continue-on-error"
+ROLLBACK_ON_ERROR = "rollback-on-error"
+
+ERROR_OPTIONS = (STOP_ON_ERROR, CONTINUE_ON_ERROR, ROLLBACK_ON_ERROR)
+
+# States of an object once the edit is done
+APPLIED = "applied"
+FAILED = "failed"
+SKIPPED = "skipped"
+ROLLED_BACK = "rolled-back"
+ROLLBACK_FAILED = "rollback-failed"
+
+# Tag of the entries of a table, as answered by get-config
+ENTRY_TAG = "element"
+# Key of the entries of a table replaced without mkey attribute
+DEFAULT_TABLE_MKEY = "name"
+
+
+def _children(elem):
+    return [x for x in elem if isinstance(x.tag, str)]
+
+
+def _mkey_child(elem):
+    mkey = elem.get('mkey')
+    if not mkey:
+        return None
+    for child in _children(elem):
+        if YangUtil.local_name(child.tag) == mkey:
+            return child
+    return None
+
+
+class EditObject(object):
+
+    def __init__(self, netconf_data, path, converter=None):
+        # netconf_data is a cmdb element with this object only, path
+        # its xpath (used as error-path)
+        self.netconf_data = netconf_data
+        self.path = path
+        (self.url, self.content, self.operation) = \
+            (converter or Yang2RestConverter()).extract_url_content_operation(netconf_data)
+
+        # The object itself, once created, is at url/<mkey value>
+        self.mkey = None
+        self.mkey_value = None
+        elem = netconf_data
+        while len(elem) and not YangUtil.contains_operation(elem):
+            elem = elem[-1]
+        mkey = _mkey_child(elem)
+        if mkey is not None:
+            self.mkey = YangUtil.local_name(mkey.tag)
+            self.mkey_value = (mkey.text or '').strip()
+
+        # Entries (attribute -> value, as in content) of a whole table, None for an object
+        self.entries = None
+        children = _children(elem)
+        if children and all(YangUtil.local_name(x.tag) == ENTRY_TAG for x in children):
+            self.entries = [dict((YangUtil.local_name(x.tag), YangUtil.content_value(x))
+                                 for x in _children(entry))
+                            for entry in children]
+            self.content = {}
+            self.mkey = elem.get('mkey') or DEFAULT_TABLE_MKEY
+
+        self.state = None
+        self.http_status = None
+        self.error = None
+        self.previous = None
+
+    @classmethod
+    def for_content(cls, url, operation, content, path, mkey=None, mkey_value=None):
+        """Object already translated to REST, with no Netconf element"""
+        obj = cls.__new__(cls)
+        obj.netconf_data = None
+        obj.path = path
+        (obj.url, obj.content, obj.operation) = (url, content, operation)
+        (obj.mkey, obj.mkey_value) = (mkey, mkey_value)
+        obj.entries = None
+        obj.state = None
+        obj.http_status = None
+        obj.error = None
+        obj.previous = None
+        return obj
+
+    def __str__(self):
+        return "EditObject({}, {})".format(self.operation, self.path)
+
+
+def _path_step(elem):
+    step = "/" + YangUtil.local_name(elem.tag)
+    mkey = _mkey_child(elem)
+    if mkey is not None:
+        step += "[{}='{}']".format(YangUtil.local_name(mkey.tag), (mkey.text or '').strip())
+    return step
+
+
+def _object_tree(ancestors, elem):
+    # Copy of the ancestors keeping only their mkey (in position 0, as the
+    # translation expects) and the object
+    root = None
+    parent = None
+    for ancestor in ancestors:
+        node = ancestor.makeelement(ancestor.tag, ancestor.attrib, ancestor.nsmap)
+        mkey = _mkey_child(ancestor)
+        if mkey is not None:
+            node.append(copy.deepcopy(mkey))
+        if parent is None:
+            root = node
+        else:
+            parent.append(node)
+        parent = node
+    parent.append(copy.deepcopy(elem))
+    return root
+
+
+def split_config(netconf_data, converter=None):
+    """Returns the objects (EditObject) of the cmdb element of an edit-config, in order"""
+    objects = []
+    pending = [(netconf_data, [])]
+    while pending:
+        elem, ancestors = pending.pop()
+        if ancestors and YangUtil.contains_operation(elem):
+            path = "".join(_path_step(x) for x in ancestors + [elem])
+            objects.append(EditObject(_object_tree(ancestors, elem), path, converter))
+            continue
+
+        mkey = _mkey_child(elem)
+        for child in reversed(_children(elem)):
+            if child is not mkey:
+                pending.append((child, ancestors + [elem]))
+    return objects
+
+
+def _depth(url):
+    return url.count('/')
+
+
+def plan_waves(objects):
+    """Waves of objects (EditObject) to run one after the other, see BulkEdit.run_waves
+
+    An object given again waits for its previous edit, a delete of an
+    object given again after it is not moved to the end.
+    """
+    tables = OrderedDict()
+    for obj in objects:
+        tables.setdefault(obj.url, []).append(obj)
+    # Stable, tables keep their order among the same depth
+    urls = sorted(tables, key=_depth)
+
+    waves = []
+    deletes = {}
+    for url in urls:
+        remaining = Counter(obj.mkey_value for obj in tables[url] if obj.mkey_value)
+        edits = Counter()
+        rounds = []
+        deletes[url] = []
+        for obj in tables[url]:
+            key = obj.mkey_value
+            if key:
+                remaining[key] -= 1
+            if obj.operation == 'delete' and not (key and remaining[key]):
+                deletes[url].append(obj)
+                continue
+            edit = 0
+            if key:
+                edit = edits[key]
+                edits[key] += 1
+            if edit == len(rounds):
+                rounds.append([])
+            rounds[edit].append(obj)
+        waves.extend(rounds)
+    for url in reversed(urls):
+        waves.append(deletes[url])
+    return [x for x in waves if x]
+
+
+class BulkEdit(object):
+
+    def __init__(self, rest_caller, executor, window=8, error_option=STOP_ON_ERROR):
+        # rest_caller is shared by the threads of executor
+        assert error_option in ERROR_OPTIONS
+        self._rc = rest_caller
+        # The state restored by a rollback is read from FortiGate, never cached
+        self._live_rc = copy.copy(rest_caller)
+        self._live_rc.set_cache(None)
+        self._executor = executor
+        self._window = max(window, 1)
+        self._error_option = error_option
+
+    def _snapshot(self, obj):
+        # State of the object before modifying it, None if it does not exist
+        if obj.operation == 'create' or not obj.mkey_value:
+            return None
+        http_status, result = self._live_rc.execute_rest_call(None, obj.url + "/" + obj.mkey_value, {})
+        if http_status != 200:
+            return None
+        if isinstance(result, list):
+            return result[0] if result else None
+        return result
+
+    def _apply(self, obj):
+        # Objects may be run again (e.g. the commit of a candidate after an error)
+        obj.error = None
+        obj.previous = None
+        if self._error_option == ROLLBACK_ON_ERROR:
+            obj.previous = self._snapshot(obj)
+        obj.http_status, status = self._rc.execute_rest_call(obj.operation, obj.url, obj.content)
+        if obj.http_status != 200:
+            obj.error = 'http-result:' + str(obj.http_status) + ', ' + str(status)
+        return obj
+
+    def _undo(self, obj):
+        if obj.operation == 'delete':
+            undo = ('create', obj.previous) if obj.previous is not None else None
+        elif obj.operation == 'create' or obj.previous is None:
+            undo = ('delete', obj.content)
+        else:
+            undo = ('replace', obj.previous)
+
+        try:
+            if undo is not None:
+                http_status, status = self._rc.execute_rest_call(undo[0], obj.url, dict(undo[1]))
+                if http_status != 200:
+                    raise Exception('http-result:' + str(http_status) + ', ' + str(status))
+            obj.state = ROLLED_BACK
+        except Exception as error:  # pylint: disable=W0703
+            logger.error("%s: Rollback failed: %s", str(obj), str(error))
+            obj.state = ROLLBACK_FAILED
+            obj.error = str(error)
+
+    def run(self, objects):
+        """Modifies the objects, returns True if all of them were applied
+
+        The state (and error) of every object tells what happened to it.
+        """
+        pending = list(objects)
+        pending.reverse()
+        running = {}
+        failed = False
+
+        while pending or running:
+            while pending and len(running) < self._window \
+                    and not (failed and self._error_option != CONTINUE_ON_ERROR):
+                obj = pending.pop()
+                running[self._executor.submit(self._apply, obj)] = obj
+
+            if not running:
+                break
+            done, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                obj = running.pop(future)
+                try:
+                    future.result()
+                except Exception as error:  # pylint: disable=W0703
+                    obj.error = str(error)
+                if obj.error is None:
+                    obj.state = APPLIED
+                else:
+                    logger.debug("%s: Failed: %s", str(obj), obj.error)
+                    obj.state = FAILED
+                    failed = True
+
+        for obj in pending:
+            obj.state = SKIPPED
+
+        if failed and self._error_option == ROLLBACK_ON_ERROR:
+            self.rollback(objects)
+
+        return not failed
+
+    def rollback(self, objects):
+        """Restores the objects applied, in reverse order"""
+        for obj in reversed(objects):
+            if obj.state == APPLIED:
+                self._undo(obj)
+
+    def run_waves(self, waves):
+        """Runs lists of objects one after the other, each one as run
+
+        The error option applies to all of them: after an error the
+        next waves are skipped (but with continue-on-error) and, with
+        rollback-on-error, the previous ones restored too.
+        """
+        done = []
+        failed = False
+        for wave in waves:
+            if failed and self._error_option != CONTINUE_ON_ERROR:
+                for obj in wave:
+                    obj.state = SKIPPED
+                continue
+            failed = not self.run(wave) or failed
+            done.extend(wave)
+
+        if failed and self._error_option == ROLLBACK_ON_ERROR:
+            self.rollback(done)
+        return not failed
@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Candidate datastore of one FortiGate.
+#
+# edit-configs of the candidate are not sent to FortiGate: their
+# objects (see bulkedit.py) are kept as a change set, one entry per
+# object in the order they were first edited. Edits of an object
+# already in the change set are collapsed with the pending one, so
+# the commit sends at most one call per object (two when an object
+# is deleted and created again):
+#
+#   create + merge/replace -> create      merge + merge -> merge
+#   create + delete        -> nothing     merge/replace + replace -> replace
+#   delete + create/merge  -> delete, create
+#
+# The commit plan is a list of waves run one after the other, the
+# objects of a wave are independent and sent concurrently. Objects
+# of a table may refer to the ones of the tables edited before
+# (e.g. address groups to addresses) and child objects need their
+# parent, so tables are created/modified in order of first edit,
+# children after parents, and deleted the other way round.
+#
+# Edits wait while a commit is running, so they are never mixed
+# with the changes being sent.
+#
+#************************************************
+"""
+
+import copy
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Netconf error-tag of the errors
+DATA_EXISTS = "data-exists"
+DATA_MISSING = "data-missing"
+INVALID_VALUE = "invalid-value"
+
+
+class CandidateError(Exception):
+
+    def __init__(self, message, path=None, tag=INVALID_VALUE):
+        super(CandidateError, self).__init__(message)
+        self.path = path
+        self.tag = tag
+
+
+def _with(obj, operation, content):
+    # Copy of an EditObject with another operation and content
+    changed = copy.copy(obj)
+    changed.operation = operation
+    changed.content = content
+    return changed
+
+
+def _merged(calls, obj):
+    content = dict(calls[-1].content)
+    content.update(obj.content)
+    return content
+
+
+def _collapse(calls, obj):
+    """Pending calls of an object once obj is edited too
+
+    calls is one of [create], [merge], [replace], [delete] or
+    [delete, create]: the object is new, modified, deleted or
+    created again.
+    """
+    first = calls[0].operation
+    last = calls[-1].operation
+    operation = obj.operation
+
+    if operation == 'create':
+        if last != 'delete':
+            raise CandidateError("Object already exists in the candidate", obj.path, DATA_EXISTS)
+        return [calls[0], obj]
+
+    if operation == 'delete':
+        if last == 'delete':
+            raise CandidateError("Object already deleted in the candidate", obj.path, DATA_MISSING)
+        if first == 'create':
+            return []
+        return [calls[0] if first == 'delete' else obj]
+
+    # merge or replace
+    if last == 'delete':
+        return [calls[0], _with(obj, 'create', dict(obj.content))]
+    content = _merged(calls, obj) if operation == 'merge' else dict(obj.content)
+    if last == 'create':
+        return calls[:-1] + [_with(obj, 'create', content)]
+    return [_with(obj, 'replace' if 'replace' in (last, operation) else 'merge', content)]
+
+
+def _depth(url):
+    return url.count('/')
+
+
+class Candidate(object):
+
+    def __init__(self):
+        # (url, mkey value) -> pending calls of the object, see _collapse
+        self._changes = OrderedDict()
+        self._unkeyed = itertools.count()
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._stats = {'edits': 0,
+                       'collapsed': 0,
+                       'commits': 0,
+                       'discards': 0}
+
+    def _key(self, obj):
+        if obj.mkey_value:
+            return (obj.url, obj.mkey_value)
+        if obj.operation == 'create':
+            # Created with an id given by FortiGate, never the same object
+            return (obj.url, None, next(self._unkeyed))
+        return (obj.url, None)
+
+    def edit(self, objects):
+        """Adds the objects (EditObject) of an edit-config to the change set
+
+        All or none are added, CandidateError if one conflicts with a pending change.
+        """
+        with self._commit_lock, self._lock:
+            changes = OrderedDict(self._changes)
+            collapsed = 0
+            for obj in objects:
+                key = self._key(obj)
+                calls = changes.get(key)
+                if calls is None:
+                    changes[key] = [obj]
+                    continue
+                collapsed += 1
+                calls = _collapse(calls, obj)
+                if calls:
+                    changes[key] = calls
+                else:
+                    del changes[key]
+            self._changes = changes
+            self._stats['edits'] += len(objects)
+            self._stats['collapsed'] += collapsed
+
+    def changes(self):
+        """Pending calls, a list of lists of EditObject (one per object)"""
+        with self._lock:
+            return list(self._changes.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._changes)
+
+    def discard(self):
+        with self._commit_lock, self._lock:
+            self._changes = OrderedDict()
+            self._stats['discards'] += 1
+
+    @contextmanager
+    def committing(self):
+        """Yields the pending changes, edits wait until the commit is done"""
+        with self._commit_lock:
+            yield self.changes()
+
+    def committed(self):
+        """Empties the candidate once the changes are in FortiGate (call while committing)"""
+        with self._lock:
+            self._changes = OrderedDict()
+            self._stats['commits'] += 1
+
+    @staticmethod
+    def plan(changes):
+        """Waves of EditObject to send in order, the objects of a wave concurrently"""
+        tables = OrderedDict()
+        for calls in changes:
+            tables.setdefault(calls[0].url, []).append(calls)
+        # Stable, tables keep their order of first edit among the same depth
+        urls = sorted(tables, key=_depth)
+
+        waves = []
+        for url in urls:
+            waves.append([calls[0] for calls in tables[url] if len(calls) == 2])
+            waves.append([calls[-1] for calls in tables[url] if calls[-1].operation != 'delete'])
+        for url in reversed(urls):
+            waves.append([calls[0] for calls in tables[url] if len(calls) == 1
+                          and calls[0].operation == 'delete'])
+        return [x for x in waves if x]
+
+    @staticmethod
+    def validate(changes):
+        """Errors (CandidateError) found in the change set without asking FortiGate"""
+        errors = []
+        for calls in changes:
+            for obj in calls:
+                if not obj.url:
+                    errors.append(CandidateError("No REST path for the object", obj.path))
+                elif obj.operation == 'delete' and not obj.mkey_value:
+                    # FortiGate would delete the whole table
+                    errors.append(CandidateError("Delete without the key of the object",
+                                                 obj.path, DATA_MISSING))
+        return errors
+
+    def overlay(self, url, entries):
+        """Entries read from FortiGate at url as they are in the candidate
+
+        Only objects at url (a table) or the object url itself are
+        considered, not the changes to their child objects.
+        """
+        parent, _, name = url.rpartition('/')
+        with self._lock:
+            changed = OrderedDict()
+            for key, calls in self._changes.items():
+                if key[0] == url and key[1] is not None:
+                    changed[key[1]] = calls
+                elif key[0] == parent and key[1] == name:
+                    changed[name] = calls
+        if not changed:
+            return entries
+
+        mkey = next(iter(changed.values()))[-1].mkey
+        result = []
+        for entry in entries:
+            calls = changed.pop(str(entry.get(mkey)), None)
+            if calls is None:
+                result.append(entry)
+                continue
+            last = calls[-1]
+            if last.operation == 'delete':
+                continue
+            if last.operation == 'merge':
+                merged = dict(entry)
+                merged.update(last.content)
+                result.append(merged)
+            else:
+                result.append(dict(last.content))
+        # New objects, at the end as FortiGate would add them
+        result.extend(dict(calls[-1].content) for calls in changed.values()
+                      if calls[-1].operation != 'delete')
+        return result
+
+    def touches(self, url):
+        """Whether there are pending changes of objects at url (see overlay)"""
+        parent, _, name = url.rpartition('/')
+        with self._lock:
+            return any(key[0] == url or (key[0] == parent and key[1] == name)
+                       for key in self._changes)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._changes)
+        return stats
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Fan-out of get/get-config filters selecting several tables.
+#
+# The api type (cmdb, monitor) and the two tags below it name the
+# REST path of a table (e.g. firewall and address). A filter with
+# several siblings on those levels is split in one filter per
+# table, each one translated to its own REST call. The calls are
+# run concurrently and their converted answers are nested again
+# under the containers of the filter, in the order requested:
+#
+#   <cmdb><firewall><address/><addrgrp/></firewall></cmdb>
+#
+# is answered with (in a single <data>, see netconf-rest.py)
+#
+#   <cmdb><firewall><address>...</address><addrgrp>...</addrgrp></firewall></cmdb>
+#
+#************************************************
+"""
+
+import copy
+import logging
+
+from lxml import etree
+
+from yang2rest.yang2restconverter import YangUtil
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+API_TYPES = ("cmdb", "monitor")
+
+# Levels below the api type naming the REST path of a table
+TABLE_LEVELS = 2
+
+
+def _children(elem):
+    # Comments and processing instructions are not part of the filter
+    return [x for x in elem if isinstance(x.tag, str)]
+
+
+def _split(elem, level, containers):
+    children = _children(elem)
+    if level == TABLE_LEVELS or not children:
+        # Copied, the request is left untouched
+        return [(containers, copy.deepcopy(elem) if level else elem)]
+
+    subtrees = []
+    for child in children:
+        for tags, subtree in _split(child, level + 1, containers + [YangUtil.local_name(child.tag)]):
+            parent = elem.makeelement(elem.tag, elem.attrib, elem.nsmap)
+            parent.text = elem.text
+            parent.append(subtree)
+            subtrees.append((tags, parent))
+    return subtrees
+
+
+def split_filter(netconf_filter):
+    """Splits a filter in one subtree per table
+
+    Returns a list of (containers, netconf_data): netconf_data is the
+    cmdb/monitor element of a filter selecting a single table, containers
+    the local names of its tags down to the table. A filter selecting a
+    single table gives its own element, not a copy.
+    """
+    subtrees = []
+    for netconf_data in _children(netconf_filter):
+        api_type = YangUtil.local_name(netconf_data.tag)
+        if api_type not in API_TYPES:
+            subtrees.append(([api_type], netconf_data))
+            continue
+        subtrees.extend(_split(netconf_data, 0, [api_type]))
+
+    if len(subtrees) == 1:
+        containers = subtrees[0][0]
+        return [(containers, _children(netconf_filter)[0])]
+    return subtrees
+
+
+def nest_results(results):
+    """Builds the containers of a list of (containers, nodes) with the nodes inside
+
+    Nodes are a list of elements or the text of the innermost container.
+    """
+    roots = []
+    built = {}
+    for containers, nodes in results:
+        parent = None
+        path = ()
+        for tag in containers:
+            path += (tag,)
+            elem = built.get(path)
+            if elem is None:
+                if parent is None:
+                    elem = etree.Element(tag)
+                    roots.append(elem)
+                else:
+                    elem = etree.SubElement(parent, tag)
+                built[path] = elem
+            parent = elem
+
+        if isinstance(nodes, str):
+            parent.text = nodes
+        elif nodes:
+            parent.extend(nodes)
+    return roots
+
+
+def fan_out(executor, read, subtrees):
+    """Runs read(netconf_data) for every subtree in executor and nests the answers
+
+    read returns the converted answer of a subtree (see nest_results). If any
+    read fails the first error, in request order, is raised once all are done.
+    """
+    pending = [(containers, executor.submit(read, netconf_data))
+               for containers, netconf_data in subtrees]
+
+    results = []
+    error = None
+    for containers, future in pending:
+        try:
+            results.append((containers, future.result()))
+        except Exception as e:  # pylint: disable=W0703
+            logger.debug("Reading %s failed: %s", "/".join(containers), str(e))
+            if error is None:
+                error = e
+
+    if error is not None:
+        raise error
+    return nest_results(results)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Inventory of the FortiGates served by one gateway.
+#
+# Every device has its own REST session pool, answer cache and
+# coalescer, and a bound on the Netconf RPCs running against it
+# so a slow device cannot take all the RPC workers. The REST calls
+# sent to it go through a scheduler (see scheduler.py) bounding the
+# calls in flight (max_inflight) and per second (rate, burst). Its
+# cmdb tables can be mirrored locally (see mirror.py), revalidated
+# with the monitor call revision_url (see revision.py), and it has
+# its own candidate datastore (see candidate.py).
+#
+# Requests are routed to a device, in order of precedence, by a
+# <target> element in the filter/config, the SSH subsystem
+# (netconf@<device>), the Netconf username or the default device.
+# A device with a users list is only served to those users, however
+# the request is routed; devices without it are served to anyone.
+#
+# The inventory is a json document:
+#
+#   {"default": "fw1",
+#    "devices": {"fw1": {"host": "192.168.122.40", "username": "admin",
+#                        "password": "", "users": ["alice"]},
+#                "fw2": {"host": "10.0.0.2", "username": "admin",
+#                        "password": "x", "https": true,
+#                        "pool_size": 2, "max_rpcs": 4,
+#                        "max_inflight": 2, "rate": 10, "burst": 20}}}
+#
+# and can be reloaded at any time: devices whose parameters did not
+# change keep their sessions and cache. Replaced devices are closed
+# once the requests using them are done, their candidate is kept by
+# the new device if it is still the same FortiGate (host).
+#
+#************************************************
+"""
+
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+from yang2rest.candidate import Candidate
+from yang2rest.restcaller import RestCaller
+from yang2rest.scheduler import RestScheduler
+from yang2rest.singleflight import SingleFlight
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+SUBSYSTEM_PREFIX = "netconf@"
+TARGET_TAG = "target"
+
+DEFAULT_MAX_RPCS = 8
+DEFAULT_MAX_INFLIGHT = 4
+
+
+class UnknownDeviceError(Exception):
+    pass
+
+
+class DeviceBusyError(Exception):
+    pass
+
+
+class DeviceAccessError(Exception):
+    pass
+
+
+def load_inventory_file(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def pop_target(container):
+    # Removes the <target> child of a filter/config element and
+    # returns its text (the device name), None if there is none.
+    if container is None:
+        return None
+    for child in container:
+        if isinstance(child.tag, str) and child.tag.rpartition('}')[2] == TARGET_TAG:
+            container.remove(child)
+            return (child.text or '').strip()
+    return None
+
+
+class Device(object):
+
+    def __init__(self, name, config, pool_factory, cache_factory=None, mirror_factory=None,
+                 candidate=None):
+        # pool_factory(config) returns the REST session pool of the device,
+        # cache_factory(config) its answer cache (None for no cache) and
+        # mirror_factory(device) its config mirror (None for no mirror).
+        # candidate is the one of the device replaced, if any.
+        self.name = name
+        self.config = config
+        self.pool = pool_factory(config)
+        self.cache = cache_factory(config) if cache_factory is not None else None
+        self.coalescer = SingleFlight()
+        self.scheduler = RestScheduler(config.get('max_inflight', DEFAULT_MAX_INFLIGHT),
+                                       config.get('rate'), config.get('burst'))
+        self.mirror = mirror_factory(self) if mirror_factory is not None else None
+        self.candidate = candidate if candidate is not None else Candidate()
+
+        self._max_rpcs = config.get('max_rpcs', DEFAULT_MAX_RPCS)
+        self._limit = threading.BoundedSemaphore(self._max_rpcs)
+        self._lock = threading.Lock()
+        # Requests using the device (see hold), it is closed after the last one
+        self._holders = 0
+        self._closing = False
+        self._closed = False
+        self._stats = {'rpcs': 0,
+                       'running': 0,
+                       'rejected': 0}
+
+    def __str__(self):
+        return "Device({}, host:{})".format(self.name, self.config.get('host'))
+
+    def acquire(self, timeout=None):
+        # Bounds the RPCs running against the device, waits at most
+        # timeout seconds for one to finish before giving up.
+        if timeout is None:
+            acquired = self._limit.acquire()
+        else:
+            acquired = self._limit.acquire(True, timeout)
+        if not acquired:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise DeviceBusyError("Too many requests in progress for FortiGate " + self.name)
+
+        try:
+            self.hold()
+        except DeviceBusyError:
+            self._limit.release()
+            raise
+        with self._lock:
+            self._stats['rpcs'] += 1
+            self._stats['running'] += 1
+
+    def release(self):
+        with self._lock:
+            self._stats['running'] -= 1
+        self._limit.release()
+        self.unhold()
+
+    def hold(self):
+        # Keeps the device open until unhold, e.g. while a table is
+        # streamed once the RPC slot is released.
+        with self._lock:
+            if self._closed:
+                raise DeviceBusyError("FortiGate " + self.name + " was removed or reloaded")
+            self._holders += 1
+
+    def unhold(self):
+        with self._lock:
+            self._holders -= 1
+            close = self._closing and not self._holders and not self._closed
+            if close:
+                self._closed = True
+        if close:
+            self._close()
+
+    @contextmanager
+    def slot(self, timeout=None):
+        self.acquire(timeout)
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def rest_caller(self):
+        rc = RestCaller()
+        rc.set_fos(self.pool)
+        rc.set_cache(self.cache)
+        rc.set_coalescer(self.coalescer)
+        rc.set_scheduler(self.scheduler)
+        return rc
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['host'] = self.config.get('host')
+        stats['max-rpcs'] = self._max_rpcs
+        stats['fortigate-pool'] = self.pool.stats()
+        if self.cache is not None:
+            stats['response-cache'] = self.cache.stats()
+        stats['read-coalescing'] = self.coalescer.stats()
+        stats['scheduler'] = self.scheduler.stats()
+        if self.mirror is not None:
+            stats['config-mirror'] = self.mirror.stats()
+        stats['candidate'] = self.candidate.stats()
+        return stats
+
+    def close(self):
+        # Requests still holding the device can finish, it is closed after them
+        with self._lock:
+            self._closing = True
+            close = not self._holders and not self._closed
+            if close:
+                self._closed = True
+        if close:
+            self._close()
+
+    def _close(self):
+        logger.debug("%s: Closed", str(self))
+        if self.mirror is not None:
+            self.mirror.close()
+        self.pool.close()
+
+
+class DeviceInventory(object):
+
+    def __init__(self, load, pool_factory, cache_factory=None, mirror_factory=None):
+        # load() returns the inventory document, it is called again
+        # on every reload().
+        self._load = load
+        self._pool_factory = pool_factory
+        self._cache_factory = cache_factory
+        self._mirror_factory = mirror_factory
+
+        self._devices = {}
+        self._users = {}
+        self._default = None
+        self._lock = threading.Lock()
+        self._stats = {'reloads': 0}
+
+        self.reload()
+
+    def reload(self):
+        inventory = self._load()
+        configs = inventory.get('devices', {})
+        default = inventory.get('default')
+        if default is not None and default not in configs:
+            raise UnknownDeviceError("Default FortiGate " + default + " is not in the inventory")
+
+        with self._lock:
+            current = self._devices
+
+        devices = {}
+        users = {}
+        for name, config in configs.items():
+            device = current.get(name)
+            if device is None or device.config != config:
+                candidate = None
+                if device is not None and device.config.get('host') == config.get('host'):
+                    candidate = device.candidate
+                device = Device(name, config, self._pool_factory, self._cache_factory,
+                                self._mirror_factory, candidate)
+            devices[name] = device
+            for user in config.get('users', []):
+                users[user] = device
+
+        with self._lock:
+            self._devices = devices
+            self._users = users
+            self._default = default
+            self._stats['reloads'] += 1
+
+        # Calls already running keep using the replaced devices, they are
+        # closed once the last one ends.
+        for name, device in current.items():
+            if devices.get(name) is not device:
+                logger.info("%s: Removed from the inventory", str(device))
+                if len(device.candidate) and (name not in devices or
+                                              devices[name].candidate is not device.candidate):
+                    logger.warning("%s: Pending candidate changes discarded", str(device))
+                device.close()
+
+        logger.info("FortiGate inventory loaded: %d devices", len(devices))
+
+    def route(self, username=None, target=None, subsystem=None):
+        with self._lock:
+            if target:
+                name = target
+            elif subsystem and subsystem.startswith(SUBSYSTEM_PREFIX):
+                name = subsystem[len(SUBSYSTEM_PREFIX):]
+            elif username in self._users:
+                return self._users[username]
+            else:
+                name = self._default
+
+            if name is None:
+                raise UnknownDeviceError("No FortiGate for user " + str(username))
+            if name not in self._devices:
+                raise UnknownDeviceError("Unknown FortiGate " + name)
+            device = self._devices[name]
+
+        allowed = device.config.get('users')
+        if allowed is not None and username not in allowed:
+            raise DeviceAccessError("FortiGate " + name + " not allowed for user " + str(username))
+        return device
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices.values())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            devices = list(self._devices.values())
+        stats['devices'] = dict((x.name, x.stats()) for x in devices)
+        return stats
+
+    def close(self):
+        with self._lock:
+            devices = self._devices
+            self._devices = {}
+            self._users = {}
+        for device in devices.values():
+            device.close()
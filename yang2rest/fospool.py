@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Pool of authenticated FortiOSAPI sessions.
+#
+# Logging in and out of the FortiGate on every Netconf RPC costs
+# two extra round trips per request. The pool keeps a bounded set
+# of logged in FortiOSAPI objects that are checked out for a single
+# REST call and returned afterwards. Idle sessions are kept alive
+# and expired sessions are logged in again transparently.
+#
+# The pool exposes the same get/monitor/post/put/delete methods as
+# FortiOSAPI so it can be handed to RestCaller.set_fos directly.
+#
+#************************************************
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+HTTP_UNAUTHORIZED = 401
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _PooledSession(object):
+
+    def __init__(self, fos):
+        self.fos = fos
+        self.last_used = time.time()
+
+
+class FortiOSAPIPool(object):
+
+    def __init__(self, fos_class, host, username, password,
+                 size=4, https=False, keepalive=60):
+        self._fos_class = fos_class
+        self._host = host
+        self._username = username
+        self._password = password
+        self._https = https
+        self._size = size
+        self._keepalive = keepalive
+
+        self._idle = []
+        self._created = 0
+        self._closed = False
+        self._cv = threading.Condition()
+
+        self._stats = {'logins': 0,
+                       'relogins': 0,
+                       'waits': 0,
+                       'keepalives': 0,
+                       'discarded': 0}
+
+        self._keepalive_thread = None
+        if keepalive:
+            self._keepalive_thread = threading.Thread(target=self._keepalive_loop,
+                                                      name="FortiOSAPIPoolKeepalive")
+            self._keepalive_thread.daemon = True
+            self._keepalive_thread.start()
+
+    def __str__(self):
+        return "FortiOSAPIPool(host:{}, size:{})".format(self._host, self._size)
+
+    def _login(self, fos):
+        fos.login(self._host, self._username, self._password)
+        with self._cv:
+            self._stats['logins'] += 1
+
+    def _new_session(self):
+        fos = self._fos_class()
+        fos.https('on' if self._https else 'off')
+        self._login(fos)
+        logger.debug("%s: New FortiOSAPI session opened", str(self))
+        return _PooledSession(fos)
+
+    def _discard(self, pooled):
+        with self._cv:
+            self._created -= 1
+            self._stats['discarded'] += 1
+            self._cv.notify()
+        try:
+            pooled.fos.logout()
+        except Exception as error:
+            logger.debug("%s: Error while discarding session: %s", str(self), str(error))
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cv:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("FortiOSAPI pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self._size:
+                    self._created += 1
+                    break
+                self._stats['waits'] += 1
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeoutError("Timeout waiting for a FortiOSAPI session")
+                self._cv.wait(remaining)
+
+        # Login happens outside the lock so other requests are not blocked meanwhile
+        try:
+            return self._new_session()
+        except Exception:
+            with self._cv:
+                self._created -= 1
+                self._cv.notify()
+            raise
+
+    def release(self, pooled):
+        pooled.last_used = time.time()
+        with self._cv:
+            if not self._closed:
+                self._idle.append(pooled)
+                self._cv.notify()
+                return
+        self._discard(pooled)
+
+    @contextmanager
+    def session(self, timeout=None):
+        pooled = self.acquire(timeout)
+        try:
+            yield pooled.fos
+        except Exception:
+            # Session state is unknown after a failure, do not hand it out again
+            self._discard(pooled)
+            raise
+        else:
+            self.release(pooled)
+
+    @staticmethod
+    def _is_expired(result):
+        if isinstance(result, dict):
+            return result.get('http_status') == HTTP_UNAUTHORIZED
+        return getattr(result, 'status_code', None) == HTTP_UNAUTHORIZED
+
+    def _call(self, method_name, *args, **kwargs):
+        with self.session() as fos:
+            result = getattr(fos, method_name)(*args, **kwargs)
+            if self._is_expired(result):
+                logger.info("%s: FortiGate session expired, login again", str(self))
+                with self._cv:
+                    self._stats['relogins'] += 1
+                self._login(fos)
+                result = getattr(fos, method_name)(*args, **kwargs)
+            return result
+
+    def get(self, *args, **kwargs):
+        return self._call('get', *args, **kwargs)
+
+    def monitor(self, *args, **kwargs):
+        return self._call('monitor', *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self._call('post', *args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self._call('put', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call('delete', *args, **kwargs)
+
+    def _keepalive_loop(self):
+        while True:
+            time.sleep(self._keepalive / 2.0)
+            with self._cv:
+                if self._closed:
+                    return
+                limit = time.time() - self._keepalive
+                stale = [x for x in self._idle if x.last_used < limit]
+                for pooled in stale:
+                    self._idle.remove(pooled)
+
+            for pooled in stale:
+                try:
+                    result = pooled.fos.monitor('system', 'status')
+                    if self._is_expired(result):
+                        self._login(pooled.fos)
+                    with self._cv:
+                        self._stats['keepalives'] += 1
+                except Exception as error:
+                    logger.warning("%s: Keepalive failed, dropping session: %s",
+                                   str(self), str(error))
+                    self._discard(pooled)
+                    continue
+                self.release(pooled)
+
+    def stats(self):
+        with self._cv:
+            stats = dict(self._stats)
+            stats['size'] = self._size
+            stats['open'] = self._created
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._created - len(self._idle)
+        return stats
+
+    def close(self):
+        with self._cv:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._cv.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
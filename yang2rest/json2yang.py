@@ -25,6 +25,10 @@
 # This is intended to transform JSON content typically coming
 # from a REST answer into a YANG structure using XML nodes (lxml)
 #
+# IterativeJson2Yang produces exactly the same nodes without
+# recursion, building children in place. It is meant for very
+# large tables (e.g. tens of thousands of firewall policies).
+#
 #************************************************
 """
 
@@ -45,6 +49,10 @@ __maintainer__ = "Miguel Ángel Muñoz"
 __email__ = "magonzalez at fortinet.com"
 __status__ = "Development"
 
+# Sanitized tags kept at most, the keys of some answers (e.g. monitor
+# ones keyed by address or serial number) are not a bounded set
+MAX_CACHED_TAGS = 4096
+
 
 class Json2Yang():
 
@@ -105,10 +113,73 @@ class Json2Yang():
 
         return result
 
+    def convert_structure(self, json_structure):
+        # Converts an already decoded JSON structure (dicts, lists, and
+        # scalars as returned by FortiOSAPI) with no intermediate string
+
+        yang_result = self._yang_builder(json_structure)
+
+        return yang_result
+
     def convert_json(self, string):
 
         json_structure = json.loads(string)
 
-        yang_result = self._yang_builder(json_structure)
+        return self.convert_structure(json_structure)
 
-        return yang_result
+
+class IterativeJson2Yang(Json2Yang):
+
+    # Sanitized tags are shared by all instances, keys repeat on every
+    # entry of a table and across requests.
+    _tag_cache = {}
+
+    def _fixed_tag(self, key):
+        tag = self._tag_cache.get(key)
+        if tag is None:
+            tag = self._check_tag_and_fix(key)
+            if len(self._tag_cache) >= MAX_CACHED_TAGS:
+                self._tag_cache.clear()
+            self._tag_cache[key] = tag
+        return tag
+
+    def _yang_builder(self, json_structure):
+
+        json_type = type(json_structure)
+
+        if json_type is str:
+            return json_structure
+        elif json_type is not list and json_type is not dict:
+            return str(json_structure)
+
+        # Top level nodes are returned detached, as the recursive builder does
+        result = []
+        pending = []
+        if json_type is list:
+            for elem in json_structure:
+                node = etree.Element('element')
+                result.append(node)
+                pending.append((node, elem))
+        else:
+            for elem in json_structure:
+                node = etree.Element(self._fixed_tag(elem))
+                result.append(node)
+                pending.append((node, json_structure[elem]))
+
+        sub_element = etree.SubElement
+        fixed_tag = self._fixed_tag
+        while pending:
+            node, value = pending.pop()
+            value_type = type(value)
+            if value_type is dict:
+                for elem in value:
+                    pending.append((sub_element(node, fixed_tag(elem)), value[elem]))
+            elif value_type is list:
+                for elem in value:
+                    pending.append((sub_element(node, 'element'), elem))
+            elif value_type is str:
+                node.text = value
+            else:
+                node.text = str(value)
+
+        return result
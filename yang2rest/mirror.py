@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Local mirror of the cmdb tables of one FortiGate.
+#
+# A table (cmdb/<path>/<name>) is read whole from FortiGate the
+# first time it is requested and then kept in memory. get-config
+# is answered from the mirror as long as the table is not older
+# than max_staleness seconds, otherwise it is read again before
+# answering. A thread refreshes every refresh_interval seconds the
+# tables read recently, so answers rarely wait for FortiGate, and
+# forgets the tables not read for idle_timeout seconds.
+#
+# Tables are always read from FortiGate, never from the response
+# cache (see restcache.py): its TTL would add to max_staleness and a
+# <live/> read could be answered with an older page.
+#
+# Successful modifications of an object update the mirror in place:
+# deleted objects are removed, created or modified ones are read
+# again from FortiGate. Any other modification of a table (child
+# objects, objects without mkey) drops it from the mirror.
+#
+# With a snapshot (see snapshot.py) the tables are restored when
+# the mirror is created and revalidated by a background thread.
+# Like any other, a restored table is only answered while it is at
+# most max_staleness old, else it is revalidated first. The snapshot
+# is written every snapshot_interval seconds and when the mirror is
+# closed.
+#
+# With a revision probe (see revision.py) a table is revalidated
+# instead of read again while the configuration revision is the one
+# it was read at; it is then as recent as the probe answer, which is
+# reused for a while, not as the time it was revalidated at. A table read again with the same payload hash keeps
+# its previous entries, and so their conversion to elements.
+#
+#************************************************
+"""
+
+import logging
+import threading
+import time
+
+from yang2rest.json2yang import IterativeJson2Yang
+from yang2rest.revision import payload_hash
+from yang2rest.scheduler import BACKGROUND
+from yang2rest.yang2restconverter import YangUtil
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+LIVE_TAG = "live"
+
+# cmdb/<path>/<name>
+TABLE_URL_LENGTH = 3
+
+
+def pop_live(container):
+    # Removes the <live/> child of a filter element, asking to read
+    # FortiGate instead of the mirror, and returns whether it was there.
+    if container is None:
+        return False
+    for child in container:
+        if isinstance(child.tag, str) and YangUtil.local_name(child.tag) == LIVE_TAG:
+            container.remove(child)
+            return True
+    return False
+
+
+def table_url(url):
+    """Url of the table an url belongs to, None if it is not in a cmdb table"""
+    splitted_url = url.split('/')
+    if splitted_url[0] != 'cmdb' or len(splitted_url) < TABLE_URL_LENGTH:
+        return None
+    return '/'.join(splitted_url[:TABLE_URL_LENGTH])
+
+
+class _Table(object):
+
+    def __init__(self, url):
+        self.url = url
+        # Entries as answered by FortiGate, replaced (never modified) on updates
+        self.entries = None
+        self.loaded = 0
+        self.read = time.time()
+        # Restored from a snapshot and not read again yet, decoded when first needed
+        self.restored = False
+        self.decode = None
+        # Increased on every update, a refresh started before is discarded
+        self.version = 0
+        # Configuration revision it was read at and hash of the entries (None if unknown)
+        self.revision = None
+        self.hash = None
+        # (entries, elements) of the last conversion
+        self.nodes = None
+        # Serializes loads and updates
+        self.lock = threading.Lock()
+
+
+class ConfigMirror(object):
+
+    def __init__(self, rest_caller, max_staleness=30, refresh_interval=10, idle_timeout=600,
+                 page_size=1000, snapshot=None, snapshot_interval=300, snapshot_max_age=None,
+                 revision_probe=None):
+        # rest_caller() returns a RestCaller towards the FortiGate,
+        # snapshot a MirrorSnapshot and revision_probe a RevisionProbe
+        # (None for no snapshot, tables always read again)
+        self._rest_caller = rest_caller
+        self._max_staleness = max_staleness
+        self._refresh_interval = refresh_interval
+        self._idle_timeout = idle_timeout
+        self._page_size = page_size
+        self._snapshot = snapshot
+        self._snapshot_interval = snapshot_interval
+        self._revision_probe = revision_probe
+
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._refresher = None
+        self._stats = {'hits': 0,
+                       'loads': 0,
+                       'load-errors': 0,
+                       'refreshes': 0,
+                       'updates': 0,
+                       'drops': 0,
+                       'restored': 0,
+                       'revalidations': 0,
+                       'unchanged': 0,
+                       'same-payload': 0,
+                       'conversions': 0,
+                       'snapshots': 0}
+
+        if snapshot is not None:
+            self.restore(snapshot.load(snapshot_max_age))
+
+    @staticmethod
+    def is_mirrored(url):
+        return table_url(url) == url
+
+    def _count(self, stat):
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _table(self, url):
+        with self._lock:
+            table = self._tables.get(url)
+            if table is None:
+                table = _Table(url)
+                self._tables[url] = table
+                if self._refresher is None and self._refresh_interval:
+                    self._refresher = threading.Thread(target=self._refresh_loop,
+                                                       name="ConfigMirror")
+                    self._refresher.daemon = True
+                    self._refresher.start()
+            return table
+
+    def _live_caller(self):
+        rc = self._rest_caller()
+        rc.set_cache(None)
+        return rc
+
+    def _fetch(self, url, background=False):
+        rc = self._live_caller()
+        if background:
+            rc.set_priority(BACKGROUND)
+        entries = []
+        for http_result, http_content in rc.iter_rest_pages(url, self._page_size):
+            if http_result != 200 or not isinstance(http_content, list):
+                self._count('load-errors')
+                raise Exception('http-result:' + str(http_result) + ', ' + str(http_content))
+            entries.extend(http_content)
+        self._count('loads')
+        logger.debug("Mirror of %s loaded, %d entries", url, len(entries))
+        return entries
+
+    def _revision(self):
+        # (revision, time it was probed at)
+        if self._revision_probe is None:
+            return None, None
+        return self._revision_probe.checked_revision()
+
+    def _set(self, table, entries, loaded, revision):
+        # Called with table.lock held
+        self._decode(table)
+        if table.hash is None and table.entries is not None:
+            table.hash = payload_hash(table.entries)
+        digest = payload_hash(entries)
+        if digest == table.hash:
+            self._count('same-payload')
+        else:
+            table.entries = entries
+            table.hash = digest
+            table.nodes = None
+        table.loaded = loaded
+        table.revision = revision
+        table.restored = False
+
+    def _unchanged(self, table, revision, checked):
+        # Called with table.lock held, True if the table was revalidated.
+        # It is as recent as the probe, not as the time it is revalidated at.
+        if revision is None or revision != table.revision:
+            return False
+        table.loaded = max(table.loaded, checked)
+        table.restored = False
+        self._count('unchanged')
+        return True
+
+    @staticmethod
+    def _decode(table):
+        # Called with table.lock held
+        if table.decode is not None:
+            table.entries = table.decode()
+            table.decode = None
+
+    def _reload(self, table):
+        # Reads the table again without blocking the readers meanwhile
+        version = table.version
+        loaded = time.time()
+        # Read before the table, a change in between is found next time
+        revision, checked = self._revision()
+        with table.lock:
+            if table.version == version and self._unchanged(table, revision, checked):
+                return True
+        try:
+            entries = self._fetch(table.url, background=True)
+        except Exception as error:  # pylint: disable=W0703
+            logger.error("Mirror of %s not refreshed: %s", table.url, str(error))
+            return False
+        with table.lock:
+            if table.version != version:
+                return False
+            self._set(table, entries, loaded, revision)
+        return True
+
+    def get(self, url, max_staleness=None):
+        """Entries of the table at url, at most max_staleness seconds old
+
+        0 reads FortiGate, None uses the default bound. The list returned
+        must not be modified.
+        """
+        if max_staleness is None:
+            max_staleness = self._max_staleness
+
+        table = self._table(url)
+        table.read = time.time()
+        with table.lock:
+            self._decode(table)
+            if table.entries is not None and max_staleness and time.time() - table.loaded < max_staleness:
+                self._count('hits')
+                return table.entries
+
+            loaded = time.time()
+            revision, checked = self._revision()
+            if table.entries is not None and max_staleness and self._unchanged(table, revision, checked) \
+                    and time.time() - table.loaded < max_staleness:
+                return table.entries
+            self._set(table, self._fetch(url), loaded, revision)
+            return table.entries
+
+    def nodes(self, url, max_staleness=None):
+        """Same as get, with the entries converted to elements
+
+        The conversion is kept while the entries do not change. The
+        elements returned must not be modified (nor appended elsewhere).
+        """
+        entries = self.get(url, max_staleness)
+        table = self._table(url)
+        with table.lock:
+            if table.nodes is not None and table.nodes[0] is entries:
+                return table.nodes[1]
+            nodes = IterativeJson2Yang().convert_structure(entries)
+            if table.entries is entries:
+                table.nodes = (entries, nodes)
+        self._count('conversions')
+        return nodes
+
+    def update(self, operation, url, mkey=None, mkey_value=None):
+        """Applies a successful modification of the object mkey_value at url"""
+        with self._lock:
+            table = self._tables.get(table_url(url) or url)
+        if table is None:
+            return
+        if url != table.url or not mkey or not mkey_value:
+            self.invalidate(url)
+            return
+
+        with table.lock:
+            self._decode(table)
+            if table.entries is None:
+                return
+            table.version += 1
+            table.revision = None
+            table.hash = None
+            table.nodes = None
+            entries = [x for x in table.entries if str(x.get(mkey)) != mkey_value]
+            if operation != 'delete':
+                try:
+                    http_result, http_content = \
+                        self._live_caller().execute_rest_call(None, url + "/" + mkey_value, {})
+                except Exception as error:  # pylint: disable=W0703
+                    logger.error("Mirror of %s not updated: %s", url, str(error))
+                    http_result, http_content = None, None
+                if http_result != 200 or not isinstance(http_content, list):
+                    table.entries = None
+                    self._count('drops')
+                    return
+                # Modified objects keep their position
+                position = next((i for i, x in enumerate(table.entries)
+                                 if str(x.get(mkey)) == mkey_value), len(entries))
+                entries[position:position] = http_content
+            table.entries = entries
+        self._count('updates')
+
+    def invalidate(self, url):
+        """Drops the table of url, read again when next requested"""
+        with self._lock:
+            table = self._tables.pop(table_url(url) or url, None)
+        if table is not None:
+            self._count('drops')
+            logger.debug("Mirror of %s dropped", table.url)
+
+    def restore(self, tables):
+        """Adds the tables of a snapshot, a list of (url, loaded, revision, decode), and revalidates them"""
+        restored = []
+        for url, loaded, revision, decode in tables:
+            table = self._table(url)
+            with table.lock:
+                if table.entries is None and table.decode is None:
+                    table.loaded = loaded
+                    table.revision = revision
+                    table.restored = True
+                    table.decode = decode
+                    restored.append(table)
+        if not restored:
+            return
+
+        with self._lock:
+            self._stats['restored'] += len(restored)
+        revalidation = threading.Thread(target=self._revalidate, args=(restored,),
+                                        name="ConfigMirrorRevalidation")
+        revalidation.daemon = True
+        revalidation.start()
+
+    def _revalidate(self, tables):
+        for table in tables:
+            if self._closed.is_set():
+                return
+            if table.restored and self._reload(table):
+                self._count('revalidations')
+
+    def snapshot(self):
+        """Returns the tables in the mirror, a list of (url, loaded, revision, entries)"""
+        with self._lock:
+            tables = list(self._tables.values())
+        snapshot = []
+        for table in tables:
+            with table.lock:
+                self._decode(table)
+                if table.entries is not None:
+                    snapshot.append((table.url, table.loaded, table.revision, table.entries))
+        return snapshot
+
+    def write_snapshot(self):
+        if self._snapshot is None:
+            return
+        try:
+            self._snapshot.write(self.snapshot())
+            self._count('snapshots')
+        except Exception as error:  # pylint: disable=W0703
+            logger.error("%s: Not written: %s", str(self._snapshot), str(error))
+
+    def _refresh_loop(self):
+        written = time.time()
+        while not self._closed.wait(self._refresh_interval):
+            now = time.time()
+            with self._lock:
+                tables = list(self._tables.values())
+            for table in tables:
+                if now - table.read > self._idle_timeout:
+                    with self._lock:
+                        if self._tables.get(table.url) is table:
+                            del self._tables[table.url]
+                    continue
+                if (table.entries is None and table.decode is None) or table.restored \
+                        or now - table.loaded < self._refresh_interval:
+                    continue
+                if self._reload(table):
+                    self._count('refreshes')
+
+            if self._snapshot is not None and now - written >= self._snapshot_interval:
+                self.write_snapshot()
+                written = now
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            tables = list(self._tables.values())
+        stats['tables'] = len(tables)
+        stats['entries'] = sum(len(x.entries or ()) for x in tables)
+        stats['max-staleness'] = self._max_staleness
+        if self._revision_probe is not None:
+            stats['revision-probe'] = self._revision_probe.stats()
+        return stats
+
+    def close(self):
+        self._closed.set()
+        self.write_snapshot()
+        with self._lock:
+            self._tables = {}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Cache of compiled Netconf to REST translation plans.
+#
+# Requests repeat the same structure (tags, attributes, mkeys)
+# with different leaf values. The translation of a structure is
+# computed once on a copy of the request where every leaf value
+# is replaced by a placeholder. The result becomes a template and
+# later requests with the same shape just substitute their values.
+#
+# Leaf values are assumed to be copied verbatim by the translation,
+# blank texts are part of the shape since they are not values.
+#
+# A plan takes memory in proportion to its request, and large
+# requests (e.g. whole tables) seldom repeat their shape, so requests
+# of more than max_nodes elements are translated without a plan.
+#
+#************************************************
+"""
+
+import copy
+import itertools
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+from lxml import etree
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Unicode private use characters, valid in XML and not expected in requests
+PLACEHOLDER = u"\ue000{}\ue001"
+PLACEHOLDER_RE = re.compile(u"\ue000(\\d+)\ue001")
+
+
+class TranslationPlanCache(object):
+
+    def __init__(self, max_plans=1024, max_nodes=256):
+        self._max_plans = max_plans
+        self._max_nodes = max_nodes
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0,
+                       'misses': 0,
+                       'evictions': 0,
+                       'too-large': 0}
+
+    @staticmethod
+    def _is_value(text):
+        return text is not None and text.strip() != ""
+
+    @staticmethod
+    def _shape(netconf_data, max_nodes):
+        # None if the request has more than max_nodes elements
+        shape = []
+        values = []
+        for elem in netconf_data.iter():
+            if len(shape) == max_nodes:
+                return None, None
+            text = elem.text
+            if text is not None and text.strip():
+                values.append(text)
+                text = True
+            shape.append((elem.tag, tuple(elem.items()), len(elem), text))
+        return tuple(shape), values
+
+    def _compile(self, netconf_data, translate):
+        # Translate a copy where every value is replaced by its placeholder
+        placeholders = copy.deepcopy(netconf_data)
+        elements = []
+        index = 0
+        for elem in placeholders.iter():
+            elements.append(elem)
+            if self._is_value(elem.text):
+                elem.text = PLACEHOLDER.format(index)
+                index += 1
+
+        return self._builder(translate(placeholders), elements)
+
+    def _builder(self, obj, elements):
+        """Returns a function building obj from the values and root element of a request"""
+        if isinstance(obj, str):
+            parts = PLACEHOLDER_RE.split(obj)
+            if len(parts) == 1:
+                return lambda values, root: obj
+            if len(parts) == 3 and not parts[0] and not parts[2]:
+                index = int(parts[1])
+                return lambda values, root: values[index]
+
+            def build_text(values, unused_root):
+                text = list(parts)
+                for i in range(1, len(parts), 2):
+                    text[i] = values[int(parts[i])]
+                return "".join(text)
+            return build_text
+
+        elif isinstance(obj, dict):
+            builders = [(self._builder(k, elements), self._builder(v, elements))
+                        for k, v in obj.items()]
+            return lambda values, root: dict((k(values, root), v(values, root))
+                                             for k, v in builders)
+
+        elif isinstance(obj, (list, tuple)):
+            kind = type(obj)
+            builders = [self._builder(x, elements) for x in obj]
+            return lambda values, root: kind([x(values, root) for x in builders])
+
+        elif etree.iselement(obj):
+            # Elements of the request are referenced by document order position
+            position = elements.index(obj)
+            return lambda values, root: next(itertools.islice(root.iter(), position, None))
+
+        return lambda values, root: obj
+
+    def translate(self, netconf_data, translate):
+        shape, values = self._shape(netconf_data, self._max_nodes)
+        if shape is None:
+            with self._lock:
+                self._stats['too-large'] += 1
+            return translate(netconf_data)
+
+        with self._lock:
+            plan = self._plans.get(shape)
+            if plan is not None:
+                self._plans.move_to_end(shape)
+                self._stats['hits'] += 1
+            else:
+                self._stats['misses'] += 1
+
+        if plan is None:
+            plan = self._compile(netconf_data, translate)
+            with self._lock:
+                self._plans[shape] = plan
+                while len(self._plans) > self._max_plans:
+                    self._plans.popitem(last=False)
+                    self._stats['evictions'] += 1
+            logger.debug("New translation plan compiled, %d plans cached", len(self._plans))
+
+        return plan(values, netconf_data)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['plans'] = len(self._plans)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit-rate'] = float(stats['hits']) / lookups if lookups else 0.0
+        return stats
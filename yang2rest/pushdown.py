@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Pushes Netconf subtree filters (RFC6241 6.2.5) down to FortiGate.
+#
+# Selection nodes (empty leaves) of a get/get-config filter become
+# the 'format' parameter of the REST call, so only those attributes
+# are returned. Content match nodes (leaves with a value) become
+# 'filter' parameters, so only matching entries are returned. FortiOS
+# compares them ignoring case, so they are checked again locally.
+#
+# Containment nodes, and any filter on monitor urls, cannot be
+# expressed in REST parameters. Those are applied locally to the
+# converted answer using the netconf.util filter helpers. With
+# local, e.g. for tables answered from the mirror, the whole filter
+# is applied locally.
+#
+#************************************************
+"""
+
+import copy
+import logging
+
+from netconf import util
+
+from yang2rest.yang2restconverter import YangUtil
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Tag used by Json2Yang for each entry of a JSON list
+ENTRY_TAG = 'element'
+
+
+def _filter_children(filter_nodes, data_nodes):
+    """Applies a list of sibling filter nodes to a list of sibling data nodes
+
+    Returns the list of (copied) data nodes selected, or None if a content
+    match node is not satisfied and so the parent must not be returned.
+    """
+    matches = []
+    selections = []
+    containments = []
+    for fnode in filter_nodes:
+        if len(fnode):
+            containments.append(fnode)
+        elif util.is_selection_node(fnode):
+            selections.append(fnode)
+        else:
+            matches.append(fnode)
+
+    for fnode in matches:
+        if not any(util.filter_node_match(fnode, dnode) for dnode in data_nodes):
+            return None
+
+    if not selections and not containments:
+        return [copy.deepcopy(x) for x in data_nodes]
+
+    selected = []
+    for dnode in data_nodes:
+        if any(util.filter_tag_match(fnode.tag, dnode.tag) for fnode in matches + selections):
+            selected.append(copy.deepcopy(dnode))
+            continue
+
+        for fnode in containments:
+            if not util.filter_tag_match(fnode.tag, dnode.tag):
+                continue
+            children = _filter_children(fnode, dnode)
+            if children:
+                node = copy.copy(dnode)
+                for child in list(node):
+                    node.remove(child)
+                node.extend(children)
+                selected.append(node)
+                break
+
+    return selected
+
+
+def _local_copy(fnode):
+    """Copy of a filter node with the namespaces removed from its tags
+
+    Filters inherit the namespace of the rpc, the converted REST answers
+    have none.
+    """
+    node = copy.deepcopy(fnode)
+    for elem in node.iter():
+        if isinstance(elem.tag, str):
+            elem.tag = YangUtil.local_name(elem.tag)
+    return node
+
+
+class FilterPushDown(object):
+
+    def __init__(self, selection, url, local=False):
+        self._selection = selection
+        self._url = url
+
+        self.parameters = None
+        self.needs_local_filter = False
+
+        if selection is None:
+            return
+
+        # The mkey child is already part of the url
+        mkey = selection.get('mkey')
+        self._filter_nodes = [x for x in selection
+                              if not (mkey and YangUtil.local_name(x.tag) == mkey)]
+        if not self._filter_nodes:
+            return
+
+        if local or not url.startswith('cmdb/'):
+            self.needs_local_filter = True
+            self._filter_nodes = [_local_copy(x) for x in self._filter_nodes]
+            return
+
+        fields = []
+        filters = []
+        select_fields = False
+        for fnode in self._filter_nodes:
+            field = YangUtil.local_name(fnode.tag)
+            fields.append(field)
+            if len(fnode):
+                # Containment node, get the whole attribute and filter locally
+                self.needs_local_filter = True
+                select_fields = True
+            elif util.is_selection_node(fnode):
+                select_fields = True
+            else:
+                value = fnode.text.strip().replace('\\', '\\\\').replace(',', '\\,')
+                filters.append(field + '==' + value)
+                # FortiOS == is case-insensitive, the exact value is matched locally
+                self.needs_local_filter = True
+
+        parameters = {}
+        if select_fields:
+            parameters['format'] = '|'.join(fields)
+        if filters:
+            parameters['filter'] = filters
+        if parameters:
+            self.parameters = parameters
+        if self.needs_local_filter:
+            self._filter_nodes = [_local_copy(x) for x in self._filter_nodes]
+
+    @property
+    def key(self):
+        """Hashable form of the parameters, None when there are none"""
+        if not self.parameters:
+            return None
+        return tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                            for k, v in self.parameters.items()))
+
+    def filter_locally(self, nodes):
+        """Applies to the converted REST answer what could not be pushed down"""
+        if not self.needs_local_filter or not isinstance(nodes, list):
+            return nodes
+
+        if all(x.tag == ENTRY_TAG for x in nodes):
+            result = []
+            for entry in nodes:
+                children = _filter_children(self._filter_nodes, list(entry))
+                if children is None:
+                    continue
+                node = copy.copy(entry)
+                for child in list(node):
+                    node.remove(child)
+                node.extend(children)
+                result.append(node)
+            return result
+
+        # Single object answer (e.g. monitor), attributes are not wrapped in an entry
+        result = _filter_children(self._filter_nodes, nodes)
+        return result if result is not None else []
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Cache of REST answers coming from FortiGate.
+#
+# Entries are keyed by the REST url (e.g. cmdb/firewall/address)
+# and expire after a TTL configured per url prefix. The cache is
+# bounded in size and evicts least recently used entries first.
+#
+# Any modification done on an url invalidates the cached answers
+# for that url, its ancestors and its descendants. Reads in flight
+# meanwhile may have the answer from before the modification, so
+# they take the generation of the cache before calling FortiGate
+# and their answer is not stored if there was an invalidation since.
+#
+# Sizes of large tables are estimated from their first entries,
+# measuring every entry costs about as much as decoding the answer.
+#
+#************************************************
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# Entries of a table measured to estimate its size
+SIZE_SAMPLE = 16
+
+
+class _CacheEntry(object):
+
+    def __init__(self, url, value, size, expires):
+        self.url = url
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+class RestResponseCache(object):
+
+    def __init__(self, ttls, max_bytes=64 * 1024 * 1024):
+        # ttls maps url prefixes to seconds, longest prefix wins.
+        # Urls not matching any prefix are not cached.
+        self._ttls = sorted(ttls.items(), key=lambda x: len(x[0]), reverse=True)
+        self._max_bytes = max_bytes
+
+        self._entries = OrderedDict()
+        self._keys_by_url = {}
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+        self._stats = {'hits': 0,
+                       'misses': 0,
+                       'evictions': 0,
+                       'expirations': 0,
+                       'invalidations': 0,
+                       'stale-puts': 0}
+
+    def ttl(self, url):
+        for prefix, ttl in self._ttls:
+            if url.startswith(prefix):
+                return ttl
+        return 0
+
+    @staticmethod
+    def _size(value):
+        if isinstance(value, (list, tuple)) and len(value) > SIZE_SAMPLE:
+            sample = json.dumps(value[:SIZE_SAMPLE], separators=(',', ':'), default=str)
+            return len(sample) * len(value) // SIZE_SAMPLE
+        if isinstance(value, tuple):
+            # (http status, answer) as stored by RestCaller
+            return sum(RestResponseCache._size(x) for x in value)
+        return len(json.dumps(value, separators=(',', ':'), default=str))
+
+    @staticmethod
+    def _ancestors(url):
+        splitted_url = url.split('/')
+        return ['/'.join(splitted_url[:i]) for i in range(len(splitted_url) - 1, 0, -1)]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._keys_by_url[entry.url]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_url[entry.url]
+
+    def get(self, url, key=None):
+        key = (url, key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry.expires < time.time():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry.value
+
+    def generation(self):
+        """Token to give to put, taken before reading value from FortiGate"""
+        with self._lock:
+            return self._generation
+
+    def put(self, url, value, key=None, generation=None):
+        ttl = self.ttl(url)
+        if ttl <= 0:
+            return
+        size = self._size(value)
+        if size > self._max_bytes:
+            return
+
+        key = (url, key)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                # Invalidated while it was read, it may be older than the modification
+                self._stats['stale-puts'] += 1
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _CacheEntry(url, value, size, time.time() + ttl)
+            self._keys_by_url.setdefault(url, set()).add(key)
+            self._bytes += size
+
+            while self._bytes > self._max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, url):
+        url = url.rstrip('/')
+        urls = [url] + self._ancestors(url)
+        with self._lock:
+            self._generation += 1
+            descendant_prefix = url + '/'
+            urls.extend(x for x in self._keys_by_url if x.startswith(descendant_prefix))
+            for cached_url in urls:
+                for key in list(self._keys_by_url.get(cached_url, ())):
+                    self._remove(key)
+                    self._stats['invalidations'] += 1
+        logger.debug("Cache invalidated for url: %s", url)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_url.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+            stats['max-bytes'] = self._max_bytes
+        return stats
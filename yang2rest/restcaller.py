@@ -27,6 +27,8 @@
 #************************************************
 """
 
+from yang2rest import scheduler
+
 __author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
 __copyright__ = "Copyright 2018, Fortinet, Inc."
 __credits__ = "Miguel Angel Muñoz"
@@ -41,6 +43,10 @@ class RestCaller():
 
     def __init__(self):
         self._fos = None
+        self._cache = None
+        self._coalescer = None
+        self._scheduler = None
+        self._priority_class = None
 
     @staticmethod
     def _map(operation, url):
@@ -60,9 +66,50 @@ class RestCaller():
 
         return op_map[operation]
 
+    @staticmethod
+    def _related(url, modified_url):
+        return url == modified_url or url.startswith(modified_url + '/') \
+            or modified_url.startswith(url + '/')
+
     def set_fos(self, fortiosapi):
         self._fos = fortiosapi
 
+    def set_cache(self, cache):
+        # Answers to get/monitor calls are served from cache when possible,
+        # successful modifications invalidate the affected urls.
+        self._cache = cache
+
+    def set_coalescer(self, coalescer):
+        # Identical get/monitor calls in flight at the same time share
+        # a single call towards FortiGate.
+        self._coalescer = coalescer
+
+    def set_scheduler(self, rest_scheduler):
+        # Calls towards FortiGate wait for their turn in the scheduler,
+        # by priority: reads, then modifications, then monitor polling.
+        self._scheduler = rest_scheduler
+
+    def set_priority(self, priority):
+        # Scheduler priority of every call, instead of the one of its operation
+        self._priority_class = priority
+
+    @staticmethod
+    def _priority(rest_op):
+        if rest_op == 'monitor':
+            return scheduler.BACKGROUND
+        if rest_op == 'get':
+            return scheduler.INTERACTIVE
+        return scheduler.BULK
+
+    def _call(self, rest_op, fos_method, *args, **kwargs):
+        if self._scheduler is None:
+            return fos_method(*args, **kwargs)
+        priority = self._priority_class
+        if priority is None:
+            priority = RestCaller._priority(rest_op)
+        with self._scheduler.slot(priority):
+            return fos_method(*args, **kwargs)
+
     def check_empty_values(self, content):
         # Due to a problem with FGT REST API causing segmentation fault,
         # it is required to modify empty tags in json before sending to FGT
@@ -74,7 +121,78 @@ class RestCaller():
                 content[key] = ""
         return content
 
-    def execute_rest_call(self, operation, url, content):
+    def _execute_read(self, rest_op, fos_method, url, path, name, parameters=None, key=None,
+                      generation=None):
+        if parameters:
+            result = self._call(rest_op, fos_method, path, name, parameters=parameters)
+        else:
+            result = self._call(rest_op, fos_method, path, name)
+
+        if 'results' in result:
+            http_result_or_status = result['results']
+        else:
+            http_result_or_status = result['status']
+
+        if 'http_status' in result:
+            http_status_or_status = result['http_status']
+        else:
+            http_status_or_status = result['status']
+
+        if self._cache is not None and http_status_or_status == 200:
+            self._cache.put(url, (http_status_or_status, http_result_or_status), key, generation)
+
+        return http_status_or_status, http_result_or_status
+
+    def _read(self, rest_op, url, parameters, key):
+        splitted_url = url.split('/')
+
+        path = '/'.join(splitted_url[1:-1])
+        name = splitted_url[-1]
+
+        fos_method = getattr(self._fos, rest_op)
+
+        generation = None
+        if self._cache is not None:
+            cached = self._cache.get(url, key)
+            if cached is not None:
+                return cached
+            generation = self._cache.generation()
+
+        if self._coalescer is not None:
+            return self._coalescer.do((rest_op, url, key), self._execute_read,
+                                      rest_op, fos_method, url, path, name, parameters, key,
+                                      generation)
+
+        return self._execute_read(rest_op, fos_method, url, path, name, parameters, key, generation)
+
+    def iter_rest_pages(self, url, page_size, pushdown=None):
+        # Reads a table in pages of page_size entries (FortiOS start/count
+        # parameters), yielding (http_status, results) per page. Stops after
+        # an error, a non list answer or a page shorter than page_size.
+        rest_op = RestCaller._map(None, url)
+
+        parameters = {}
+        key = ()
+        if pushdown is not None and pushdown.parameters:
+            parameters.update(pushdown.parameters)
+            key = pushdown.key
+
+        start = 0
+        while True:
+            parameters['start'] = start
+            parameters['count'] = page_size
+            http_result, http_content = self._read(rest_op, url, dict(parameters),
+                                                   key + (('start', start), ('count', page_size)))
+
+            yield http_result, http_content
+
+            if http_result != 200 or not isinstance(http_content, list) \
+                    or len(http_content) < page_size:
+                return
+            start += page_size
+
+    def execute_rest_call(self, operation, url, content, pushdown=None):
+        # pushdown (FilterPushDown) adds the REST parameters of a get filter
         rest_op = RestCaller._map(operation, url)
 
         splitted_url = url.split('/')
@@ -87,27 +205,28 @@ class RestCaller():
         content = self.check_empty_values(content)
 
         if rest_op=='get' or rest_op=='monitor':
+            parameters = None
+            key = None
+            if pushdown is not None:
+                parameters = pushdown.parameters
+                key = pushdown.key
 
-            result = fos_method(path, name)
+            return self._read(rest_op, url, parameters, key)
 
+        else:
+            result = self._call(rest_op, fos_method, path, name, data=content, vdom='root')
             if 'results' in result:
                 http_result_or_status = result['results']
             else:
                 http_result_or_status = result['status']
 
-            if 'http_status' in result:
-                http_status_or_status = result['http_status']
-            else:
-                http_status_or_status = result['status']
-
-            return http_status_or_status, http_result_or_status
+            if self._cache is not None and result['http_status'] == 200:
+                self._cache.invalidate(url)
+            if self._coalescer is not None and result['http_status'] == 200:
+                # Reads of the object, its ancestors or descendants
+                modified_url = url.rstrip('/')
+                self._coalescer.detach(lambda key: RestCaller._related(key[1], modified_url))
 
-        else:
-            result = fos_method(path, name, data=content, vdom='root')
-            if 'results' in result:
-                http_result_or_status = result['results']
-            else:
-                http_result_or_status = result['status']
             return result['http_status'], http_result_or_status
 
 
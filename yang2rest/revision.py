@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Change detection of the configuration of one FortiGate.
+#
+# Reading a whole table again only to find it did not change costs
+# FortiGate far more than a single monitor call. The probe asks a
+# cheap monitor endpoint (by default the HA configuration checksums,
+# answered by standalone units too) and reduces its answer to a
+# revision: the configuration did not change while the revision is
+# the same. The answer is reused for min_interval seconds, so all
+# the tables revalidated together cost a single call.
+#
+# Payload hashes tell whether a table read again is the same as
+# before, so its previous answer (and conversion) can be kept.
+#
+#************************************************
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+DEFAULT_REVISION_URL = "monitor/system/ha-checksums"
+
+
+def payload_hash(content):
+    """Hash of a decoded REST answer"""
+    return hashlib.sha1(json.dumps(content, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class RevisionProbe(object):
+
+    def __init__(self, rest_caller, url=DEFAULT_REVISION_URL, min_interval=1):
+        # rest_caller() returns a RestCaller towards the FortiGate
+        self._rest_caller = rest_caller
+        self._url = url
+        self._min_interval = min_interval
+
+        self._revision = None
+        self._checked = None
+        self._failing = False
+        self._lock = threading.Lock()
+        self._stats = {'probes': 0,
+                       'probe-errors': 0,
+                       'changes': 0}
+
+    def _probe(self):
+        rc = self._rest_caller()
+        # Never answered from the response cache
+        rc.set_cache(None)
+        try:
+            http_result, http_content = rc.execute_rest_call(None, self._url, {})
+        except Exception as error:  # pylint: disable=W0703
+            http_result, http_content = None, str(error)
+        if http_result != 200:
+            self._stats['probe-errors'] += 1
+            # Logged once, the endpoint may be missing in this FortiOS version
+            log = logger.debug if self._failing else logger.warning
+            log("Revision probe %s failed, tables will be read again: %s", self._url, str(http_content))
+            self._failing = True
+            return None
+        self._failing = False
+        return payload_hash(http_content)
+
+    def revision(self):
+        """Current revision of the configuration, None if unknown"""
+        return self.checked_revision()[0]
+
+    def checked_revision(self):
+        """Current revision and the time it was probed at
+
+        The answer of a probe is reused for min_interval seconds, the
+        configuration is only known to have that revision at that time.
+        """
+        with self._lock:
+            now = time.time()
+            if self._checked is None or now - self._checked >= self._min_interval:
+                self._stats['probes'] += 1
+                revision = self._probe()
+                if revision is not None and self._revision is not None and revision != self._revision:
+                    self._stats['changes'] += 1
+                self._revision = revision
+                self._checked = now
+            return self._revision, self._checked
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['url'] = self._url
+        return stats
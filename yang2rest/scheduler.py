@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Scheduler of the REST calls sent to one FortiGate.
+#
+# The FortiGate REST daemon degrades badly with many parallel
+# requests. At most max_inflight calls are sent at once and, if a
+# rate is given, a token bucket bounds the calls per second (with
+# bursts of up to burst calls).
+#
+# Waiting calls are served by priority class, then in arrival
+# order: interactive reads go before bulk modifications, which go
+# before background monitor polling. Lower classes only run when
+# no higher class call is waiting.
+#
+#************************************************
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = {INTERACTIVE: 'interactive',
+                  BULK: 'bulk',
+                  BACKGROUND: 'background'}
+
+
+class TokenBucket(object):
+    # Not thread safe, used under the scheduler lock
+
+    def __init__(self, rate, burst=None):
+        self._rate = float(rate)
+        self._burst = float(burst if burst else max(1, rate))
+        self._tokens = self._burst
+        self._last = time.time()
+
+    def take(self):
+        # Takes a token and returns 0, or returns the seconds
+        # until one is available.
+        now = time.time()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self._rate
+
+
+class RestScheduler(object):
+
+    def __init__(self, max_inflight=4, rate=None, burst=None):
+        self._max_inflight = max_inflight
+        self._bucket = TokenBucket(rate, burst) if rate else None
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._inflight = 0
+        self._cv = threading.Condition()
+
+        self._stats = {'throttled': 0}
+        self._class_stats = dict((x, {'calls': 0,
+                                      'queued': 0,
+                                      'max-queued': 0,
+                                      'wait-total': 0.0,
+                                      'wait-max': 0.0}) for x in PRIORITY_NAMES)
+
+    def acquire(self, priority=INTERACTIVE):
+        start = time.time()
+        entry = (priority, next(self._sequence))
+        stats = self._class_stats[priority]
+        with self._cv:
+            heapq.heappush(self._queue, entry)
+            stats['queued'] += 1
+            stats['max-queued'] = max(stats['max-queued'], stats['queued'])
+            throttled = False
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == entry and self._inflight < self._max_inflight:
+                        timeout = self._bucket.take() if self._bucket is not None else 0
+                        if not timeout:
+                            break
+                        if not throttled:
+                            throttled = True
+                            self._stats['throttled'] += 1
+                    self._cv.wait(timeout)
+            except BaseException:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                stats['queued'] -= 1
+                self._cv.notify_all()
+                raise
+
+            heapq.heappop(self._queue)
+            stats['queued'] -= 1
+            self._inflight += 1
+
+            waited = time.time() - start
+            stats['calls'] += 1
+            stats['wait-total'] += waited
+            stats['wait-max'] = max(stats['wait-max'], waited)
+
+            # The next one in the queue may be able to go too
+            self._cv.notify_all()
+
+    def release(self):
+        with self._cv:
+            self._inflight -= 1
+            self._cv.notify_all()
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cv:
+            stats = dict(self._stats)
+            stats['inflight'] = self._inflight
+            stats['max-inflight'] = self._max_inflight
+            for priority, name in PRIORITY_NAMES.items():
+                class_stats = dict(self._class_stats[priority])
+                calls = class_stats['calls']
+                class_stats['wait-average'] = class_stats['wait-total'] / calls if calls else 0.0
+                stats[name] = class_stats
+        return stats
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# On disk snapshot of the config mirror of one FortiGate.
+#
+# Lets a restarted gateway answer from the mirror straight away
+# instead of reading every table again from FortiGate. The file is
+#
+#   magic (8 bytes) | header length (4 bytes, big endian) | header | tables
+#
+# where the header is json with the format version, the device and
+# the position and configuration revision of every table, each one
+# a compact json document.
+# The file is memory mapped when loaded and a table is only decoded
+# the first time it is requested.
+#
+# Snapshots of another format version, another FortiGate (host) or
+# older than max_age seconds are ignored. They are written to a
+# temporary file renamed over the previous one, so a reader never
+# sees a partial snapshot.
+#
+#************************************************
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+MAGIC = b"FGTMIRR\n"
+FORMAT_VERSION = 2
+_LENGTH = struct.Struct(">I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _decoder(data, start, end):
+    return lambda: json.loads(data[start:end])
+
+
+class MirrorSnapshot(object):
+
+    def __init__(self, path, device, host):
+        self.path = path
+        self.device = device
+        self.host = host
+
+    def __str__(self):
+        return "MirrorSnapshot({}, {})".format(self.device, self.path)
+
+    def write(self, tables):
+        """Writes the tables, a list of (url, loaded, revision, entries)"""
+        index = {}
+        blobs = []
+        offset = 0
+        for url, loaded, revision, entries in tables:
+            blob = json.dumps(entries, separators=(',', ':')).encode('utf-8')
+            index[url] = [offset, len(blob), loaded, revision]
+            blobs.append(blob)
+            offset += len(blob)
+
+        header = json.dumps({'version': FORMAT_VERSION,
+                             'device': self.device,
+                             'host': self.host,
+                             'written': time.time(),
+                             'tables': index}, separators=(',', ':')).encode('utf-8')
+
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(_LENGTH.pack(len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.rename(temporary, self.path)
+        logger.debug("%s: Written, %d tables, %d bytes", str(self), len(index), offset + len(header))
+
+    def _read_header(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise SnapshotError("not a mirror snapshot")
+        start = len(MAGIC) + _LENGTH.size
+        (length,) = _LENGTH.unpack(data[len(MAGIC):start])
+        header = json.loads(data[start:start + length])
+        if header.get('version') != FORMAT_VERSION:
+            raise SnapshotError("format version " + str(header.get('version')))
+        if header.get('device') != self.device or header.get('host') != self.host:
+            raise SnapshotError("snapshot of another FortiGate")
+        return header, start + length
+
+    def load(self, max_age=None):
+        """Returns a list of (url, loaded, revision, decode), decode() returning the entries
+
+        An empty list when there is no usable snapshot.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as error:
+            # ValueError: empty file
+            logger.info("%s: Not loaded: %s", str(self), str(error))
+            return []
+
+        try:
+            header, body = self._read_header(data)
+        except (SnapshotError, ValueError, struct.error) as error:
+            logger.warning("%s: Ignored: %s", str(self), str(error))
+            data.close()
+            return []
+
+        if max_age is not None and time.time() - header['written'] > max_age:
+            logger.info("%s: Ignored, older than %d seconds", str(self), max_age)
+            data.close()
+            return []
+
+        tables = []
+        for url, (offset, length, loaded, revision) in header['tables'].items():
+            start = body + offset
+            if start + length > len(data):
+                logger.warning("%s: Ignored, truncated", str(self))
+                data.close()
+                return []
+            tables.append((url, loaded, revision, _decoder(data, start, start + length)))
+        logger.info("%s: Loaded, %d tables", str(self), len(tables))
+        return tables
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+#************************************************
+# Copyright 2018 Fortinet, Inc.
+#
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+#
+#************************************************
+# Author: "Miguel Angel Muñoz González" (magonzalez at fortinet.com)
+#
+# Replacement of whole tables with the calls that change them only.
+#
+# An edit-config may give all the entries of a table, as get-config
+# answers them:
+#
+#   <address nc:operation="replace" mkey="name">
+#     <element><name>a</name><subnet>...</subnet></element>
+#     ...
+#   </address>
+#
+# Instead of writing every entry, the entries are compared (by their
+# mkey, "name" by default) with the ones FortiGate has: missing ones
+# are created, entries with some attribute different are written
+# whole (replace) or with those attributes only (merge), and entries
+# not given are deleted (merge does not delete them). Attributes not
+# given are not compared. Lists (e.g. addrgrp member) are compared
+# entry by entry, in order, on the attributes given.
+#
+#************************************************
+"""
+
+import logging
+import threading
+
+from yang2rest.bulkedit import EditObject
+
+__author__ = "Miguel Angel Muñoz González (magonzalez at fortinet.com)"
+__copyright__ = "Copyright 2018, Fortinet, Inc."
+__credits__ = "Miguel Angel Muñoz"
+__license__ = "Apache 2.0"
+__version__ = "0.6"
+__maintainer__ = "Miguel Ángel Muñoz"
+__email__ = "magonzalez at fortinet.com"
+__status__ = "Development"
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+
+class TableDiffError(Exception):
+    pass
+
+
+def _text(value):
+    # Attributes are compared as the text they are sent as
+    if value is None:
+        return ""
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def _same(current, desired):
+    # desired as converted from Netconf (texts, lists and dicts of
+    # them), current as FortiGate answers it
+    if isinstance(desired, dict):
+        return isinstance(current, dict) and \
+            all(_same(current.get(k), v) for k, v in desired.items())
+    if isinstance(desired, list):
+        return isinstance(current, list) and len(current) == len(desired) and \
+            all(_same(c, d) for c, d in zip(current, desired))
+    if isinstance(current, (list, dict)):
+        # An empty element is an empty list
+        return not current and not _text(desired)
+    return _text(current) == _text(desired)
+
+
+def _changed(current, desired, mkey):
+    # Attributes of desired different in current, with the mkey
+    changed = {}
+    for attribute, value in desired.items():
+        if attribute == mkey:
+            continue
+        if not _same(current.get(attribute), value):
+            changed[attribute] = value
+    if changed:
+        changed[mkey] = desired[mkey]
+    return changed
+
+
+class TableDiff(object):
+
+    def __init__(self, obj, current):
+        # obj is the EditObject of the whole table (entries given),
+        # current the entries of the table in FortiGate
+        if obj.operation not in ('replace', 'merge'):
+            raise TableDiffError("Operation {} not supported on a whole table".format(obj.operation))
+        if not isinstance(current, list):
+            raise TableDiffError("{} is not a table".format(obj.url))
+        self.url = obj.url
+        self.mkey = obj.mkey
+
+        existing = {}
+        for entry in current:
+            existing[_text(entry.get(self.mkey))] = entry
+
+        self.creates = []
+        self.updates = []
+        self.deletes = []
+        self.unchanged = 0
+        given = set()
+        for desired in obj.entries:
+            key = _text(desired.get(self.mkey))
+            if not key:
+                raise TableDiffError("Entry without {} in {}".format(self.mkey, obj.path))
+            if key in given:
+                raise TableDiffError("Entry {} given twice in {}".format(key, obj.path))
+            given.add(key)
+
+            path = "{}[{}='{}']".format(obj.path, self.mkey, key)
+            entry = existing.get(key)
+            if entry is None:
+                self.creates.append(self._object('create', dict(desired), path, key))
+                continue
+            changed = _changed(entry, desired, self.mkey)
+            if changed and obj.operation == 'replace':
+                self.updates.append(self._object('replace', dict(desired), path, key))
+            elif changed:
+                self.updates.append(self._object('merge', changed, path, key))
+            else:
+                self.unchanged += 1
+
+        if obj.operation == 'replace':
+            for key in existing:
+                if key not in given:
+                    path = "{}[{}='{}']".format(obj.path, self.mkey, key)
+                    self.deletes.append(self._object('delete', {self.mkey: key}, path, key))
+
+    def _object(self, operation, content, path, key):
+        return EditObject.for_content(self.url, operation, content, path, self.mkey, key)
+
+    def objects(self):
+        """Objects to modify, deletes last"""
+        return self.creates + self.updates + self.deletes
+
+    def __len__(self):
+        return len(self.creates) + len(self.updates) + len(self.deletes)
+
+    def __str__(self):
+        return "TableDiff({}, {} creates, {} updates, {} deletes, {} unchanged)".format(
+            self.url, len(self.creates), len(self.updates), len(self.deletes), self.unchanged)
+
+
+class TableDiffStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'tables': 0,
+                       'entries': 0,
+                       'creates': 0,
+                       'updates': 0,
+                       'deletes': 0,
+                       'unchanged': 0}
+
+    def add(self, diff):
+        with self._lock:
+            self._stats['tables'] += 1
+            self._stats['creates'] += len(diff.creates)
+            self._stats['updates'] += len(diff.updates)
+            self._stats['deletes'] += len(diff.deletes)
+            self._stats['unchanged'] += diff.unchanged
+            self._stats['entries'] += len(diff.creates) + len(diff.updates) + diff.unchanged
+
+    def stats(self):
+        # Entries unchanged are the calls saved, compared to writing every entry
+        with self._lock:
+            stats = dict(self._stats)
+        stats['changes'] = stats['creates'] + stats['updates'] + stats['deletes']
+        return stats
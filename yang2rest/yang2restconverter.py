@@ -45,6 +45,10 @@ __status__ = "Development"
 
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 
+# Tags and attributes come from the clients, the memo is emptied when full
+MAX_LOCAL_NAMES = 4096
+_LOCAL_NAMES = {}
+
 
 class YangUtil:
 
@@ -85,6 +89,99 @@ class YangUtil:
 
         raise Exception("Error, mkey: '{0}' not found in data: {1}", format(mkey), format(netconf_data))
 
+    @staticmethod
+    def local_name(name):
+        # Same as remove_urn, memoized since the same tags and attributes
+        # are found over and over
+        local = _LOCAL_NAMES.get(name)
+        if local is None:
+            local = YangUtil.remove_urn(name)
+            if len(_LOCAL_NAMES) >= MAX_LOCAL_NAMES:
+                _LOCAL_NAMES.clear()
+            _LOCAL_NAMES[name] = local
+        return local
+
+    @staticmethod
+    def content_value(netconf_data):
+        """Value sent to FortiGate for a content element, as Json2Yang builds it back
+
+        A leaf is its text, an element whose children are all <element>
+        a list (e.g. addrgrp member, policy srcaddr) and any other element
+        with children a dict of them.
+        """
+        children = [x for x in netconf_data if isinstance(x.tag, str)]
+        if not children:
+            return netconf_data.text
+        local_name = YangUtil.local_name
+        if all(local_name(x.tag) == "element" for x in children):
+            return [YangUtil.content_value(x) for x in children]
+        return dict((local_name(x.tag), YangUtil.content_value(x)) for x in children)
+
+    @staticmethod
+    def walk(netconf_data, leaf_path=False):
+        """Extracts path, content, operation and selection in a single pass over the subtree
+
+        Path is built going down until a tag with 'operation' attribute is found,
+        that tag is the last one included in the path. Tags with mkey add the mkey
+        value to the path and navigation continues on their second child (mkey is
+        assumed to be in position 0), otherwise on their first child.
+        Content is every child of the tags with 'operation' attribute, children
+        with their own children are converted with content_value.
+
+        For requests without operation (get, get-config) navigation only continues
+        on children with mkey (child objects). The first tag whose next child has
+        no mkey ends the path, its children (other than the mkey one) are the
+        selection and content match nodes of the filter and it is returned
+        as selection. Otherwise selection is None.
+
+        With leaf_path (monitor urls, whose depth varies) a chain of single
+        children is all path, only a tag with several children ends it.
+        """
+        local_name = YangUtil.local_name
+        path = ""
+        content = {}
+        operation = None
+
+        selection = None
+        selection_path = None
+
+        # Next element of the path, found later in document order than its parent
+        path_elem = netconf_data
+
+        for elem in netconf_data.iter():
+            elem_operation = None
+            for attrib in elem.keys():
+                if local_name(attrib) == "operation":
+                    elem_operation = elem.get(attrib)
+                    break
+
+            if elem_operation is not None:
+                if operation is None:
+                    operation = elem_operation
+                for avp in elem:
+                    content[local_name(avp.tag)] = avp.text if not len(avp) else YangUtil.content_value(avp)
+
+            if elem is path_elem:
+                path += "/" + local_name(elem.tag)
+                if elem_operation is not None:
+                    path_elem = None
+                elif YangUtil.contains_mkey(elem):
+                    path += "/" + YangUtil.extract_mkey(elem)
+                    path_elem = elem[1] if len(elem) > 1 else None
+                else:
+                    path_elem = elem[0] if len(elem) > 0 else None
+
+                if selection is None and path_elem is not None \
+                        and not YangUtil.contains_mkey(path_elem) \
+                        and (not leaf_path or len(elem) > 1):
+                    selection = elem
+                    selection_path = path
+
+        if operation is not None or selection is None:
+            return path, content, operation, None
+
+        return selection_path, content, operation, selection
+
     @staticmethod
     def extract_content_under_operation(netconf_data):
         # Algorithm to extract data will be: Get every content inside the tag
@@ -96,79 +193,58 @@ class YangUtil:
             for attrib in elem.attrib:
                 if YangUtil.remove_urn(attrib) == "operation":
                     for avp in elem:
-                        content[YangUtil.remove_urn(avp.tag)] = avp.text
+                        content[YangUtil.remove_urn(avp.tag)] = YangUtil.content_value(avp)
         return content
 
 
 class Yang2RestConverter(object):
 
-    def _extract_path_until_final_resource(self, netconf_data, add_deepest_key=False):
-        # Algorithm to calculate the rest of the path consists on going down until
-        # a tag with 'operation' attribute is found. That tag will
-        # be the last one to be included in the final url
-        path = ""
-        while not YangUtil.contains_operation(netconf_data):
-            path += "/" + YangUtil.remove_urn(netconf_data.tag)
-            if YangUtil.contains_mkey(netconf_data):
-                path += "/" + YangUtil.extract_mkey(netconf_data)
-                if len(netconf_data)>1:
-                    # In order to continue navigation down in the yang model,
-                    # it is assumed that the mkey is in position 0 and the next
-                    # tag in position 1
-                    netconf_data = netconf_data[1]
-                else:
-                    break
-            else:
-                if len(netconf_data)>0:
-                    netconf_data = netconf_data[0]
-                else:
-                    break
-
-        if YangUtil.contains_operation(netconf_data):
-            path += "/" + YangUtil.remove_urn(netconf_data.tag)
-            return path
-        else:
-            return path
+    def __init__(self, plan_cache=None):
+        # Optional TranslationPlanCache shared between converters
+        self._plan_cache = plan_cache
 
-    def _extract_name_content_operation(self, netconf_data):
+    def _extract_name_content_operation(self, netconf_data, leaf_path=False):
 
         name = YangUtil.remove_urn(netconf_data.tag)
         logger.debug("Name: %s", name)
 
-        operation = None
-        try:
-            operation = YangUtil.extract_operation(netconf_data)
-            logger.debug("Operation: %s", operation)
-        except Exception:
-            logger.debug("Operation not found, is this a 'get'?")
-
-        is_a_modification = operation == "delete" or operation == "replace" or operation=="merge"
-
-        remaining_path = self._extract_path_until_final_resource(netconf_data,
-                                                                 add_deepest_key=is_a_modification)
+        (remaining_path, content, operation, selection) = YangUtil.walk(netconf_data, leaf_path)
+        logger.debug("Operation: %s", operation)
         logger.debug("Remaining path: %s", remaining_path)
-
-        content = YangUtil.extract_content_under_operation(netconf_data)
         logger.debug("Content: %s", content)
 
-        return remaining_path, content, operation
+        return remaining_path, content, operation, selection
 
-    def _extract_path_content_operation(self, netconf_data):
+    def _extract_path_content_operation(self, netconf_data, leaf_path=False):
         path = YangUtil.remove_urn(netconf_data.tag)
         logger.debug("Path: %s", path)
 
-        (name, content, operation) = self._extract_name_content_operation(netconf_data[0])
+        (name, content, operation, selection) = \
+            self._extract_name_content_operation(netconf_data[0], leaf_path)
 
-        return path + name, content, operation
+        return path + name, content, operation, selection
 
     def extract_url_content_operation(self, netconf_data):
+        (url, content, operation, unused_selection) = \
+            self.extract_url_content_operation_selection(netconf_data)
+        return url, content, operation
+
+    def extract_url_content_operation_selection(self, netconf_data):
+        # Same as extract_url_content_operation, adding the element whose
+        # children select or match what a get/get-config returns (or None)
+        if self._plan_cache is not None:
+            return self._plan_cache.translate(netconf_data, self._extract_url_content_operation)
+        return self._extract_url_content_operation(netconf_data)
+
+    def _extract_url_content_operation(self, netconf_data):
         api_type = YangUtil.remove_urn(netconf_data.tag)
 
         logger.debug("Api Type: %s", api_type)
 
         if api_type == "cmdb" or api_type == "monitor":
-            (path, content, operation) = self._extract_path_content_operation(netconf_data[0])
+            (path, content, operation, selection) = \
+                self._extract_path_content_operation(netconf_data[0], api_type == "monitor")
         else:
             raise Exception("Main tag is not cmdb or monitor. Cannot continue.")
 
-        return api_type + "/" + path, content, operation
+        return api_type + "/" + path, content, operation, selection